@@ -1,18 +1,27 @@
 import os
+import hmac
+import hashlib
+import functools
 import mimetypes
-import copy
 import json
 from pathlib import Path
 import numpy as np
 from flask_cors import CORS
-from flask import Flask, request, jsonify, send_file, abort
+from flask import Flask, request, jsonify, send_file, abort, make_response
 from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from utils.parse_frontend import parse_data
+from utils.id_bitmap import IdBitmap
 from utils.faiss_processing import MyFaiss
+from utils.data_manifest import load_manifest, check_manifest
 from utils.context_encoding import VisualEncoding
 from utils.semantic_embed.tag_retrieval import tag_retrieval
-from utils.combine_utils import merge_searching_results_by_addition
-from utils.search_utils import group_result_by_video, search_by_filter
+from utils.search_utils import group_result_by_video, group_sequences, search_by_filter
+from utils.temporal_search import ShotTimeline, parse_gaps
+from utils.thumbnail_cache import ThumbnailCache, snap_size
+from utils.media_catalog import MediaCatalog
+from utils.scene_index import SceneIndex
+from utils.fast_json import FastJSONProvider, compress_response
+from utils.result_cache import ResultCache, request_key
 from flask import request, has_request_context
 # ================= Helpers =================
 
@@ -31,6 +40,71 @@ BASE_VIDEO_DIR = Path(os.environ.get(
 # Base URL backend (để trả URL tuyệt đối cho <img src>)
 BACKEND_BASE = os.environ.get("BACKEND_BASE_URL", "http://localhost:5001")
 
+# FAISS_MMAP=1: load index qua mmap read-only -> nhiều worker trên cùng host dùng chung page cache
+FAISS_MMAP = os.environ.get("FAISS_MMAP", "0") == "1"
+
+# Cache text embedding: số entry tối đa + file lưu (rỗng = chỉ giữ trong RAM)
+EMBED_CACHE_SIZE = int(os.environ.get("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH") or None
+
+# Số luồng tối đa cho nhánh clip / clipv2 chạy song song ở mode 'both'
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", "4"))
+
+# Tập con <= EXACT_SEARCH_THRESHOLD id: chấm điểm trực tiếp trên ma trận embedding (float32 | float16 | none);
+# chỉ dùng khi đã có vector chưa nén (IndexFlat / file re-rank), index nén / ANN luôn đi đường selector của FAISS
+EXACT_SEARCH_DTYPE = os.environ.get("EXACT_SEARCH_DTYPE", "float32")
+EXACT_SEARCH_DTYPE = None if EXACT_SEARCH_DTYPE.lower() == "none" else EXACT_SEARCH_DTYPE
+EXACT_SEARCH_THRESHOLD = int(os.environ.get("EXACT_SEARCH_THRESHOLD", "20000"))
+# Chế độ ngưỡng (min_score): số kết quả tối đa mỗi query dù còn nhiều keyframe vượt ngưỡng
+RANGE_SEARCH_MAX_RESULTS = int(os.environ.get("RANGE_SEARCH_MAX_RESULTS", "2000"))
+# Model CLIP / engine bật trên node này (vd. ENABLED_MODELS=clipv2 cho node chỉ phục vụ clipv2)
+ENABLED_MODELS = [m.strip() for m in os.environ.get("ENABLED_MODELS", "clip,clipv2").split(",") if m.strip()]
+ENABLED_ENGINES = [e.strip() for e in os.environ.get("ENABLED_ENGINES", "object,ocr,asr").split(",") if e.strip()]
+# eager | background | lazy: mặc định eager (nạp hết trước khi nhận request, như trước);
+# background: app nhận request ngay, model nạp dần trong luồng nền -- request cần model chưa nạp xong sẽ chờ
+MODEL_PRELOAD = os.environ.get("MODEL_PRELOAD", "eager")
+# Text encoder cho node CPU: torch (eager) | onnx | torchscript (export bằng `python -m utils.export_text_encoder`)
+TEXT_ENCODER_BACKEND = os.environ.get("TEXT_ENCODER_BACKEND", "torch")
+TEXT_ENCODER_EXT = ".pt" if TEXT_ENCODER_BACKEND == "torchscript" else ".onnx"
+TEXT_ENCODER_PATHS = {
+    'clip': os.environ.get("TEXT_ENCODER_CLIP", f"dict/text_encoders/clip_text.int8{TEXT_ENCODER_EXT}"),
+    'clipv2': os.environ.get("TEXT_ENCODER_CLIPV2", f"dict/text_encoders/clipv2_text.int8{TEXT_ENCODER_EXT}"),
+}
+TEXT_ENCODER_THREADS = int(os.environ.get("TEXT_ENCODER_THREADS", "0"))
+# Manifest dữ liệu (`python -m utils.data_manifest --write` / `utils.append_videos`): kiểm tra lúc khởi động
+# MANIFEST_CHECK: off | size (size + số dòng) | checksums (thêm sha256, chậm); MANIFEST_STRICT=1: lệch thì không chạy
+DATA_MANIFEST_PATH = os.environ.get("DATA_MANIFEST_PATH", "dict/manifest.json")
+MANIFEST_CHECK = os.environ.get("MANIFEST_CHECK", "size")
+MANIFEST_STRICT = os.environ.get("MANIFEST_STRICT", "0") == "1"
+# /video: Cache-Control max-age (giây); VIDEO_X_SENDFILE=1 -> send_file chỉ trả header X-Sendfile, web server phía trước gửi file
+VIDEO_MAX_AGE = int(os.environ.get("VIDEO_MAX_AGE", "86400"))
+VIDEO_X_SENDFILE = os.environ.get("VIDEO_X_SENDFILE", "0") == "1"
+# /keyframe: Cache-Control max-age (giây); ảnh thu nhỏ WebP (?size=) cache trên đĩa (giới hạn MB) + RAM (số ảnh)
+KEYFRAME_MAX_AGE = int(os.environ.get("KEYFRAME_MAX_AGE", "604800"))
+THUMB_CACHE_DIR = os.environ.get("THUMB_CACHE_DIR", "dict/thumbnails")
+THUMB_CACHE_MB = int(os.environ.get("THUMB_CACHE_MB", "2048"))
+THUMB_MEMORY_ITEMS = int(os.environ.get("THUMB_MEMORY_ITEMS", "512"))
+THUMB_QUALITY = int(os.environ.get("THUMB_QUALITY", "80"))
+# Kích thước ảnh trong danh sách kết quả (0 = ảnh gốc)
+RESULT_THUMB_SIZE = int(os.environ.get("RESULT_THUMB_SIZE", "320"))
+# Catalog video / keyframe dựng một lần rồi lưu (`python -m utils.media_catalog` hoặc POST /mediacatalog/refresh)
+MEDIA_CATALOG_PATH = os.environ.get("MEDIA_CATALOG_PATH", "dict/media_catalog.json.gz")
+MEDIA_PROBE = os.environ.get("MEDIA_PROBE", "1") == "1"     # đọc fps / duration bằng OpenCV khi dựng catalog
+# Worker kiểm tra file catalog (worker khác vừa refresh) mỗi N giây; POST /mediacatalog/refresh cách nhau tối thiểu N giây
+MEDIA_CHECK_INTERVAL = float(os.environ.get("MEDIA_CHECK_INTERVAL", "5"))
+MEDIA_REFRESH_MIN_INTERVAL = float(os.environ.get("MEDIA_REFRESH_MIN_INTERVAL", "60"))
+# Endpoint quản trị (refresh catalog, xoá cache): header X-Admin-Token; để trống -> chỉ nhận request từ localhost
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+# Nén response JSON >= RESPONSE_COMPRESS_MIN_BYTES theo Accept-Encoding (br nếu cài brotli, không thì gzip); 0 = tắt
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", "8192"))
+RESPONSE_COMPRESS_LEVEL = int(os.environ.get("RESPONSE_COMPRESS_LEVEL", "5"))
+# Cache kết quả search theo request đã chuẩn hoá (bytes JSON): số entry (0 = chỉ gộp request trùng đang chạy), TTL giây, MB
+RESULT_CACHE_ITEMS = int(os.environ.get("RESULT_CACHE_ITEMS", "512"))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "300"))
+RESULT_CACHE_MB = int(os.environ.get("RESULT_CACHE_MB", "256"))
+# File "thế hệ" dùng chung: POST /resultcache/clear ghi lại file -> mọi worker bỏ cache cũ
+RESULT_CACHE_GENERATION_PATH = os.environ.get("RESULT_CACHE_GENERATION_PATH", "dict/result_cache.generation")
+
 def _parse_keyframe_path(img_path: str):
     """Trả về (data_part, video_id, frame_id_stem) từ đường dẫn keyframe."""
     p = Path(img_path)
@@ -68,52 +142,51 @@ def _subpath_under_keyframes(img_path: str) -> str:
     parts = [seg for seg in p.strip("/").split("/") if seg]
     return "/".join(parts[-2:])  # fallback
 
-def path_to_url(img_path: str) -> str:
-    """Trả về absolute URL khớp đúng host/proto (kể cả khi qua ngrok)."""
-    sub = _subpath_under_keyframes(img_path)
+def request_base_url() -> str:
+    """proto://host của request (kể cả khi qua ngrok / proxy); ngoài request (hầu như không dùng đến) -> BACKEND_BASE."""
     if has_request_context():
         proto = request.headers.get("X-Forwarded-Proto", request.scheme)
         host  = request.headers.get("X-Forwarded-Host", request.host)
-        base  = f"{proto}://{host}"
-    else:
-        # Fallback khi chạy ngoài request (hầu như không dùng đến)
-        base = BACKEND_BASE
-    return f"{base.rstrip('/')}/keyframe/{sub}"
+        return f"{proto}://{host}".rstrip('/')
+    return BACKEND_BASE.rstrip('/')
+
+def path_to_url(img_path: str, size: int = None) -> str:
+    """Trả về absolute URL khớp đúng host/proto (kể cả khi qua ngrok); size: URL ảnh thu nhỏ (cạnh dài, px)."""
+    sub = _subpath_under_keyframes(img_path)
+    url = f"{request_base_url()}/keyframe/{sub}"
+    return f"{url}?size={int(size)}" if size else url
+
+def require_admin():
+    """Chặn endpoint quản trị: cần X-Admin-Token = ADMIN_TOKEN, hoặc request từ localhost khi không đặt ADMIN_TOKEN."""
+    if ADMIN_TOKEN:
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+            abort(403)
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(403)
 
 def get_local_video_url(video_id: str) -> str:
     """Tạo URL để serve video local thay vì YouTube."""
-    if has_request_context():
-        proto = request.headers.get("X-Forwarded-Proto", request.scheme)
-        host  = request.headers.get("X-Forwarded-Host", request.host)
-        base  = f"{proto}://{host}"
-    else:
-        base = BACKEND_BASE
-    return f"{base.rstrip('/')}/video/{video_id}"
+    return f"{request_base_url()}/video/{video_id}"
 
 def find_video_file(video_id: str):
-    """Tìm file video trong thư mục VIDEO theo video_id (K02_V019, L22_V002, v.v.)"""
-    # Tìm trực tiếp trong thư mục VIDEO với các định dạng phổ biến
-    for ext in ['.mp4', '.avi', '.mov', '.mkv', '.webm']:
-        # Thử với tên đầy đủ video_id (K02_V019, L22_V002, ...)
-        video_path = BASE_VIDEO_DIR / f"{video_id}{ext}"
-        if video_path.exists():
-            return video_path
-        
-        # Thử với tên rút gọn (chỉ phần sau dấu _)
-        parts = video_id.split('_')
-        if len(parts) >= 2:
-            video_name = parts[1]  # V019, V002, etc.
-            video_path = BASE_VIDEO_DIR / f"{video_name}{ext}"
-            if video_path.exists():
-                return video_path
-    return None
+    """Tìm file video theo video_id (K02_V019, L22_V002, v.v.) trong MediaCatalog (chỉ chạm filesystem khi catalog không có)."""
+    info = Media.video(video_id)
+    return Path(info['path']) if info else None
+
+def local_video_meta(video_id: str):
+    """URL /video + fps / duration của video local (None nếu không có file)."""
+    info = Media.video(video_id)
+    if info is None:
+        return None
+    return {'url': get_local_video_url(video_id), 'fps': info.get('fps'), 'duration': info.get('duration'),
+            'size': info.get('size')}
 
 def postprocess_result_urls(data_list):
     """Đổi toàn bộ lst_keyframe_paths sang URL để <img src> dùng được."""
     for item in data_list:
         vi = item.get("video_info", {})
         if "lst_keyframe_paths" in vi:
-            vi["lst_keyframe_paths"] = [path_to_url(p) for p in vi["lst_keyframe_paths"]]
+            vi["lst_keyframe_paths"] = [path_to_url(p, RESULT_THUMB_SIZE) for p in vi["lst_keyframe_paths"]]
     return data_list
 
 def enrich_groups_with_meta(groups):
@@ -121,13 +194,8 @@ def enrich_groups_with_meta(groups):
     for g in groups:
         vi = g.get('video_info', {})
         idxs = vi.get('lst_idxs', [])
-        secs, frames = [], []
-        for sid in idxs:
-            info = DictImagePath.get(int(sid))
-            secs.append(None if not info else info.get('sec'))
-            frames.append(None if not info else info.get('frame_idx'))
-        vi['lst_keyframe_secs']   = secs
-        vi['lst_frame_numbers']   = frames
+        vi['lst_keyframe_secs']   = DictImagePath.secs(idxs)
+        vi['lst_frame_numbers']   = DictImagePath.frame_numbers(idxs)
     return groups
 
 # Gắn tham số thời gian đơn giản, giữ URL gốc (không đổi watch <-> youtu.be)
@@ -161,17 +229,26 @@ scene_path = 'dict/scene_id2info.json'
 map_keyframes_path = 'dict/map_keyframes.json'
 video_division_path = 'dict/video_division_tag.json'
 video_id2img_path = 'dict/video_id2img_id.json'
-bin_clip_file = 'dict/faiss_clip_cosine.bin'
-bin_clipv2_file = 'dict/faiss_clipv2_cosine.bin'
+# file .bin hoặc manifest shard theo collection (.json, tạo bằng `python -m utils.build_index --shard-by-collection`)
+bin_clip_file = os.environ.get("FAISS_CLIP_INDEX", 'dict/faiss_clip_cosine.bin')
+bin_clipv2_file = os.environ.get("FAISS_CLIPV2_INDEX", 'dict/faiss_clipv2_cosine.bin')
 
 VisualEncoder = VisualEncoding()
-CosineFaiss = MyFaiss(bin_clip_file, bin_clipv2_file, json_path, audio_json_path, img2audio_json_path)
+CosineFaiss = MyFaiss(bin_clip_file, bin_clipv2_file, json_path, audio_json_path, img2audio_json_path, mmap=FAISS_MMAP,
+                      embed_cache_size=EMBED_CACHE_SIZE, embed_cache_path=EMBED_CACHE_PATH,
+                      search_workers=SEARCH_WORKERS, exact_search_dtype=EXACT_SEARCH_DTYPE,
+                      exact_search_threshold=EXACT_SEARCH_THRESHOLD,
+                      models=ENABLED_MODELS, engines=ENABLED_ENGINES, preload=MODEL_PRELOAD,
+                      text_encoder_backend=TEXT_ENCODER_BACKEND, text_encoder_paths=TEXT_ENCODER_PATHS,
+                      text_encoder_threads=TEXT_ENCODER_THREADS)
 TagRecommendation = tag_retrieval()
+Media = MediaCatalog.open(BASE_VIDEO_DIR, BASE_KEYFRAMES_DIR, path=MEDIA_CATALOG_PATH, probe=MEDIA_PROBE,
+                          check_interval=MEDIA_CHECK_INTERVAL)
+Thumbnails = ThumbnailCache(THUMB_CACHE_DIR, max_bytes=THUMB_CACHE_MB << 20, memory_items=THUMB_MEMORY_ITEMS,
+                            quality=THUMB_QUALITY)
 DictImagePath = CosineFaiss.id2img_fps
-TotalIndexList = np.array(list(range(len(DictImagePath)))).astype('int64')
+NumKeyframes = DictImagePath.n          # id lớn nhất + 1 (kích thước bitmap)
 
-with open(scene_path, 'r', encoding='utf-8') as f:
-    Sceneid2info = json.load(f)
 with open(map_keyframes_path, 'r', encoding='utf-8') as f:
     KeyframesMapper = json.load(f)
 with open(video_division_path, 'r', encoding='utf-8') as f:
@@ -179,32 +256,109 @@ with open(video_division_path, 'r', encoding='utf-8') as f:
 with open(video_id2img_path, 'r', encoding='utf-8') as f:
     Videoid2imgid = json.load(f)
 
+# Cây scene -> shot -> keyframe dựng phẳng một lần (CSR); video (L01_V001) -> mảng id đã sắp xếp
+Scenes = SceneIndex.from_json(scene_path, DictImagePath)
+VideoToIds = {video_id: np.sort(np.asarray(ids, dtype=np.int64)) for video_id, ids in Videoid2imgid.items()}
+
 def get_search_space(id):
-    search_space = []
     video_space = VideoDivision[f'list_{id}']
-    for video_id in video_space:
-        search_space.extend(Videoid2imgid[video_id])
-    return search_space
-
-SearchSpace = {i: np.array(get_search_space(i)).astype('int64') for i in range(1, 5)}
-SearchSpace[0] = TotalIndexList
-
-def get_near_frame(idx):
-    image_info = DictImagePath[idx]
-    scene_idx = image_info['scene_idx'].split('/')
-    return copy.deepcopy(
-        Sceneid2info[scene_idx[0]][scene_idx[1]][scene_idx[2]][scene_idx[3]]['lst_keyframe_idxs']
-    )
+    if not video_space:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate([VideoToIds[video_id] for video_id in video_space])
+
+DataManifest = load_manifest(DATA_MANIFEST_PATH)
+DATA_VERSION = DataManifest['version'] if DataManifest else 0
+
+def check_data_manifest():
+    if DataManifest is None:
+        print(f"[manifest] Không có {DATA_MANIFEST_PATH}, bỏ qua kiểm tra dữ liệu")
+        return
+    if MANIFEST_CHECK == "off":
+        return
+    live_counts = {'id2img_fps': ('keyframes', len(DictImagePath)),
+                   'audio_id2img_id': ('audio_segments', len(CosineFaiss.audio_id2img_id))}
+    for name, stats in CosineFaiss.index_load_stats.items():
+        live_counts[f'index {name}'] = ('keyframes', stats['ntotal'])
+    problems = check_manifest(DataManifest, checksums=MANIFEST_CHECK == "checksums", live_counts=live_counts)
+    for problem in problems:
+        print(f"[manifest] {problem}")
+    if problems and MANIFEST_STRICT:
+        raise RuntimeError(f"[manifest] Dữ liệu không khớp {DATA_MANIFEST_PATH} (v{DATA_VERSION})")
+    print(f"[manifest] v{DATA_VERSION}: {'OK' if not problems else f'{len(problems)} lỗi'}")
+
+check_data_manifest()
+
+# Phiên bản dữ liệu + index đang phục vụ (manifest, ntotal / kích thước file, spec); đổi -> cache kết quả cũ bị bỏ
+INDEX_VERSION = hashlib.sha1(json.dumps({
+    'data_version': DATA_VERSION,
+    'indexes': {name: [stats['ntotal'], stats['file_bytes']] for name, stats in CosineFaiss.index_load_stats.items()},
+    'specs': CosineFaiss.index_specs,
+}, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:12]
+# giá trị cache là (status, headers, body) -> tính dung lượng theo body
+Results = ResultCache(max_items=RESULT_CACHE_ITEMS, ttl=RESULT_CACHE_TTL, max_bytes=RESULT_CACHE_MB << 20,
+                      version=INDEX_VERSION, sizeof=lambda value: len(value[2]),
+                      generation_path=RESULT_CACHE_GENERATION_PATH)
+
+# Mỗi search space dựng một lần thành bitmap (IDSelectorBitmap cache sẵn), request chỉ còn phép & / ~
+SearchSpace = {i: IdBitmap.from_ids(get_search_space(i), NumKeyframes) for i in range(1, 5)}
+SearchSpace[0] = IdBitmap.full(NumKeyframes)
+
+# Thứ tự shot theo video cho /temporalsearch (dựng một lần)
+Timeline = ShotTimeline(DictImagePath)
 
 def get_related_ignore(ignore_index):
-    total_ignore_index = []
-    for idx in ignore_index:
-        total_ignore_index.extend(get_near_frame(idx))
-    return total_ignore_index
+    return Scenes.same_shot_ids(ignore_index)
+
+def build_search_index(search_space_index, filter_ids=None, ignore_idxs=None):
+    """
+    Gộp search space + filter id + ignore thành một IdBitmap.
+    Trả (index, ignore_index, keep_index); ignore_index/keep_index = None nếu không có ignore.
+    """
+    index = SearchSpace[search_space_index]
+    if filter_ids is not None:
+        index = index & IdBitmap.from_ids(filter_ids, NumKeyframes)
+
+    ignore_index, keep_index = None, None
+    if ignore_idxs is not None:
+        ignore_index = get_related_ignore(np.array(ignore_idxs).astype('int64'))
+        keep_index = ~IdBitmap.from_ids(ignore_index, NumKeyframes)
+        index = index & keep_index
+    return index, ignore_index, keep_index
+
+def get_ann_params(data):
+    """Tuỳ chọn: ghi đè nprobe (IVF) / efSearch (HNSW) cho riêng request."""
+    nprobe = int(data['nprobe']) if data.get('nprobe') is not None else None
+    ef_search = int(data['ef_search']) if data.get('ef_search') is not None else None
+    return nprobe, ef_search
+
+def get_range_params(data):
+    """
+    (k, min_score). Có 'min_score': trả mọi kết quả có score >= min_score, k (nếu gửi) chỉ là trần,
+    luôn <= RANGE_SEARCH_MAX_RESULTS. Không có: k như cũ, min_score = None.
+    """
+    if data.get('min_score') in (None, ''):
+        return int(data['k']), None
+    k = int(data.get('k') or RANGE_SEARCH_MAX_RESULTS)
+    return min(k, RANGE_SEARCH_MAX_RESULTS), float(data['min_score'])
+
+def get_model_type(clip, clipv2):
+    if clip and clipv2:
+        return 'both'
+    if clip:
+        return 'clip'
+    return 'clipv2'
+
+def format_groups(lst_scores, list_ids, list_image_paths):
+    """Gom theo video + bơm meta + đổi path -> URL (định dạng chung của các endpoint search)."""
+    data = group_result_by_video(lst_scores, list_ids, list_image_paths, KeyframesMapper)
+    data = enrich_groups_with_meta(data)
+    return postprocess_result_urls(data)
 
 # ================== Flask ==================
 app = Flask(__name__, template_folder='templates')
+app.json = FastJSONProvider(app)       # jsonify ghi thẳng mảng / scalar NumPy (orjson nếu có)
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=False)
+app.config['USE_X_SENDFILE'] = VIDEO_X_SENDFILE
 
 @app.after_request
 def _add_cors_headers(resp):
@@ -216,6 +370,37 @@ def _add_cors_headers(resp):
     resp.headers['Access-Control-Allow-Methods'] = 'GET,POST,OPTIONS'
     return resp
 
+def cached_search(view):
+    """
+    Cache response của endpoint search theo request đã chuẩn hoá (query, model, k, search_space, tập id filter / ignore...)
+    + INDEX_VERSION + thế hệ cache dùng chung (Results.generation()) + host (URL ảnh trong kết quả phụ thuộc host). Request giống hệt đến cùng lúc chỉ tính một lần.
+    Lưu (status, headers, body) và chỉ lưu response 200; lỗi / abort() không được cache.
+    Header X-Result-Cache: hit | wait | miss.
+    """
+    def compute(*args, **kwargs):
+        resp = make_response(view(*args, **kwargs))
+        headers = [(name, value) for name, value in resp.headers.items() if name != 'Content-Length']
+        return resp.status_code, headers, resp.get_data()
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method == 'OPTIONS':
+            return view(*args, **kwargs)
+        payload = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args.to_dict()
+        key = request_key(request.endpoint, payload, Results.version, extra=(request_base_url(), Results.generation()))
+        (code, headers, body), status = Results.get_or_compute(key, lambda: compute(*args, **kwargs),
+                                                              cacheable=lambda value: value[0] == 200)
+        resp = app.response_class(body, status=code, headers=headers)
+        resp.headers['X-Result-Cache'] = status
+        return resp
+    return wrapper
+
+@app.after_request
+def _compress_json(resp):
+    """Nén response JSON lớn (kết quả search k lớn)."""
+    return compress_response(resp, request.headers.get('Accept-Encoding'), RESPONSE_COMPRESS_MIN_BYTES,
+                             RESPONSE_COMPRESS_LEVEL)
+
 
 # ---- Static serving for keyframes ----
 @app.route("/keyframe/<path:subpath>")
@@ -227,8 +412,22 @@ def serve_keyframe(subpath):
         return abort(403)
     if not target.exists() or not target.is_file():
         return abort(404)
+    size = request.args.get('size', type=int)
+    if size:
+        try:
+            data, etag = Thumbnails.get(str(target), snap_size(size))
+        except Exception as e:
+            # thiếu opencv / ảnh lỗi -> trả ảnh gốc
+            print(f"[Thumbnail] {e}")
+        else:
+            resp = app.response_class(data, mimetype='image/webp')
+            resp.set_etag(etag)
+            resp.last_modified = target.stat().st_mtime
+            resp.cache_control.public = True
+            resp.cache_control.max_age = KEYFRAME_MAX_AGE
+            return resp.make_conditional(request)
     mt = mimetypes.guess_type(str(target))[0] or "application/octet-stream"
-    return send_file(str(target), mimetype=mt)
+    return send_file(str(target), mimetype=mt, conditional=True, etag=True, max_age=KEYFRAME_MAX_AGE)
 
 # ---- Static serving for videos ----
 @app.route("/video/<video_id>")
@@ -243,38 +442,66 @@ def serve_video(video_id):
     except Exception:
         return abort(403)
     
-    # Support range requests cho video streaming
-    def generate():
-        with open(video_path, 'rb') as f:
-            data = f.read(1024)
-            while data:
-                yield data
-                data = f.read(1024)
-    
+    # conditional=True: Range -> 206 (một range; nhiều range / range ngoài file -> 416), If-Range,
+    # ETag / Last-Modified -> 304. File gửi qua wsgi.file_wrapper (sendfile trên gunicorn) thay vì generator Python.
     mt = mimetypes.guess_type(str(video_path))[0] or "video/mp4"
-    return app.response_class(generate(), mimetype=mt, headers={
-        'Accept-Ranges': 'bytes',
-        'Content-Length': str(video_path.stat().st_size)
-    })
+    return send_file(str(video_path), mimetype=mt, conditional=True, etag=True, max_age=VIDEO_MAX_AGE)
 
 @app.route('/data')
 def index():
     pagefile, count = [], 0
     for sid, value in DictImagePath.items():
-        pagefile.append({'imgpath': path_to_url(value['image_path']), 'id': sid})
+        pagefile.append({'imgpath': path_to_url(value['image_path'], RESULT_THUMB_SIZE), 'id': sid})
         count += 1
         if count >= 500:
             break
     return jsonify({'pagefile': pagefile})
 
-@app.route('/imgsearch')
+def parse_id_list(value):
+    """[1, 2] | "1,2" | "1" -> list[int]."""
+    if value is None or value == '':
+        return []
+    if isinstance(value, (list, tuple)):
+        return [int(v) for v in value]
+    return [int(v) for v in str(value).split(',') if v.strip()]
+
+def parse_bool(value):
+    """True/False (JSON) | "1"/"true"/"yes"/"on" (query string) -> bool; "0", "false", "" -> False."""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+@app.route('/imgsearch', methods=['GET', 'POST', 'OPTIONS'], strict_slashes=False)
+@cached_search
 def image_search():
-    k = int(request.args.get('k'))
-    id_query = int(request.args.get('imgid'))
-    lst_scores, list_ids, _, list_image_paths = CosineFaiss.image_search(id_query, k=k)
-    data = group_result_by_video(lst_scores, list_ids, list_image_paths, KeyframesMapper)
-    data = enrich_groups_with_meta(data)
-    data = postprocess_result_urls(data)
+    """
+    GET ?imgid=1,2&k=..  hoặc POST json {'imgids' | 'imgid', 'k', 'textquery', 'clip', 'clipv2', 'mode' ('centroid' | 'multi'),
+    'search_space', 'filter'/'id', 'ignore'/'ignore_idxs'}. Mặc định như cũ: model mặc định, toàn bộ corpus.
+    """
+    if request.method == 'OPTIONS':
+        return ('', 204)
+    data = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    k, min_score = get_range_params(data)
+    id_query = parse_id_list(data.get('imgids')) or parse_id_list(data.get('imgid'))
+    if not id_query:
+        abort(400, description="imgid / imgids is required")
+    nprobe, ef_search = get_ann_params(data)
+    model_type = get_model_type(parse_bool(data.get('clip')), parse_bool(data.get('clipv2'))) \
+        if ('clip' in data or 'clipv2' in data) else None
+
+    index, _, _ = build_search_index(
+        int(data.get('search_space', 0)),
+        filter_ids=parse_id_list(data.get('id')) if parse_bool(data.get('filter')) else None,
+        ignore_idxs=parse_id_list(data.get('ignore_idxs')) if parse_bool(data.get('ignore')) else None,
+    )
+    k = min(k, len(index))
+    if k == 0:
+        return jsonify([])
+    lst_scores, list_ids, _, list_image_paths = CosineFaiss.image_search(
+        id_query, k=k, index=index, model_type=model_type, text=data.get('textquery') or None,
+        mode=data.get('mode', 'centroid'), nprobe=nprobe, ef_search=ef_search, min_score=min_score
+    )
+    data = format_groups(lst_scores, list_ids, list_image_paths)
     return jsonify(data)
 
 @app.route('/getquestions', methods=['POST', 'OPTIONS'], strict_slashes=False)
@@ -298,74 +525,124 @@ def socketio_stub():
 
 
 @app.route('/textsearch', methods=['POST', 'OPTIONS'], strict_slashes=False)
+@cached_search
 def text_search():
     if request.method == 'OPTIONS':
         return ('', 204)
     data = request.get_json(silent=True) or {}
 
     search_space_index = int(data['search_space'])
-    k = int(data['k'])
+    k, min_score = get_range_params(data)
     clip = data['clip']
     clipv2 = data['clipv2']
     text_query = data['textquery']
     range_filter = int(data['range_filter'])
+    nprobe, ef_search = get_ann_params(data)
 
-    index = None
-    if data.get('filter'):
-        index = np.array(data['id']).astype('int64')
-        k = min(k, len(index))
-
-    keep_index = None
-    ignore_index = None
-    if data.get('ignore'):
-        ignore_index = get_related_ignore(np.array(data['ignore_idxs']).astype('int64'))
-        keep_index = np.delete(TotalIndexList, ignore_index)
-
-    if keep_index is not None:
-        index = np.intersect1d(index, keep_index) if index is not None else keep_index
-
-    index = SearchSpace[search_space_index] if index is None else np.intersect1d(index, SearchSpace[search_space_index])
+    index, ignore_index, keep_index = build_search_index(
+        search_space_index,
+        filter_ids=data['id'] if data.get('filter') else None,
+        ignore_idxs=data['ignore_idxs'] if data.get('ignore') else None,
+    )
     k = min(k, len(index))
+    model_type = get_model_type(clip, clipv2)
 
-    if clip and clipv2:
-        model_type = 'both'
-    elif clip:
-        model_type = 'clip'
-    else:
-        model_type = 'clipv2'
-
-    if data['filtervideo'] != 0:
-        mode = data['filtervideo']
+    mode = int(data['filtervideo'])
+    if mode != 0:
         prev_result = data['videos']
         data = search_by_filter(prev_result, text_query, k, mode, model_type, range_filter, ignore_index, keep_index,
-                                Sceneid2info, DictImagePath, CosineFaiss, KeyframesMapper)
+                                Scenes, CosineFaiss, KeyframesMapper)
     else:
-        if model_type == 'both':
-            scores_clip, list_clip_ids, _, _ = CosineFaiss.text_search(text_query, index=index, k=k, model_type='clip')
-            scores_clipv2, list_clipv2_ids, _, _ = CosineFaiss.text_search(text_query, index=index, k=k, model_type='clipv2')
-            lst_scores, list_ids = merge_searching_results_by_addition([scores_clip, scores_clipv2],
-                                                                       [list_clip_ids, list_clipv2_ids])
-            kept_ids, kept_scores, kept_paths = [], [], []
-            for sid, sc in zip(list_ids, lst_scores):
-                info = DictImagePath.get(int(sid))
-                if info and 'image_path' in info:
-                    kept_ids.append(int(sid))
-                    kept_scores.append(float(sc))
-                    kept_paths.append(info['image_path'])
-            lst_scores = np.array(kept_scores, dtype=np.float32)
-            list_ids = np.array(kept_ids, dtype=np.int64)
-            list_image_paths = kept_paths
-        else:
-            lst_scores, list_ids, _, list_image_paths = CosineFaiss.text_search(
-                text_query, index=index, k=k, model_type=model_type
-            )
+        # model_type 'both': MyFaiss chạy song song 2 nhánh clip / clipv2 rồi cộng điểm
+        lst_scores, list_ids, _, list_image_paths = CosineFaiss.text_search(
+            text_query, index=index, k=k, model_type=model_type, nprobe=nprobe, ef_search=ef_search,
+            min_score=min_score
+        )
         data = group_result_by_video(lst_scores, list_ids, list_image_paths, KeyframesMapper)
 
     data = enrich_groups_with_meta(data)
     data = postprocess_result_urls(data)
     return jsonify(data)
 
+@app.route('/textsearch/batch', methods=['POST', 'OPTIONS'], strict_slashes=False)
+@cached_search
+def text_search_batch():
+    """
+    Nhiều biến thể query cùng lúc: {'textqueries': [...], 'k', 'clip', 'clipv2', 'search_space', 'filter'/'id', 'ignore'/'ignore_idxs'}.
+    Trả list kết quả theo đúng thứ tự textqueries, mỗi phần tử cùng định dạng /textsearch.
+    """
+    if request.method == 'OPTIONS':
+        return ('', 204)
+    data = request.get_json(silent=True) or {}
+
+    text_queries = list(data.get('textqueries') or [])
+    search_space_index = int(data.get('search_space', 0))
+    k, min_score = get_range_params(data)
+    model_type = get_model_type(data.get('clip'), data.get('clipv2'))
+    nprobe, ef_search = get_ann_params(data)
+
+    index, _, _ = build_search_index(
+        search_space_index,
+        filter_ids=data['id'] if data.get('filter') else None,
+        ignore_idxs=data['ignore_idxs'] if data.get('ignore') else None,
+    )
+    k = min(k, len(index))
+    if not text_queries or k == 0:
+        return jsonify([[] for _ in text_queries])
+
+    results = CosineFaiss.text_search_batch(
+        text_queries, index=index, k=k, model_type=model_type, nprobe=nprobe, ef_search=ef_search,
+        min_score=min_score
+    )
+    return jsonify([format_groups(lst_scores, list_ids, list_image_paths)
+                    for lst_scores, list_ids, _, list_image_paths in results])
+
+@app.route('/temporalsearch', methods=['POST', 'OPTIONS'], strict_slashes=False)
+@cached_search
+def temporal_search():
+    """
+    "A rồi B (rồi C ...) trong N shot": {'textqueries': [A, B, ...], 'gaps': N | [N, ...] | [[min, max], ...],
+    'k' (ứng viên mỗi query), 'top' (số chuỗi), 'clip', 'clipv2', 'search_space', 'filter'/'id', 'ignore'/'ignore_idxs'}.
+    Encode + search các query trong một batch, rồi nối theo thứ tự shot trong từng video.
+    Trả list chuỗi (mỗi chuỗi một nhóm, keyframe theo thứ tự A, B, ...) sắp theo tổng điểm.
+    """
+    if request.method == 'OPTIONS':
+        return ('', 204)
+    data = request.get_json(silent=True) or {}
+
+    text_queries = list(data.get('textqueries') or [])
+    if len(text_queries) < 2:
+        abort(400, description="textqueries cần ít nhất 2 query")
+    try:
+        gaps = parse_gaps(data.get('gaps', data.get('range_filter')), len(text_queries))
+    except ValueError as e:
+        abort(400, description=str(e))
+    k, min_score = get_range_params(data)
+    top = int(data.get('top', 100))
+    model_type = get_model_type(data.get('clip'), data.get('clipv2'))
+    nprobe, ef_search = get_ann_params(data)
+
+    index, _, _ = build_search_index(
+        int(data.get('search_space', 0)),
+        filter_ids=data['id'] if data.get('filter') else None,
+        ignore_idxs=data['ignore_idxs'] if data.get('ignore') else None,
+    )
+    k = min(k, len(index))
+    if k == 0:
+        return jsonify([])
+
+    results = CosineFaiss.text_search_batch(
+        text_queries, index=index, k=k, model_type=model_type, nprobe=nprobe, ef_search=ef_search,
+        min_score=min_score
+    )
+    totals, seq_ids, seq_scores = Timeline.search([(scores, ids) for scores, ids, _, _ in results], gaps, top=top)
+    data = group_sequences(totals, seq_ids, seq_scores, DictImagePath, KeyframesMapper)
+    data = enrich_groups_with_meta(data)
+    data = postprocess_result_urls(data)
+    return jsonify(data)
+
 @app.route('/panel', methods=['POST', 'OPTIONS'], strict_slashes=False)
+@cached_search
 def panel():
     if request.method == 'OPTIONS':
         return ('', 204)
@@ -373,21 +650,14 @@ def panel():
     k = int(search_items['k'])
     search_space_index = int(search_items['search_space'])
 
-    index = None
-    if search_items.get('useid'):
-        index = np.array(search_items['id']).astype('int64')
-        k = min(k, len(index))
-
-    keep_index = None
-    if search_items.get('ignore'):
-        ignore_index = get_related_ignore(np.array(search_items['ignore_idxs']).astype('int64'))
-        keep_index = np.delete(TotalIndexList, ignore_index)
-
-    if keep_index is not None:
-        index = np.intersect1d(index, keep_index) if index is not None else keep_index
-
-    index = SearchSpace[search_space_index] if index is None else np.intersect1d(index, SearchSpace[search_space_index])
+    index, _, _ = build_search_index(
+        search_space_index,
+        filter_ids=search_items['id'] if search_items.get('useid') else None,
+        ignore_idxs=search_items['ignore_idxs'] if search_items.get('ignore') else None,
+    )
     k = min(k, len(index))
+    # Các engine TF-IDF cần mảng id; toàn bộ corpus -> None (không cắt ma trận)
+    index = None if index.is_full() else index.to_ids()
 
     object_input = parse_data(search_items, VisualEncoder)
     ocr_input = None if search_items['ocr'] == "" else search_items['ocr']
@@ -400,9 +670,7 @@ def panel():
         k=k, semantic=semantic, keyword=keyword, index=index, useid=search_items['useid']
     )
 
-    data = group_result_by_video(lst_scores, list_ids, list_image_paths, KeyframesMapper)
-    data = enrich_groups_with_meta(data)
-    data = postprocess_result_urls(data)
+    data = format_groups(lst_scores, list_ids, list_image_paths)
     return jsonify(data)
 
 @app.route('/getrec', methods=['POST', 'OPTIONS'], strict_slashes=False)
@@ -420,62 +688,39 @@ def related_img():
     id_query = request.args.get('imgid', type=int)
     if id_query is None:
         return jsonify({})
-    image_info = DictImagePath[id_query]           # có 'sec' & 'frame_idx'
-    image_path = image_info['image_path']
-    keyframe_sec = image_info.get('sec')
-
-    scene_idx  = image_info['scene_idx'].split('/')
-    video_info = copy.deepcopy(Sceneid2info[scene_idx[0]][scene_idx[1]])
-    video_url  = video_info['video_metadata']['watch_url']
-    shot_time  = video_info[scene_idx[2]][scene_idx[3]]['shot_time']
-
-    # Lấy thông tin đầy đủ cho mỗi keyframe thay vì chỉ URL
-    near_keyframes = []
-    for img_path in video_info[scene_idx[2]][scene_idx[3]]['lst_keyframe_paths']:
-        # Parse đường dẫn để lấy thông tin
+    if id_query not in DictImagePath:
+        return jsonify({})
+    g = int(Scenes.shot_of(id_query)[0])
+    if g < 0:
+        return jsonify({})
+    v = int(Scenes.video_of_shot[g])
+    keyframe_sec = DictImagePath.secs([id_query])[0]
+    video_url  = Scenes.watch_urls[v]
+    shot_time  = Scenes.shot_times[g]
+
+    # Keyframe cùng shot là một slice của Scenes.kf_ids (bỏ keyframe hiện tại)
+    near_ids = Scenes.shot_keyframes(g)
+    near_ids = near_ids[near_ids != id_query]
+    near_keyframes = [
+        {'imgpath': path_to_url(img_path, RESULT_THUMB_SIZE), 'sec': sec, 'frame_idx': frame_idx, 'id': idx}
+        for idx, img_path, sec, frame_idx in zip(near_ids.tolist(), DictImagePath.paths(near_ids),
+                                                 DictImagePath.secs(near_ids), DictImagePath.frame_numbers(near_ids))
+    ]
+    # Keyframe của shot không có trong id2img_fps: thông tin cơ bản từ đường dẫn
+    for img_path in Scenes.missing_keyframe_paths(g):
         data_part, video_id, frame_id = _parse_keyframe_path(img_path)
-        
-        # Tìm thông tin từ DictImagePath nếu có
-        keyframe_info = None
-        for idx, info in DictImagePath.items():
-            if info.get('image_path') == img_path:
-                keyframe_info = {
-                    'imgpath': path_to_url(img_path),
-                    'sec': info.get('sec'),
-                    'frame_idx': info.get('frame_idx'),
-                    'id': idx
-                }
-                break
-        
-        # Nếu không tìm thấy, tạo thông tin cơ bản
-        if not keyframe_info:
-            keyframe_info = {
-                'imgpath': path_to_url(img_path),
-                'sec': None,
-                'frame_idx': frame_id,
-                'id': None
-            }
-        
-        near_keyframes.append(keyframe_info)
-    
-    # Loại bỏ keyframe hiện tại
-    try:
-        near_keyframes = [k for k in near_keyframes if k['imgpath'] != path_to_url(image_path)]
-    except ValueError:
-        pass
+        near_keyframes.append({'imgpath': path_to_url(img_path, RESULT_THUMB_SIZE), 'sec': None, 'frame_idx': frame_id, 'id': None})
 
-    # Tạo video_id từ scene_idx để tìm video local
-    # scene_idx[0] = L21, scene_idx[1] = V001 -> video_id = L21_V001
-    local_video_id = f"{scene_idx[0]}_{scene_idx[1]}"
-    local_video_url = get_local_video_url(local_video_id)
-    
-    # Kiểm tra xem video local có tồn tại không
-    video_file_exists = find_video_file(local_video_id) is not None
-    
-    if video_file_exists:
+    # Tạo video_id để tìm video local: L21 + V001 -> L21_V001
+    local_video_id = f"{Scenes.collections[v]}_{Scenes.video_names[v]}"
+    local_video = local_video_meta(local_video_id)
+
+    if local_video is not None:
+        local_video_url = local_video['url']
         # Sử dụng video local
         final_video_url = local_video_url
-        final_video_url_seek = local_video_url  # Local video không cần seek parameter
+        # media fragment #t=: trình duyệt seek rồi chỉ tải phần cần (Range) từ /video
+        final_video_url_seek = f"{local_video_url}#t={keyframe_sec}" if keyframe_sec is not None else local_video_url
         is_local_video = True
     else:
         # Fallback về YouTube nếu không có video local
@@ -489,11 +734,13 @@ def related_img():
         'video_url_seek': final_video_url_seek,
         'start_sec': keyframe_sec if is_local_video else sec_sent,
         'keyframe_sec': keyframe_sec,
-        'frame_idx': image_info.get('frame_idx'),
+        'frame_idx': DictImagePath.frame_numbers([id_query])[0],
         'video_range': shot_time,
         'near_keyframes': near_keyframes,
         'is_local_video': is_local_video,
-        'local_video_id': local_video_id
+        'local_video_id': local_video_id,
+        'video_fps': local_video['fps'] if local_video else None,
+        'video_duration': local_video['duration'] if local_video else None
     })
 
 @app.route('/getvideoshot')
@@ -501,21 +748,18 @@ def get_video_shot():
     if request.args.get('imgid') == 'undefined':
         return jsonify({})
     id_query = int(request.args.get('imgid'))
-    image_info = DictImagePath[id_query]
-    scene_idx = image_info['scene_idx'].split('/')
-    shots = copy.deepcopy(Sceneid2info[scene_idx[0]][scene_idx[1]][scene_idx[2]])
-
-    selected_shot = int(scene_idx[3])
-    total_n_shots = len(shots)
-    new_shots = {}
-    for select_id in range(max(0, selected_shot-5), min(selected_shot+6, total_n_shots)):
-        new_shots[str(select_id)] = shots[str(select_id)]
-    shots = new_shots
-
-    for shot_key in list(shots.keys()):
+    g = int(Scenes.shot_of(id_query)[0])
+    if g < 0:
+        return jsonify({})
+    v = int(Scenes.video_of_shot[g])
+    first, stop = Scenes.video_shot_range(g)
+
+    shots = {}
+    for shot in range(max(first, g - 5), min(g + 6, stop)):
+        idxs = Scenes.shot_keyframes(shot)
         lst_keyframe_idxs = []
         url_paths = []
-        for img_path in shots[shot_key]['lst_keyframe_paths']:
+        for img_path in DictImagePath.paths(idxs):
             data_part, video_id, frame_id = _parse_keyframe_path(img_path)
             key = f'{data_part}_{video_id}'.replace('_extra', '')
             if 'extra' not in data_part:
@@ -525,19 +769,25 @@ def get_video_shot():
             except Exception:
                 frame_id_int = frame_id
             lst_keyframe_idxs.append(frame_id_int)
-            url_paths.append(path_to_url(img_path))
-
-        shots[shot_key]['lst_idxs'] = shots[shot_key]['lst_keyframe_idxs']
-        shots[shot_key]['lst_keyframe_secs'] = [DictImagePath[idx].get('sec') for idx in shots[shot_key]['lst_idxs']]
-        shots[shot_key]['lst_frame_numbers'] = [DictImagePath[idx].get('frame_idx') for idx in shots[shot_key]['lst_idxs']]
-        shots[shot_key]['lst_keyframe_idxs'] = lst_keyframe_idxs
-        shots[shot_key]['lst_keyframe_paths'] = url_paths
-
+            url_paths.append(path_to_url(img_path, RESULT_THUMB_SIZE))
+
+        shots[str(shot - first)] = {
+            'shot_range': Scenes.shot_range(shot),
+            'shot_time': Scenes.shot_times[shot],
+            'lst_idxs': idxs.tolist(),
+            'lst_keyframe_secs': DictImagePath.secs(idxs),
+            'lst_frame_numbers': DictImagePath.frame_numbers(idxs),
+            'lst_keyframe_idxs': lst_keyframe_idxs,
+            'lst_keyframe_paths': url_paths,
+        }
+
+    collection, video_name = Scenes.collections[v], Scenes.video_names[v]
     return jsonify({
-        'collection': scene_idx[0],
-        'video_id': scene_idx[1],
+        'collection': collection,
+        'video_id': video_name,
         'shots': shots,
-        'selected_shot': scene_idx[3]
+        'selected_shot': str(g - first),
+        'local_video': local_video_meta(f"{collection}_{video_name}")
     })
 
 @app.route('/feedback', methods=['POST', 'OPTIONS'], strict_slashes=False)
@@ -549,12 +799,50 @@ def feed_back():
     prev_result = data['videos']
     lst_pos_vote_idxs = data['lst_pos_idxs']
     lst_neg_vote_idxs = data['lst_neg_idxs']
-    lst_scores, list_ids, _, list_image_paths = CosineFaiss.reranking(prev_result, lst_pos_vote_idxs, lst_neg_vote_idxs, k)
-    data = group_result_by_video(lst_scores, list_ids, list_image_paths, KeyframesMapper)
-    data = enrich_groups_with_meta(data)
-    data = postprocess_result_urls(data)
+    # clip / clipv2 không gửi -> model mặc định; alpha / beta: trọng số điểm cũ / vote âm (Rocchio)
+    model_type = get_model_type(data.get('clip'), data.get('clipv2')) if ('clip' in data or 'clipv2' in data) else None
+    lst_scores, list_ids, _, list_image_paths = CosineFaiss.reranking(
+        prev_result, lst_pos_vote_idxs, lst_neg_vote_idxs, k, model_type=model_type,
+        alpha=float(data.get('alpha', 1.0)), beta=float(data.get('beta', 0.5))
+    )
+    data = format_groups(lst_scores, list_ids, list_image_paths)
     return jsonify(data)
 
+@app.route('/cachestats')
+def cache_stats():
+    return jsonify({'text_embedding': CosineFaiss.embed_cache.stats(), 'models': CosineFaiss.models.status(),
+                    'thumbnails': Thumbnails.stats(), 'media': Media.stats(), 'results': Results.stats(),
+                    'data_version': DATA_VERSION})
+
+@app.route('/mediacatalog/refresh', methods=['POST', 'OPTIONS'], strict_slashes=False)
+def refresh_media_catalog():
+    """
+    Duyệt lại thư mục video / keyframe (sau khi chép thêm file) và ghi lại catalog; worker khác đọc lại file trong
+    MEDIA_CHECK_INTERVAL giây. Cần quyền quản trị, lần refresh trước (mọi worker) chưa quá MEDIA_REFRESH_MIN_INTERVAL -> 429.
+    """
+    if request.method == 'OPTIONS':
+        return ('', 204)
+    require_admin()
+    age = Media.age()
+    if age is not None and age < MEDIA_REFRESH_MIN_INTERVAL:
+        return jsonify(Media.stats()), 429, {'Retry-After': str(int(MEDIA_REFRESH_MIN_INTERVAL - age) + 1)}
+    catalog = Media.refresh(wait=False)
+    if catalog is None:
+        return jsonify(Media.stats()), 429, {'Retry-After': str(int(MEDIA_REFRESH_MIN_INTERVAL))}
+    return jsonify(catalog.stats())
+
+@app.route('/resultcache/clear', methods=['POST', 'OPTIONS'], strict_slashes=False)
+def clear_result_cache():
+    """
+    Xoá cache kết quả search (vd. sau khi đổi dữ liệu phụ như map_keyframes): worker nhận request xoá bộ nhớ của nó
+    và tăng thế hệ trong RESULT_CACHE_GENERATION_PATH, các worker khác đổi key nên không trả entry cũ nữa.
+    """
+    if request.method == 'OPTIONS':
+        return ('', 204)
+    require_admin()
+    Results.clear()
+    return jsonify(Results.stats())
+
 @app.route('/translate', methods=['POST', 'OPTIONS'], strict_slashes=False)
 def translate():
     if request.method == 'OPTIONS':
@@ -564,8 +852,16 @@ def translate():
     text_query_translated = CosineFaiss.translater(text_query)
     return jsonify(text_query_translated)
 
-# Running app
+def init_worker(omp_threads: int = 0):
+    """
+    Chạy trong mỗi worker sau khi fork (post_fork của gunicorn.conf.py); state đọc-only giữ nguyên từ process cha.
+    Cache / catalog thay đổi lúc chạy là riêng từng worker, đồng bộ qua file (xem docstring gunicorn.conf.py).
+    """
+    CosineFaiss.after_fork(omp_threads=omp_threads)
+
+# Running app (dev server một process; production: `gunicorn app:app`, cấu hình trong gunicorn.conf.py)
 if __name__ == '__main__':
     print(f"[KEYFRAMES_DIR] Serving from: {BASE_KEYFRAMES_DIR}")
     print(f"[BACKEND_BASE] {BACKEND_BASE}")
+    print(f"[FAISS_MMAP] {FAISS_MMAP}")
     app.run(host="0.0.0.0", port=5001, debug=False, use_reloader=False, threaded=True)
@@ -10,6 +10,18 @@ function fmtSec(s) {
   return (Math.round(n * 1000) / 1000).toString();
 }
 
+// Ảnh trong danh sách là bản thu nhỏ (?size=...); xem toàn màn hình thì lấy ảnh gốc
+function fullResUrl(url) {
+  if (!url) return url;
+  try {
+    const u = new URL(url);
+    u.searchParams.delete("size");
+    return u.toString();
+  } catch {
+    return url;
+  }
+}
+
 // Helper to get YouTube URL at specific time
 function getYouTubeUrlAtTime(url, sec) {
   if (!url) return "";
@@ -353,7 +365,7 @@ export default function FullScreen({ fullScreenImg, setFullScreenImg, relatedObj
             {!shouldShowVideo ? (
               <>
                 <Image
-                  src={selectedKeyframe?.imgpath || fullScreenImg.imgpath}
+                  src={fullResUrl(selectedKeyframe?.imgpath || fullScreenImg.imgpath)}
                   fill
                   className="rounded-2xl opacity-100 object-contain"
                   alt=""
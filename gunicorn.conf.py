@@ -0,0 +1,58 @@
+"""
+Server production: pre-fork nhiều worker, nạp toàn bộ state đọc-only (index FAISS, KeyframeStore, SceneIndex,
+ma trận TF-IDF, model) MỘT lần ở process master rồi fork -> các worker dùng chung copy-on-write.
+
+    gunicorn app:app                                   # đọc file này (gunicorn.conf.py ở thư mục chạy)
+    WEB_WORKERS=4 WEB_THREADS=8 FAISS_MMAP=1 gunicorn app:app
+
+Biến môi trường:
+    WEB_BIND          địa chỉ lắng nghe (mặc định 0.0.0.0:5001, cùng cổng với `python app.py`)
+    WEB_WORKERS       số process worker (mặc định 2); mỗi worker một GIL riêng
+    WEB_THREADS       số luồng xử lý request trong mỗi worker (mặc định 4, worker class gthread)
+    WEB_TIMEOUT       giây tối đa cho một request trước khi worker bị restart (mặc định 120)
+    WORKER_OMP_THREADS  số luồng OpenMP (faiss) / torch mỗi worker; mặc định số CPU / WEB_WORKERS
+    WEB_MAX_REQUESTS  restart worker sau N request (0 = không); fork lại từ master nên không phải nạp lại state
+
+MODEL_PRELOAD 'eager' (mặc định): model nạp trong master trước khi fork; 'background' cũng bị đổi thành 'eager';
+'lazy' -> mỗi worker tự nạp, không chia sẻ.
+Sau khi nạp xong, gc.freeze() chuyển mọi object hiện có sang vùng permanent: gc của worker không quét / ghi vào chúng
+nên các trang nhớ đó không bị copy. FAISS_MMAP=1 thêm: index đọc qua mmap, dùng chung page cache cả giữa các lần restart.
+Không chạy được trên Windows (không có fork): dùng `python app.py`.
+
+State thay đổi lúc chạy là riêng từng worker (không chia sẻ sau fork), đồng bộ qua file:
+    MediaCatalog     worker refresh thì ghi file catalog, worker khác thấy mtime đổi thì đọc lại (MEDIA_CHECK_INTERVAL)
+    ResultCache      RAM riêng; /resultcache/clear tăng thế hệ trong RESULT_CACHE_GENERATION_PATH -> mọi worker bỏ entry cũ
+    EmbeddingCache   RAM riêng; lúc ghi file (định kỳ + khi tắt) khoá file rồi gộp entry của các worker khác
+    ThumbnailCache   thư mục WebP dùng chung, chỉ phần RAM là riêng
+    ModelRegistry    model 'lazy' / export ONNX nạp riêng trong từng worker
+"""
+import gc
+import os
+
+bind = os.environ.get("WEB_BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("WEB_WORKERS", "2"))
+threads = int(os.environ.get("WEB_THREADS", "4"))
+worker_class = "gthread"
+timeout = int(os.environ.get("WEB_TIMEOUT", "120"))
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+preload_app = True
+
+# luồng nền của process cha không đi theo fork -> model phải nạp xong trước khi fork
+if os.environ.get("MODEL_PRELOAD") == "background":
+    os.environ["MODEL_PRELOAD"] = "eager"
+
+WORKER_OMP_THREADS = int(os.environ.get("WORKER_OMP_THREADS", "0")) or max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def when_ready(server):
+    # app đã import xong (preload_app): dọn rác một lần rồi freeze trước khi fork worker đầu tiên
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"[gunicorn] {gc.get_freeze_count()} objects frozen, forking {workers} workers x {threads} threads")
+
+
+def post_fork(server, worker):
+    import app
+    app.init_worker(omp_threads=WORKER_OMP_THREADS)
+    server.log.info(f"[gunicorn] worker {worker.pid} ready (omp_threads={WORKER_OMP_THREADS})")
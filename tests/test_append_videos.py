@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import faiss
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('scipy')
+pytest.importorskip('sklearn')
+
+from utils.append_videos import append_to_index
+from utils.build_index import build_shards
+from utils.index_spec import DEFAULT_SPEC
+from utils.sharded_index import ShardedIndex, load_manifest
+
+
+def _feats(n, d=8, seed=0):
+    x = np.random.default_rng(seed).standard_normal((n, d)).astype(np.float32)
+    faiss.normalize_L2(x)
+    return x
+
+
+def test_append_to_last_new_and_existing_collection(tmp_path):
+    manifest_path = str(tmp_path / 'faiss_clip.shards.json')
+    l01, l02 = _feats(30, seed=1), _feats(20, seed=2)
+    build_shards([('L01', l01), ('L02', l02)], dict(DEFAULT_SPEC), manifest_path)
+
+    more_l02, l03, more_l01 = _feats(5, seed=3), _feats(7, seed=4), _feats(4, seed=5)
+    append_to_index(manifest_path, more_l02, 'L02', 50)      # shard cuối, cùng collection -> add vào shard
+    append_to_index(manifest_path, l03, 'L03', 55)           # collection mới -> shard mới
+    append_to_index(manifest_path, more_l01, 'L01', 62)      # collection đã có, không phải shard cuối
+
+    manifest = load_manifest(manifest_path)
+    paths = [shard['path'] for shard in manifest['shards']]
+    assert len(paths) == len(set(paths)) == 4
+    assert [shard['name'] for shard in manifest['shards']] == ['L01', 'L02', 'L03', 'L01']
+    # shard L01 gốc không bị ghi đè
+    assert faiss.read_index(os.path.join(str(tmp_path), paths[0])).ntotal == 30
+
+    sharded = ShardedIndex.load(manifest_path)
+    all_feats = np.concatenate([l01, l02, more_l02, l03, more_l01])
+    assert sharded.ntotal == len(all_feats) == 66
+    scores, ids = sharded.search(all_feats, 1)
+    assert ids[:, 0].tolist() == list(range(66))
+
+
+def test_append_rejects_wrong_ntotal(tmp_path):
+    manifest_path = str(tmp_path / 'faiss_clip.shards.json')
+    build_shards([('L01', _feats(10))], dict(DEFAULT_SPEC), manifest_path)
+    with pytest.raises(ValueError):
+        append_to_index(manifest_path, _feats(3), 'L01', 9)
@@ -0,0 +1,50 @@
+import faiss
+import numpy as np
+
+from utils.build_index import build_index, build_shards, shard_spec
+from utils.index_spec import DEFAULT_SPEC
+from utils.sharded_index import ShardedIndex, load_manifest
+
+
+def _feats(n, d=16, seed=0):
+    x = np.random.default_rng(seed).standard_normal((n, d)).astype(np.float32)
+    faiss.normalize_L2(x)
+    return x
+
+
+def _spec(**kwargs):
+    return dict(DEFAULT_SPEC, **kwargs)
+
+
+def test_shard_spec_shrinks_nlist():
+    assert shard_spec(_spec(type='ivf_flat', nlist=4096), 10000)['nlist'] == 10000 // 39
+    assert shard_spec(_spec(type='ivf_flat', nlist=16), 10000)['nlist'] == 16
+    assert shard_spec(_spec(type='ivf_flat', nlist=16), 10)['nlist'] == 1
+    assert shard_spec(_spec(type='hnsw'), 10) == _spec(type='hnsw')
+
+
+def test_shard_spec_small_pq_shard_falls_back_to_ivf_flat():
+    spec = _spec(type='ivf_pq', nlist=64, pq_m=8, pq_nbits=8)
+    assert shard_spec(spec, 100)['type'] == 'ivf_flat'
+    assert shard_spec(spec, 10000)['type'] == 'ivf_pq'
+    assert shard_spec(dict(spec, pq_nbits=4), 100)['type'] == 'ivf_pq'
+    assert spec['type'] == 'ivf_pq'                                  # không sửa spec gốc
+
+
+def test_build_index_small_pq_shard_trains(tmp_path):
+    spec = _spec(type='ivf_pq', nlist=64, pq_m=8, pq_nbits=8)
+    index = build_index(_feats(100), shard_spec(spec, 100))
+    assert index.ntotal == 100
+
+
+def test_build_shards_mixed_sizes_with_pq(tmp_path):
+    a, b = _feats(200, seed=1), _feats(10, seed=2)             # b < 2**pq_nbits = 16 vectors
+    manifest = str(tmp_path / 'faiss_clip.shards.json')
+    spec = _spec(type='ivf_pq', nlist=4, pq_m=4, pq_nbits=4, nprobe=4)
+    build_shards([('L01', a), ('L02', b)], spec, manifest)
+    factories = [shard['factory'] for shard in load_manifest(manifest)['shards']]
+    assert factories == ['IVF4,PQ4x4', 'IVF1,Flat']
+
+    sharded = ShardedIndex.load(manifest)
+    _, ids = sharded.search(b[:5], 1)
+    assert ids[:, 0].tolist() == list(range(200, 205))
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+
+from utils.embedding_cache import EmbeddingCache, normalize_text
+
+
+def test_normalize_text():
+    assert normalize_text('  A  Man\tRiding\n a Bike ') == 'a man riding a bike'
+
+
+def test_key_ignores_case_and_spaces_but_not_model():
+    cache = EmbeddingCache(max_size=8)
+    cache.put('clip', 'A dog  running', np.ones(4))
+    assert cache.get('clip', ' a DOG running') is not None
+    assert cache.get('clipv2', 'a dog running') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_values_are_read_only_float32():
+    cache = EmbeddingCache(max_size=8)
+    cache.put('clip', 'x', np.arange(4, dtype=np.float64).reshape(1, 4))
+    vec = cache.get('clip', 'x')
+    assert vec.dtype == np.float32 and vec.shape == (4,)
+    assert not vec.flags.writeable
+
+
+def test_lru_eviction():
+    cache = EmbeddingCache(max_size=2)
+    cache.put('clip', 'a', np.zeros(2))
+    cache.put('clip', 'b', np.zeros(2))
+    cache.get('clip', 'a')              # 'a' thành mới dùng nhất
+    cache.put('clip', 'c', np.zeros(2))
+    assert cache.get('clip', 'b') is None
+    assert cache.get('clip', 'a') is not None and cache.get('clip', 'c') is not None
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'cache' / 'text_emb.pkl')
+    cache = EmbeddingCache(max_size=8, path=path, save_every=100)
+    for i in range(5):
+        cache.put('clip', f'query {i}', np.full(3, i))
+    cache.save()
+
+    reloaded = EmbeddingCache(max_size=3, path=path)
+    assert reloaded.stats()['size'] == 3    # chỉ giữ 3 entry mới nhất
+    assert reloaded.get('clip', 'query 0') is None
+    np.testing.assert_array_equal(reloaded.get('clip', 'QUERY  4'), np.full(3, 4, dtype=np.float32))
+
+
+def test_autosave_every_n_puts(tmp_path):
+    path = str(tmp_path / 'text_emb.pkl')
+    cache = EmbeddingCache(max_size=8, path=path, save_every=2)
+    cache.put('clip', 'a', np.zeros(2))
+    cache.put('clip', 'b', np.zeros(2))
+    assert EmbeddingCache(max_size=8, path=path).stats()['size'] == 2
+
+
+def test_save_merges_entries_from_other_workers(tmp_path):
+    path = str(tmp_path / 'text_emb.pkl')
+    worker_a = EmbeddingCache(max_size=8, path=path, save_every=100)
+    worker_b = EmbeddingCache(max_size=8, path=path, save_every=100)
+    worker_a.put('clip', 'from a', np.full(2, 1))
+    worker_b.put('clip', 'from b', np.full(2, 2))
+    worker_a.save()
+    worker_b.save()                     # không được ghi đè mất entry của worker_a
+
+    merged = EmbeddingCache(max_size=8, path=path)
+    for text in ('from a', 'from b'):
+        assert merged.get('clip', text) is not None
+    assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
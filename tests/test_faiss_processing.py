@@ -0,0 +1,173 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('clip')
+pytest.importorskip('open_clip')
+
+from utils.combine_utils import merge_searching_results_by_addition  # noqa: E402
+from utils.faiss_processing import MyFaiss                     # noqa: E402
+from utils.index_spec import DEFAULT_SPEC                      # noqa: E402
+from utils.keyframe_store import KeyframeStore                 # noqa: E402
+from utils.model_registry import ModelRegistry                 # noqa: E402
+
+
+def _vectors(n=300, d=16, seed=0):
+    x = np.random.default_rng(seed).standard_normal((n, d)).astype(np.float32)
+    faiss.normalize_L2(x)
+    return x
+
+
+def _engine(models=('clip',), n=300, d=16):
+    """MyFaiss tối thiểu trên IndexFlatIP (không nạp model CLIP); vector mỗi model khác seed."""
+    engine = MyFaiss.__new__(MyFaiss)
+    engine.enabled_models = tuple(models)
+    engine.index_clip = engine.index_clipv2 = None
+    engine.dim_clip = engine.dim_clipv2 = None
+    engine.index_specs, engine.rerank_vectors, engine.embed_matrix, engine.vectors = {}, {}, {}, {}
+    for seed, m in enumerate(models):
+        x = _vectors(n, d, seed)
+        index = faiss.IndexFlatIP(d)
+        index.add(x)
+        setattr(engine, f'index_{m}', index)
+        setattr(engine, f'dim_{m}', d)
+        engine.index_specs[m] = dict(DEFAULT_SPEC, type='flat', dim=d, ntotal=n)
+        engine.rerank_vectors[m] = None
+        engine.embed_matrix[m] = engine._build_embed_matrix(index, engine.index_specs[m], 'float32')
+        engine.vectors[m] = x
+    engine.exact_search_threshold = 0
+    engine.id2img_fps = KeyframeStore.from_dict({str(i): {'image_path': f'L01_V001/{i:06d}.jpg', 'scene_idx': None,
+                                                          'sec': float(i), 'frame_idx': i} for i in range(n)})
+    engine._search_pool = ThreadPoolExecutor(max_workers=2)
+    engine.models = ModelRegistry()
+    engine.models.register('translate', lambda: (lambda text: text))
+    return engine
+
+
+def _brute_topk(x, query, k):
+    scores = x @ query
+    order = np.argsort(-scores, kind='stable')[:k]
+    return scores[order], order
+
+
+def _prev_result(ids, scores):
+    return [{'video_info': {'lst_idxs': list(ids), 'lst_scores': list(scores)}}]
+
+
+def _expected_rerank(engine, models, candidates, prev, pos, neg, alpha=1.0, beta=0.5):
+    scores = alpha * np.asarray(prev, dtype=np.float32)
+    for m in models:
+        x = engine.vectors[m]
+        query = x[pos].mean(axis=0) if pos else np.zeros(x.shape[1], dtype=np.float32)
+        if neg:
+            query = query - beta * x[neg].mean(axis=0)
+        scores = scores + x[candidates] @ query
+    order = np.argsort(-scores, kind='stable')
+    return [int(candidates[i]) for i in order], scores[order]
+
+
+def test_embed_matrix_only_for_uncompressed_data():
+    x = _vectors()
+    engine = MyFaiss.__new__(MyFaiss)
+    flat = faiss.IndexFlatIP(x.shape[1])
+    flat.add(x)
+    view = engine._build_embed_matrix(flat, dict(DEFAULT_SPEC), 'float32')
+    np.testing.assert_array_equal(view, x)
+    assert not view.flags.owndata                                 # view vào index, không copy
+
+    rerank = np.ascontiguousarray(x)
+    for factory in ('IVF4,Flat', 'IVF4,PQ4x4', 'HNSW8,Flat', 'SQ8'):
+        index = faiss.index_factory(x.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+        index.train(x)
+        index.add(x)
+        assert engine._build_embed_matrix(index, dict(DEFAULT_SPEC), 'float32') is None
+        assert engine._build_embed_matrix(index, dict(DEFAULT_SPEC), 'float32', rerank) is rerank
+    assert engine._build_embed_matrix(flat, dict(DEFAULT_SPEC), None) is None
+
+
+# ----------------- Reranking -----------------
+def test_reranking_removes_negatives_and_orders_by_rocchio():
+    engine = _engine()
+    candidates = np.arange(10, 30)
+    prev = np.linspace(0.9, 0.5, len(candidates))
+    pos, neg = [3, 40], [12, 15]
+    scores, ids, infos, paths = engine.reranking(_prev_result(candidates, prev), pos, neg, k=5, alpha=0.7)
+
+    assert not set(neg) & set(ids)
+    keep = ~np.isin(candidates, neg)
+    expected_ids, expected_scores = _expected_rerank(engine, ('clip',), candidates[keep], prev[keep], pos, neg, alpha=0.7)
+    assert ids == expected_ids
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+    assert len(infos) == len(paths) == len(ids)
+    assert paths[0] == f'L01_V001/{ids[0]:06d}.jpg'
+
+
+def test_reranking_both_sums_models():
+    engine = _engine(models=('clip', 'clipv2'))
+    candidates = np.arange(50, 70)
+    prev = np.full(len(candidates), 0.5)
+    scores, ids, _, _ = engine.reranking(_prev_result(candidates, prev), [1, 2], [], k=5, model_type='both')
+
+    expected_ids, expected_scores = _expected_rerank(engine, ('clip', 'clipv2'), candidates, prev, [1, 2], [])
+    assert ids == expected_ids
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+
+
+def test_reranking_without_votes_returns_empty():
+    engine = _engine()
+    prev = _prev_result([1, 2, 3], [0.3, 0.2, 0.1])
+    assert engine.reranking(prev, [], [], k=5) == ([], [], [], [])
+    assert engine.reranking(prev, None, None, k=5) == ([], [], [], [])
+    # mọi ứng viên đều bị vote âm
+    assert engine.reranking(prev, [], [1, 2, 3], k=5) == ([], [], [], [])
+
+
+# ----------------- Image search -----------------
+def test_image_search_centroid_of_examples():
+    engine = _engine()
+    x = engine.vectors['clip']
+    scores, ids, infos, _ = engine.image_search([5, 9], k=10)
+
+    query = x[[5, 9]].mean(axis=0)
+    expected_scores, expected_ids = _brute_topk(x, query / np.linalg.norm(query), 10)
+    np.testing.assert_array_equal(ids, expected_ids)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+    assert len(infos) == 10
+    # một ví dụ: chính nó đứng đầu
+    assert engine.image_search(7, k=3)[1][0] == 7
+
+
+def test_image_search_multi_sums_per_example_scores():
+    engine = _engine()
+    x = engine.vectors['clip']
+    scores, ids, _, _ = engine.image_search([5, 9], k=10, mode='multi')
+
+    per_query = [_brute_topk(x, x[i], 10) for i in (5, 9)]
+    expected_scores, expected_ids = merge_searching_results_by_addition([s for s, _ in per_query],
+                                                                        [i for _, i in per_query])
+    np.testing.assert_array_equal(ids, expected_ids[:10])
+    np.testing.assert_allclose(scores, expected_scores[:10], rtol=1e-5, atol=1e-6)
+    assert {5, 9} <= set(ids.tolist())
+
+
+def test_image_search_text_joins_centroid():
+    engine = _engine()
+    x = engine.vectors['clip']
+    text_feat = _vectors(1, x.shape[1], seed=42)
+    calls = []
+
+    def encode(texts, model_type):
+        calls.append((list(texts), model_type))
+        return text_feat
+
+    engine._encode_texts = encode
+    scores, ids, _, _ = engine.image_search([5], k=10, text='a red car')
+
+    assert calls == [(['a red car'], 'clip')]
+    query = np.concatenate([x[[5]], text_feat]).mean(axis=0)
+    expected_scores, expected_ids = _brute_topk(x, query / np.linalg.norm(query), 10)
+    np.testing.assert_array_equal(ids, expected_ids)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,129 @@
+import gzip
+import json
+
+import numpy as np
+import pytest
+from flask import Flask, jsonify, request
+
+from utils import fast_json
+from utils.fast_json import FastJSONProvider, choose_encoding, compress, compress_response, dumps, loads
+
+
+def _payload(tmp_path):
+    mm = np.memmap(tmp_path / 'scores.f32', dtype=np.float32, mode='w+', shape=(3,))
+    mm[:] = [0.5, 0.25, 0.125]
+    return {
+        'ids': np.arange(6, dtype=np.int64)[::2],                  # không liên tục
+        'scores': np.array([0.5, 0.25], dtype=np.float16),
+        'matrix': np.arange(4, dtype=np.int32).reshape(2, 2),
+        'memmap': mm,
+        'n': np.int64(7), 'score': np.float32(0.5), 'flag': np.bool_(True),
+        'tags': ('a', 'ảnh'),
+        3: 'non-str key',
+    }
+
+
+EXPECTED = {
+    'ids': [0, 2, 4], 'scores': [0.5, 0.25], 'matrix': [[0, 1], [2, 3]], 'memmap': [0.5, 0.25, 0.125],
+    'n': 7, 'score': 0.5, 'flag': True, 'tags': ['a', 'ảnh'], '3': 'non-str key',
+}
+
+
+@pytest.fixture(params=['orjson', 'stdlib'])
+def backend(request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(fast_json, 'orjson', None)
+    return request.param
+
+
+def test_dumps_numpy(backend, tmp_path):
+    body = dumps(_payload(tmp_path))
+    assert isinstance(body, bytes)
+    assert json.loads(body) == EXPECTED
+    assert loads(body) == EXPECTED
+
+
+def test_dumps_rejects_unknown_types(backend):
+    with pytest.raises(TypeError):
+        dumps({'x': object()})
+
+
+def test_choose_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(fast_json, 'brotli', None)
+    assert choose_encoding('br') is None
+    assert choose_encoding('gzip, br') == 'gzip'
+    assert choose_encoding('br;q=1.0, GZIP;q=0.5') == 'gzip'
+    assert choose_encoding('identity') is None
+    assert choose_encoding(None) is None
+
+
+def test_choose_encoding_prefers_brotli(monkeypatch):
+    monkeypatch.setattr(fast_json, 'brotli', object())
+    assert choose_encoding('gzip, br') == 'br'
+
+
+def test_compress_gzip_round_trip():
+    body = dumps({'ids': list(range(1000))})
+    assert gzip.decompress(compress(body, 'gzip', level=1)) == body
+
+
+def _app():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ids': np.arange(3)})
+
+    @app.route('/big')
+    def big():
+        return jsonify({'ids': np.arange(2000), 'scores': np.linspace(0, 1, 2000, dtype=np.float32)})
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return jsonify(request.get_json())
+
+    @app.route('/text')
+    def text():
+        return 'x' * 5000
+
+    @app.after_request
+    def _compress(resp):
+        return compress_response(resp, request.headers.get('Accept-Encoding'), min_bytes=1000, level=1)
+
+    return app
+
+
+def test_jsonify_numpy_and_compression_threshold(monkeypatch):
+    monkeypatch.setattr(fast_json, 'brotli', None)
+    client = _app().test_client()
+
+    resp = client.get('/small', headers={'Accept-Encoding': 'gzip, br'})
+    assert 'Content-Encoding' not in resp.headers                  # dưới ngưỡng
+    assert resp.get_json() == {'ids': [0, 1, 2]}
+
+    resp = client.get('/big', headers={'Accept-Encoding': 'gzip, br'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    data = json.loads(gzip.decompress(resp.get_data()))
+    assert data['ids'] == list(range(2000)) and len(data['scores']) == 2000
+
+    assert 'Content-Encoding' not in client.get('/big', headers={'Accept-Encoding': 'br'}).headers
+    assert 'Content-Encoding' not in client.get('/big').headers
+    assert 'Content-Encoding' not in client.get('/text', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_compression_disabled_with_zero_threshold():
+    app = _app()
+    with app.test_request_context('/big'):
+        resp = app.make_response(jsonify({'ids': np.arange(2000)}))
+        assert compress_response(resp, 'gzip', min_bytes=0) is resp
+        assert 'Content-Encoding' not in resp.headers
+
+
+def test_provider_loads_request_json(backend):
+    client = _app().test_client()
+    body = {'k': 5, 'text': 'xe máy', 'ids': [1, 2]}
+    assert client.post('/echo', data=dumps(body), content_type='application/json').get_json() == body
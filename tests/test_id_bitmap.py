@@ -0,0 +1,64 @@
+import numpy as np
+import faiss
+
+from utils.id_bitmap import IdBitmap
+
+N = 61  # không chia hết cho 8 -> có bit thừa ở byte cuối
+
+
+def _sets():
+    rng = np.random.default_rng(0)
+    a = rng.choice(N, 20, replace=False)
+    b = rng.choice(N, 25, replace=False)
+    return a, b
+
+
+def test_set_ops_match_python_sets():
+    a, b = _sets()
+    A, B = IdBitmap.from_ids(a, N), IdBitmap.from_ids(b, N)
+    assert (A & B).to_ids().tolist() == sorted(set(a) & set(b))
+    assert (A | B).to_ids().tolist() == sorted(set(a) | set(b))
+    assert (~A).to_ids().tolist() == sorted(set(range(N)) - set(a))
+
+
+def test_invert_clears_tail_bits():
+    empty = IdBitmap.from_ids([], N)
+    full = ~empty
+    assert full.count() == N and full.is_full()
+    assert int(full.bits[-1]) == (1 << (N % 8)) - 1
+    assert (~full).count() == 0
+
+
+def test_from_ids_ignores_out_of_range():
+    bm = IdBitmap.from_ids([-1, 0, 5, N, N + 10, 5], N)
+    assert bm.to_ids().tolist() == [0, 5]
+    assert len(bm) == 2
+
+
+def test_contains():
+    a, _ = _sets()
+    bm = IdBitmap.from_ids(a, N)
+    probe = np.arange(-3, N + 3)
+    assert probe[bm.contains(probe)].tolist() == sorted(a)
+
+
+def test_slice_reindexes_from_zero():
+    a, _ = _sets()
+    bm = IdBitmap.from_ids(a, N)
+    for start, stop in ((0, N), (8, 40), (3, 29), (16, 61), (50, 100)):
+        sub = bm.slice(start, stop)
+        expected = [int(i) - start for i in sorted(a) if start <= i < min(stop, N)]
+        assert sub.n == max(0, min(stop, N) - start)
+        assert sub.to_ids().tolist() == expected
+        assert sub.count() == len(expected)
+
+
+def test_selector_filters_faiss_search():
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal((N, 8)).astype(np.float32)
+    index = faiss.IndexFlatIP(8)
+    index.add(x)
+    a, _ = _sets()
+    bm = IdBitmap.from_ids(a, N)
+    _, ids = index.search(x[:3], 10, params=faiss.SearchParameters(sel=bm.selector()))
+    assert set(ids.ravel().tolist()) <= set(a.tolist())
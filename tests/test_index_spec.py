@@ -0,0 +1,196 @@
+import faiss
+import numpy as np
+import pytest
+
+from utils.index_spec import DEFAULT_SPEC, INDEX_TYPES, exact_subset_search, factory_string, infer_spec, \
+    make_search_params, range_search_topk, threshold_results
+
+
+def _data(n=200, d=16, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((n, d)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    feats = rng.standard_normal((3, d)).astype(np.float32)
+    feats /= np.linalg.norm(feats, axis=1, keepdims=True)
+    return matrix, feats
+
+
+def _spec(**kwargs):
+    return dict(DEFAULT_SPEC, **kwargs)
+
+
+# ----------------- Spec -----------------
+def test_factory_string():
+    assert factory_string(_spec(type='flat')) == 'Flat'
+    assert factory_string(_spec(type='ivf_flat', nlist=8)) == 'IVF8,Flat'
+    assert factory_string(_spec(type='ivf_pq', nlist=8, pq_m=4, pq_nbits=6)) == 'IVF8,PQ4x6'
+    assert factory_string(_spec(type='hnsw', hnsw_m=16)) == 'HNSW16,Flat'
+    assert factory_string(_spec(type='sq8')) == 'SQ8'
+    assert factory_string(_spec(type='sq_fp16')) == 'SQfp16'
+    with pytest.raises(ValueError):
+        factory_string(_spec(type='lsh'))
+
+
+@pytest.mark.parametrize('kind', INDEX_TYPES)
+def test_infer_spec_round_trip(kind):
+    matrix, _ = _data(n=300)
+    spec = _spec(type=kind, nlist=4, pq_m=4, pq_nbits=4, hnsw_m=8)
+    index = faiss.index_factory(matrix.shape[1], factory_string(spec), faiss.METRIC_INNER_PRODUCT)
+    index.train(matrix)
+    index.add(matrix)
+    inferred = infer_spec(index)
+    assert inferred['type'] == kind
+    assert factory_string(dict(inferred, pq_m=4, pq_nbits=4, hnsw_m=8)) == factory_string(spec)
+    assert (inferred['dim'], inferred['ntotal']) == (matrix.shape[1], 300)
+
+
+def test_make_search_params():
+    sel = faiss.IDSelectorRange(0, 10)
+    assert make_search_params(_spec(type='flat')) is None
+    assert make_search_params(_spec(type='sq8'), sel=sel).sel is not None
+    ivf = make_search_params(_spec(type='ivf_pq', nprobe=7))
+    assert isinstance(ivf, faiss.SearchParametersIVF) and ivf.nprobe == 7
+    assert make_search_params(_spec(type='ivf_flat', nprobe=7), nprobe=3).nprobe == 3
+    hnsw = make_search_params(_spec(type='hnsw', ef_search=50), sel=sel, ef_search=80)
+    assert isinstance(hnsw, faiss.SearchParametersHNSW) and hnsw.efSearch == 80 and hnsw.sel is not None
+
+
+def _brute(matrix, feats, ids, k):
+    sims = feats @ matrix[ids].T
+    order = np.argsort(-sims, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(sims, order, axis=1), ids[order]
+
+
+@pytest.mark.parametrize('k', [1, 5, 29])
+def test_exact_subset_search_matches_brute_force(k):
+    matrix, feats = _data()
+    ids = np.random.default_rng(1).choice(len(matrix), 30, replace=False)
+    scores, out = exact_subset_search(feats, matrix, ids, k)
+    ref_scores, ref_ids = _brute(matrix, feats, ids, k)
+    np.testing.assert_array_equal(out, ref_ids)
+    np.testing.assert_allclose(scores, ref_scores, rtol=1e-6)
+    assert (np.diff(scores, axis=1) <= 0).all()
+
+
+def test_exact_subset_search_k_larger_than_subset():
+    matrix, feats = _data()
+    ids = np.array([5, 17, 3])
+    scores, out = exact_subset_search(feats, matrix, ids, 50)
+    assert out.shape == (3, 3)
+    assert all(sorted(row) == [3, 5, 17] for row in out.tolist())
+    np.testing.assert_array_equal(out, _brute(matrix, feats, ids, 3)[1])
+
+
+def test_exact_subset_search_drops_out_of_range_ids():
+    matrix, feats = _data()
+    scores, out = exact_subset_search(feats, matrix, np.array([-1, 4, 200, 999, 7]), 10)
+    assert out.shape == (3, 2) and set(out.ravel().tolist()) == {4, 7}
+    scores, out = exact_subset_search(feats, matrix, np.array([-5, 200]), 10)
+    assert scores.shape == (3, 0) and out.shape == (3, 0) and out.dtype == np.int64
+
+
+def test_exact_subset_search_float16_matrix():
+    matrix, feats = _data()
+    ids = np.arange(0, 200, 3)
+    _, out = exact_subset_search(feats, matrix.astype(np.float16), ids, 5)
+    assert out.shape == (3, 5) and np.isin(out, ids).all()
+
+
+# ----------------- Range search -----------------
+class _Spy:
+    """Bọc index, đếm số query đi qua search / range_search."""
+
+    def __init__(self, index):
+        self.index = index
+        self.ntotal = index.ntotal
+        self.searched = 0
+        self.ranged = 0
+
+    def search(self, feats, k, params=None):
+        self.searched += len(feats)
+        return self.index.search(feats, k, params=params)
+
+    def range_search(self, feats, radius, params=None):
+        self.ranged += len(feats)
+        return self.index.range_search(feats, radius, params=params)
+
+
+def _flat(matrix):
+    index = faiss.IndexFlatIP(matrix.shape[1])
+    index.add(matrix)
+    return index
+
+
+def _range_brute(matrix, feats, min_score, cap, allowed=None):
+    sims = feats @ matrix.T
+    out = []
+    for row in sims:
+        order = np.argsort(-row, kind='stable')
+        if allowed is not None:
+            order = order[np.isin(order, allowed)]
+        order = order[row[order] >= min_score][:cap]
+        out.append(order.tolist())
+    return out
+
+
+def _rows(ids):
+    return [row[row >= 0].tolist() for row in ids]
+
+
+def test_threshold_results():
+    scores = np.array([[0.9, 0.5, 0.2], [0.4, 0.3, 0.1], [0.8, 0.7, 0.6]], dtype=np.float32)
+    ids = np.array([[1, 2, 3], [4, 5, 6], [7, -1, 9]])
+    out_scores, out_ids = threshold_results(scores, ids, 0.45)
+    assert out_ids.tolist() == [[1, 2], [-1, -1], [7, -1]]
+    np.testing.assert_allclose(out_scores[0], [0.9, 0.5])
+    assert threshold_results(scores, ids, 2.0)[1].shape == (3, 0)
+
+
+def test_range_search_topk_uses_range_search_below_cap():
+    matrix, feats = _data(n=500)
+    spy = _Spy(_flat(matrix))
+    scores, ids = range_search_topk(spy, feats, 0.45, 50)
+    assert _rows(ids) == _range_brute(matrix, feats, 0.45, 50)
+    assert (scores[ids >= 0] >= 0.45).all()
+    assert spy.ranged == len(feats) and spy.searched == 0
+
+
+def test_range_search_topk_falls_back_only_for_queries_over_cap():
+    matrix, feats = _data(n=500)
+    feats = np.concatenate([feats, matrix[:1]])                # query cuối trùng vector 0
+    spy = _Spy(_flat(matrix))
+    min_score, cap = 0.55, 5
+    counts = ((feats @ matrix.T) >= min_score).sum(axis=1)
+    scores, ids = range_search_topk(spy, feats, min_score, cap, query_batch=2)
+    assert _rows(ids) == _range_brute(matrix, feats, min_score, cap)
+    assert 0 < int((counts > cap).sum()) < len(feats)
+    assert spy.searched == int((counts > cap).sum())
+    assert ids.shape[1] <= cap
+
+
+def test_range_search_topk_with_selector_and_ivf():
+    matrix, feats = _data(n=600)
+    index = faiss.index_factory(matrix.shape[1], 'IVF8,Flat', faiss.METRIC_INNER_PRODUCT)
+    index.train(matrix)
+    index.add(matrix)
+    allowed = np.arange(0, 600, 2)
+    mask = np.zeros(600, dtype=bool)
+    mask[allowed] = True
+    bits = np.packbits(mask, bitorder='little')
+    params = faiss.SearchParametersIVF(sel=faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits)), nprobe=8)
+    _, ids = range_search_topk(index, feats, 0.4, 20, params=params)
+    assert _rows(ids) == _range_brute(matrix, feats, 0.4, 20, allowed)
+
+
+def test_range_search_topk_hnsw_uses_search():
+    matrix, feats = _data(n=300)
+    index = faiss.IndexHNSWFlat(matrix.shape[1], 16, faiss.METRIC_INNER_PRODUCT)
+    index.add(matrix)
+    scores, ids = range_search_topk(index, feats, 0.4, 10)
+    assert ids.shape[1] <= 10 and (scores[ids >= 0] >= 0.4).all()
+
+
+def test_range_search_topk_no_hits():
+    matrix, feats = _data()
+    scores, ids = range_search_topk(_flat(matrix), feats, 5.0, 10)
+    assert scores.shape == (3, 0) and ids.shape == (3, 0)
@@ -0,0 +1,75 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from utils.keyframe_store import KeyframeStore, store_path_for
+
+
+def _id2img():
+    data = {}
+    for i in range(40):
+        if i in (7, 8):             # id bị thiếu (lỗ)
+            continue
+        video, shot = divmod(i, 10)
+        data[str(i)] = {'image_path': f'Keyframes_L01/keyframes/L01_V{video:03d}/{i * 25:06d}.jpg',
+                        'scene_idx': f'L01/V{video:03d}/lst_shot/{shot // 3}', 'sec': i * 1.5, 'frame_idx': i * 25}
+    data['3'].update(sec=None, frame_idx=None)
+    data['12']['image_path'] = 'Keyframes_L01/keyframes/L01_V001/ảnh có dấu.jpg'
+    data['45'] = {'image_path': 'extra/x.jpg', 'scene_idx': None, 'sec': 0.0, 'frame_idx': 0}
+    return data
+
+
+@pytest.fixture
+def json_path(tmp_path):
+    path = tmp_path / 'id2img_fps.json'
+    path.write_text(json.dumps(_id2img(), ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_save_load_round_trip(json_path, tmp_path, mmap):
+    source = _id2img()
+    store_path = str(tmp_path / 'id2img_fps.kfstore')
+    KeyframeStore.from_json(json_path).save(store_path)
+    store = KeyframeStore.load(store_path, mmap=mmap)
+
+    assert len(store) == len(source) and store.n == 46
+    assert sorted(store.keys()) == sorted(int(k) for k in source)
+    for key, info in source.items():
+        assert store[key] == info
+    for missing in (7, 8, 40, -1, 46):
+        assert missing not in store
+        assert store.get(missing) is None
+    with pytest.raises(KeyError):
+        store[7]
+
+
+def test_vectorized_accessors(json_path):
+    source = _id2img()
+    store = KeyframeStore.from_json(json_path)
+    ids = np.array([0, 3, 7, 12, 45, 100])
+    assert store.contains(ids).tolist() == [True, True, False, True, True, False]
+    assert store.secs(ids) == [source.get(str(i), {}).get('sec') for i in ids.tolist()]
+    assert store.frame_numbers(ids) == [source.get(str(i), {}).get('frame_idx') for i in ids.tolist()]
+    ok = ids[store.contains(ids)]
+    assert store.paths(ok) == [source[str(i)]['image_path'] for i in ok.tolist()]
+    assert store.path_index()[source['12']['image_path']] == 12
+
+
+def test_open_rebuilds_when_json_changes(json_path):
+    store = KeyframeStore.open(json_path)
+    assert os.path.exists(store_path_for(json_path))
+    assert isinstance(store.valid, np.memmap)
+    assert 40 not in store
+
+    data = _id2img()
+    data['40'] = {'image_path': 'new.jpg', 'scene_idx': 'L01/V004/lst_shot/0', 'sec': 1.0, 'frame_idx': 1}
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.utime(json_path, ns=(0, 10 ** 18))    # mtime chắc chắn khác lần trước
+
+    reopened = KeyframeStore.open(json_path)
+    assert reopened[40] == data['40']
+    assert KeyframeStore.open(json_path)[40] == data['40']
@@ -0,0 +1,57 @@
+import os
+
+from utils.media_catalog import MediaCatalog
+
+
+def _touch(path, data=b'x'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _dirs(tmp_path):
+    video_dir, keyframes_dir = str(tmp_path / 'videos'), str(tmp_path / 'keyframes')
+    _touch(os.path.join(video_dir, 'L01_V001.mp4'))
+    _touch(os.path.join(video_dir, 'V002.mkv'))
+    _touch(os.path.join(keyframes_dir, 'L01_V001', '000010.jpg'))
+    return video_dir, keyframes_dir, str(tmp_path / 'media_catalog.json.gz')
+
+
+def test_open_resolves_full_and_short_names(tmp_path):
+    video_dir, keyframes_dir, path = _dirs(tmp_path)
+    catalog = MediaCatalog.open(video_dir, keyframes_dir, path=path, probe=False)
+    assert catalog.video('L01_V001')['path'] == os.path.join(video_dir, 'L01_V001.mp4')
+    assert catalog.video('L02_V002')['file'] == 'V002.mkv'
+    assert catalog.video('L09_V009') is None
+    assert catalog.keyframe_files('/L01_V001/') == ['000010.jpg']
+    assert MediaCatalog(video_dir, keyframes_dir, path=path, probe=False).load()
+
+
+def test_video_added_after_build_is_found_on_disk(tmp_path):
+    video_dir, keyframes_dir, path = _dirs(tmp_path)
+    catalog = MediaCatalog.open(video_dir, keyframes_dir, path=path, probe=False)
+    _touch(os.path.join(video_dir, 'L03_V007.webm'), b'abc')
+    info = catalog.video('L03_V007')
+    assert info['file'] == 'L03_V007.webm' and info['size'] == 3
+    assert 'L03_V007' in catalog.videos
+
+
+def test_other_worker_refresh_is_picked_up(tmp_path):
+    video_dir, keyframes_dir, path = _dirs(tmp_path)
+    worker_a = MediaCatalog.open(video_dir, keyframes_dir, path=path, probe=False, check_interval=0)
+    worker_b = MediaCatalog.open(video_dir, keyframes_dir, path=path, probe=False, check_interval=0)
+
+    _touch(os.path.join(keyframes_dir, 'L01_V002', '000001.jpg'))
+    assert worker_b.keyframe_files('L01_V002') == []
+    worker_a.refresh()
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))   # mtime chắc chắn khác bản worker_b đã đọc
+    assert worker_b.keyframe_files('L01_V002') == ['000001.jpg']
+
+
+def test_refresh_without_wait_skips_when_busy(tmp_path):
+    video_dir, keyframes_dir, path = _dirs(tmp_path)
+    catalog = MediaCatalog.open(video_dir, keyframes_dir, path=path, probe=False)
+    with catalog._refresh_lock:
+        assert catalog.refresh(wait=False) is None
+    assert catalog.refresh(wait=False) is catalog
+    assert catalog.age() is not None and catalog.age() < 60
@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+
+from utils import result_cache
+from utils.result_cache import ResultCache, request_key
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expires_entries(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(result_cache.time, 'monotonic', clock)
+    cache = ResultCache(ttl=10)
+    assert cache.get_or_compute('a', lambda: b'1') == (b'1', 'miss')
+    clock.now += 9
+    assert cache.get_or_compute('a', lambda: b'2') == (b'1', 'hit')
+    clock.now += 2
+    assert cache.get_or_compute('a', lambda: b'3') == (b'3', 'miss')
+
+
+def test_byte_limit_and_lru():
+    cache = ResultCache(max_items=10, max_bytes=10)
+    cache.get_or_compute('a', lambda: b'x' * 4)
+    cache.get_or_compute('b', lambda: b'x' * 4)
+    cache.get_or_compute('a', lambda: b'')               # 'a' thành mới dùng nhất
+    cache.get_or_compute('c', lambda: b'x' * 4)          # vượt 10 byte -> bỏ 'b'
+    assert cache.stats()['bytes'] == 8
+    assert cache.get_or_compute('b', lambda: b'new')[1] == 'miss'
+    assert cache.get_or_compute('huge', lambda: b'x' * 11)[1] == 'miss'
+    assert cache.get_or_compute('huge', lambda: b'')[1] == 'miss'        # lớn hơn max_bytes: không lưu
+
+
+def test_max_items_zero_only_dedupes():
+    cache = ResultCache(max_items=0)
+    cache.get_or_compute('a', lambda: b'1')
+    assert cache.get_or_compute('a', lambda: b'2') == (b'2', 'miss')
+
+
+def test_sizeof_and_cacheable():
+    cache = ResultCache(max_bytes=100, sizeof=lambda value: len(value[2]))
+    not_ok = lambda value: value[0] == 200
+    assert cache.get_or_compute('err', lambda: (500, [], b'boom'), cacheable=not_ok)[1] == 'miss'
+    assert cache.get_or_compute('err', lambda: (200, [], b'ok'), cacheable=not_ok)[1] == 'miss'
+    assert cache.get_or_compute('err', lambda: (200, [], b'other'), cacheable=not_ok) == ((200, [], b'ok'), 'hit')
+    assert cache.stats()['bytes'] == 2
+
+
+def _concurrent(cache, compute, n=4):
+    """Leader chạy compute (chờ đến khi mọi follower đã vào hàng), trả list (value | lỗi, status)."""
+    results, started = [], threading.Event()
+
+    def leader_compute():
+        started.set()
+        while cache.stats()['waits'] < n - 1:
+            pass
+        return compute()
+
+    def run(fn):
+        try:
+            results.append(cache.get_or_compute('k', fn))
+        except Exception as e:
+            results.append((e, 'error'))
+
+    leader = threading.Thread(target=run, args=(leader_compute,))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=run, args=(lambda: pytest.fail('follower không được tính lại'),))
+                 for _ in range(n - 1)]
+    for t in followers:
+        t.start()
+    for t in [leader] + followers:
+        t.join(5)
+    return results
+
+
+def test_singleflight_shares_value():
+    cache = ResultCache()
+    results = _concurrent(cache, lambda: b'value')
+    assert sorted(status for _, status in results) == ['miss', 'wait', 'wait', 'wait']
+    assert {value for value, _ in results} == {b'value'}
+
+
+def test_singleflight_propagates_error_and_does_not_cache():
+    cache = ResultCache()
+    error = RuntimeError('boom')
+
+    def fail():
+        raise error
+
+    results = _concurrent(cache, fail)
+    assert [value for value, _ in results] == [error] * 4
+    assert cache.stats()['size'] == 0 and cache.stats()['inflight'] == 0
+    assert cache.get_or_compute('k', lambda: b'ok') == (b'ok', 'miss')
+
+
+def test_request_key_normalization():
+    base = {'textquery': 'a  dog\trunning ', 'k': 100, 'search_space': 0, 'filter': True, 'id': [3, 1, 2]}
+    same = {'id': '1,2,3,3', 'filter': True, 'search_space': '0', 'k': '100', 'textquery': 'a dog running'}
+    assert request_key('/textsearch', base) == request_key('/textsearch', same)
+    assert request_key('/textsearch', base) == request_key('/textsearch', dict(base, k=100.0))
+    assert request_key('/textsearch', base) != request_key('/textsearch', dict(base, k=101))
+    assert request_key('/textsearch', base) != request_key('/textsearch', dict(base, min_score=0.25))
+    assert request_key('/textsearch', base) != request_key('/imgsearch', base)
+    assert request_key('/textsearch', base, 'v1') != request_key('/textsearch', base, 'v2')
+
+
+def test_request_key_ignores_unused_id_sets():
+    base = {'textquery': 'x', 'k': 10}
+    assert request_key('/t', base) == request_key('/t', dict(base, filter=False, id=[1, 2]))
+    assert request_key('/t', base) == request_key('/t', dict(base, ignore=False, ignore_idxs=[5]))
+    assert request_key('/t', base) != request_key('/t', dict(base, ignore=True, ignore_idxs=[5]))
+
+
+def test_clear_bumps_shared_generation(tmp_path):
+    path = str(tmp_path / 'cache' / 'result_cache.generation')
+    worker_a = ResultCache(generation_path=path)
+    worker_b = ResultCache(generation_path=path)
+    assert worker_a.generation() == worker_b.generation() == 0
+
+    key_b = request_key('/t', {'k': 1}, extra=(worker_b.generation(),))
+    worker_b.get_or_compute(key_b, lambda: b'old')
+    worker_a.clear()
+    assert worker_b.generation() != 0
+    new_key_b = request_key('/t', {'k': 1}, extra=(worker_b.generation(),))
+    assert new_key_b != key_b
+    assert worker_b.get_or_compute(new_key_b, lambda: b'new') == (b'new', 'miss')
+
+    generation = worker_a.generation()
+    worker_b.clear()
+    assert worker_a.generation() != generation
+    assert ResultCache().generation() == 0
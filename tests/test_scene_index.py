@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from utils.keyframe_store import KeyframeStore
+from utils.scene_index import SceneIndex
+
+
+def _data(seed=0):
+    """id2img_fps + scene_id2info giả: 2 collection, mỗi video vài shot, vài keyframe mỗi shot."""
+    rng = np.random.default_rng(seed)
+    id2img, scene, i = {}, {}, 0
+    for lxx in ('L01', 'L02'):
+        for v in range(3):
+            vxxx = f'V{v:03d}'
+            video = scene.setdefault(lxx, {}).setdefault(vxxx, {'video_metadata': {'watch_url': f'https://yt/{lxx}{vxxx}'},
+                                                                 'lst_shot': {}})
+            for s in range(int(rng.integers(3, 8))):
+                shot = video['lst_shot'][str(s)] = {'shot_range': [s * 100, s * 100 + 99], 'shot_time': [s * 4.0, s * 4.0 + 3.96],
+                                                    'lst_keyframe_paths': [], 'lst_keyframe_idxs': []}
+                for f in range(int(rng.integers(1, 4))):
+                    path = f'Keyframes_{lxx}/keyframes/{lxx}_{vxxx}/{s * 100 + f * 10:06d}.jpg'
+                    shot['lst_keyframe_paths'].append(path)
+                    shot['lst_keyframe_idxs'].append(i)
+                    id2img[str(i)] = {'image_path': path, 'sec': s * 4.0 + f, 'frame_idx': s * 100 + f * 10,
+                                      'scene_idx': f'{lxx}/{vxxx}/lst_shot/{s}'}
+                    i += 1
+    return id2img, scene
+
+
+def _old_neighbours(id2img, scene, ids, lo, hi):
+    """Logic cũ trên dict: keyframe của shot s + lo .. s + hi trong cùng video."""
+    out = set()
+    for idx in ids:
+        lxx, vxxx, group, s = id2img[str(idx)]['scene_idx'].split('/')
+        shots = scene[lxx][vxxx][group]
+        for t in range(int(s) + lo, int(s) + hi + 1):
+            if str(t) in shots:
+                out.update(shots[str(t)]['lst_keyframe_idxs'])
+    return sorted(out)
+
+
+@pytest.fixture
+def scenes():
+    id2img, scene = _data()
+    store = KeyframeStore.from_dict(id2img)
+    return id2img, scene, SceneIndex.from_dict(scene, store)
+
+
+def test_neighbour_and_same_shot_ids_match_dict_logic(scenes):
+    id2img, scene, index = scenes
+    rng = np.random.default_rng(1)
+    n = len(id2img)
+    for _ in range(50):
+        ids = rng.integers(0, n, 6)
+        N = int(rng.integers(1, 5))
+        assert index.neighbour_ids(ids, 1, N).tolist() == _old_neighbours(id2img, scene, ids, 1, N)
+        assert index.neighbour_ids(ids, -N, -1).tolist() == _old_neighbours(id2img, scene, ids, -N, -1)
+        assert index.same_shot_ids(ids).tolist() == _old_neighbours(id2img, scene, ids, 0, 0)
+
+
+def test_shot_lookup(scenes):
+    id2img, scene, index = scenes
+    for idx in (0, 7, len(id2img) - 1):
+        lxx, vxxx, group, s = id2img[str(idx)]['scene_idx'].split('/')
+        g = int(index.shot_of(idx)[0])
+        shot = scene[lxx][vxxx][group][s]
+        assert index.shot_keyframes(g).tolist() == shot['lst_keyframe_idxs']
+        assert index.shot_times[g] == shot['shot_time']
+        assert index.shot_range(g) == shot['shot_range']
+        v = int(index.video_of_shot[g])
+        assert (index.collections[v], index.video_names[v]) == (lxx, vxxx)
+        assert index.watch_urls[v] == scene[lxx][vxxx]['video_metadata']['watch_url']
+        first, stop = index.video_shot_range(g)
+        assert stop - first == len(scene[lxx][vxxx][group])
+    assert index.shot_of([-1, len(id2img) + 5]).tolist() == [-1, -1]
+
+
+def test_keyframes_missing_from_store_keep_their_paths():
+    id2img, scene = _data()
+    shot = scene['L01']['V001']['lst_shot']['0']
+    dropped = shot['lst_keyframe_idxs'][0]
+    del id2img[str(dropped)]
+    index = SceneIndex.from_dict(scene, KeyframeStore.from_dict(id2img))
+
+    g = int(index.shot_offsets[index.video_keys.index('L01/V001/lst_shot')])     # shot 0 của L01/V001
+    assert dropped not in index.shot_keyframes(g).tolist()
+    assert index.missing_keyframe_paths(g) == [shot['lst_keyframe_paths'][0]]
+    assert sum(len(p) for p in index.missing_paths.values()) == 1
@@ -0,0 +1,63 @@
+import numpy as np
+import faiss
+import pytest
+
+from utils.id_bitmap import IdBitmap
+from utils.index_spec import DEFAULT_SPEC
+from utils.sharded_index import IndexShard, ShardedIndex
+
+
+def _feats(n, d=16, seed=0):
+    x = np.random.default_rng(seed).standard_normal((n, d)).astype(np.float32)
+    faiss.normalize_L2(x)
+    return x
+
+
+@pytest.fixture
+def data():
+    base = _feats(300)
+    queries = _feats(5, seed=1)
+    shards, offset = [], 0
+    for name, n in (('L01', 120), ('L02', 80), ('L03', 100)):
+        index = faiss.IndexFlatIP(base.shape[1])
+        index.add(base[offset:offset + n])
+        shards.append(IndexShard(name, index, offset))
+        offset += n
+    single = faiss.IndexFlatIP(base.shape[1])
+    single.add(base)
+    return ShardedIndex(shards, dict(DEFAULT_SPEC), workers=3), single, base, queries
+
+
+def test_search_matches_single_index(data):
+    sharded, single, _, queries = data
+    scores, ids = sharded.search(queries, 20)
+    ref_scores, ref_ids = single.search(queries, 20)
+    np.testing.assert_array_equal(ids, ref_ids)
+    np.testing.assert_allclose(scores, ref_scores, rtol=1e-5)
+
+
+def test_search_subset_skips_other_shards(data):
+    sharded, _, base, queries = data
+    subset_ids = np.array([3, 50, 121, 150, 299, 250], dtype=np.int64)
+    scores, ids = sharded.search(queries, 4, subset=IdBitmap.from_ids(subset_ids, sharded.ntotal))
+    brute = queries @ base[subset_ids].T
+    expected = subset_ids[np.argsort(-brute, axis=1, kind='stable')[:, :4]]
+    np.testing.assert_array_equal(ids, expected)
+
+
+def test_range_search_matches_brute_force(data):
+    sharded, _, base, queries = data
+    min_score, cap = 0.2, 15
+    scores, ids = sharded.range_search(queries, min_score, cap)
+    brute = queries @ base.T
+    for q in range(len(queries)):
+        order = np.argsort(-brute[q], kind='stable')[:cap]
+        expected = order[brute[q][order] >= min_score]
+        assert ids[q][ids[q] >= 0].tolist() == expected.tolist()
+        assert (scores[q][ids[q] >= 0] >= min_score).all()
+
+
+def test_reconstruct_batch_across_shards(data):
+    sharded, _, base, _ = data
+    ids = np.array([0, 119, 120, 199, 200, 299])
+    np.testing.assert_allclose(sharded.reconstruct_batch(ids), base[ids])
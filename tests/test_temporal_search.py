@@ -0,0 +1,79 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from utils.temporal_search import ShotTimeline, parse_gaps
+
+
+def _store(n_videos=3, shots_per_video=(6, 4, 5), kf_per_shot=3):
+    video, shot = [], []
+    for v in range(n_videos):
+        for s in range(shots_per_video[v]):
+            video += [v] * kf_per_shot
+            shot += [s] * kf_per_shot
+    n = len(video) + 2
+    video += [-1, -1]                   # keyframe không thuộc video nào
+    shot += [-1, -1]
+    return SimpleNamespace(n=n, valid=np.ones(n, dtype=bool), video=np.array(video), shot=np.array(shot),
+                           video_keys=[f'L01/V{v:03d}/lst_shot' for v in range(n_videos)])
+
+
+def _brute_force(store, step_results, gaps, top):
+    """Duyệt mọi tổ hợp keyframe; giữ chuỗi tốt nhất cho mỗi shot cuối."""
+    best = {}
+    cands = [list(zip(np.asarray(ids).tolist(), np.asarray(scores).tolist())) for scores, ids in step_results]
+    for chain in itertools.product(*cands):
+        ids = [i for i, _ in chain]
+        if any(store.video[i] < 0 for i in ids) or len({int(store.video[i]) for i in ids}) != 1:
+            continue
+        shots = [int(store.shot[i]) for i in ids]
+        if not all(lo <= b - a <= hi for (a, b), (lo, hi) in zip(zip(shots, shots[1:]), gaps)):
+            continue
+        total = float(np.float32(sum(np.float32(s) for _, s in chain)))
+        end = (int(store.video[ids[-1]]), shots[-1])
+        best[end] = max(best.get(end, -np.inf), total)
+    return sorted(best.values(), reverse=True)[:top]
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('gaps', [[(1, 2)], [(1, 1), (1, 3)], [(2, 4), (1, 2)]])
+def test_search_matches_brute_force(seed, gaps):
+    store = _store()
+    timeline = ShotTimeline(store)
+    rng = np.random.default_rng(seed)
+    step_results = []
+    for _ in range(len(gaps) + 1):
+        ids = rng.choice(store.n, 12, replace=False)
+        step_results.append((rng.random(12).astype(np.float32), ids))
+    top = 6
+
+    totals, seq_ids, seq_scores = timeline.search(step_results, gaps, top=top)
+    np.testing.assert_allclose(totals, _brute_force(store, step_results, gaps, top), rtol=1e-6)
+    for total, ids, scores in zip(totals, seq_ids, seq_scores):
+        assert len({int(store.video[i]) for i in ids}) == 1
+        shots = store.shot[ids]
+        assert all(lo <= b - a <= hi for (a, b), (lo, hi) in zip(zip(shots, shots[1:]), gaps))
+        assert scores.sum() == pytest.approx(total, rel=1e-6)
+
+
+def test_search_without_match_is_empty():
+    store = _store()
+    timeline = ShotTimeline(store)
+    # bước sau chỉ có ở video khác
+    totals, ids, scores = timeline.search([(np.ones(1), np.array([0])), (np.ones(1), np.array([20]))], [(1, 3)])
+    assert totals.shape == (0,) and ids.shape == (0, 2) and scores.shape == (0, 2)
+
+
+def test_parse_gaps():
+    assert parse_gaps(None, 3, default_max_gap=4) == [(1, 4), (1, 4)]
+    assert parse_gaps(3, 2) == [(1, 3)]
+    assert parse_gaps('2', 2) == [(1, 2)]
+    assert parse_gaps([2, [3, 5]], 3) == [(1, 2), (3, 5)]
+
+
+@pytest.mark.parametrize('gaps, n_steps', [([1, 2], 2), ([[0, 3]], 2), ([[3, 2]], 2), (0, 2)])
+def test_parse_gaps_rejects_invalid(gaps, n_steps):
+    with pytest.raises(ValueError):
+        parse_gaps(gaps, n_steps)
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from utils.thumbnail_cache import ThumbnailCache, snap_size
+
+
+class _FakeRender(ThumbnailCache):
+    """Không cần cv2: render trả bytes giả và đếm số lần gọi."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.renders = 0
+
+    def render(self, src_path, size):
+        self.renders += 1
+        time.sleep(0.05)
+        return f'{src_path}@{size}'.encode('utf-8')
+
+
+def _src(tmp_path, name='a.jpg'):
+    path = tmp_path / name
+    path.write_bytes(b'jpeg')
+    return str(path)
+
+
+def test_snap_size():
+    assert [snap_size(s) for s in (1, 160, 161, 640, 5000)] == [160, 160, 320, 640, 640]
+
+
+def test_concurrent_requests_render_once(tmp_path):
+    cache = _FakeRender(str(tmp_path / 'cache'))
+    src = _src(tmp_path)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(src, 320))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert cache.renders == 1
+    assert len({data for data, _ in results}) == 1 and len({tag for _, tag in results}) == 1
+    assert cache._key_locks == {}
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    src = _src(tmp_path)
+    first = _FakeRender(str(tmp_path / 'cache'), memory_items=0)
+    data, tag = first.get(src, 160)
+    second = _FakeRender(str(tmp_path / 'cache'), memory_items=0)
+    assert second.get(src, 160) == (data, tag)
+    assert second.renders == 0 and second.stats()['hits']['disk'] == 1
+
+
+def test_disk_eviction(tmp_path):
+    cache = _FakeRender(str(tmp_path / 'cache'), max_bytes=1, memory_items=0)
+    for name in ('a.jpg', 'b.jpg', 'c.jpg'):
+        cache.get(_src(tmp_path, name), 160)
+    assert cache.stats()['disk_items'] == 1
@@ -0,0 +1,432 @@
+"""
+Thêm một đợt video mới vào dữ liệu đã build, không chạy lại create_bin / data_preparation / fit TF-IDF.
+
+Ví dụ:
+    python -m utils.append_videos --collection L25 --clip-features ./CLIP_features --clipv2-features ./clip-features-32
+    python -m utils.append_videos --videos L25_V001 L25_V002 --clip-features ./CLIP_features --clipv2-features ./clip-features-32 --dry-run
+
+Mỗi video đọc keyframes, SceneJSON, map_keyframes, metadata, fps.json giống data_preparation.ipynb; id mới nối tiếp
+id cuối. Context (object / ocr / audio) được transform bằng vectorizer TF-IDF đã fit (từ mới ngoài vocabulary bị bỏ qua,
+IDF giữ nguyên; muốn cập nhật vocabulary thì build lại toàn bộ) rồi nối thêm hàng vào sparse matrix.
+Kiểm tra hết trước khi ghi; mỗi file ghi atomic, manifest (utils.data_manifest) ghi sau cùng với version mới.
+"""
+import os
+import re
+import glob
+import json
+import pickle
+import argparse
+import faiss
+import numpy as np
+import pandas as pd
+from scipy import sparse as sp
+from utils.object_retrieval_engine.object_retrieval import load_file
+from utils.index_spec import load_index_spec
+from utils.build_index import build_index, shard_spec
+from utils.sharded_index import load_manifest as load_shard_manifest, save_manifest as save_shard_manifest, shard_path
+from utils.data_manifest import MANIFEST_PATH, default_artifacts, load_manifest, save_manifest, build_manifest, check_manifest
+
+# data_type -> (glob thư mục context, định dạng, thư mục chứa tfidf pkl + sparse npz)
+SPARSE_SOURCES = {
+    'bbox': ('dict/context_encoded/bboxes_encoded/*', 'txt', 'dict/bin/contexts_bin'),
+    'class': ('dict/context_encoded/classes_encoded/*', 'txt', 'dict/bin/contexts_bin'),
+    'color': ('dict/context_encoded/colors_encoded/*', 'txt', 'dict/bin/contexts_bin'),
+    'tag': ('dict/context_encoded/tags_encoded/*', 'txt', 'dict/bin/contexts_bin'),
+    'number': ('dict/context_encoded/number_encoded/*', 'txt', 'dict/bin/contexts_bin'),
+    'ocr': ('dict/ocr/*', 'json', 'dict/bin/ocr_bin'),
+}
+SPEECH_SOURCE = ('dict/audio/*', 'dict/bin/audio_bin')
+
+
+# ----------------- IO -----------------
+def read_json(path: str, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_json(path: str, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def write_npz(path: str, matrix):
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    sp.save_npz(tmp_path, matrix)
+    os.replace(tmp_path, path)
+
+
+def write_index(index, path: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def find_video_file(root: str, pattern: str, lxx: str, vxxx: str, ext: str):
+    """File context / feature của video: <pattern>/Lxx_Vxxx.<ext>, hoặc <pattern>/Vxxx.<ext> trong thư mục của Lxx."""
+    for path in sorted(glob.glob(os.path.join(root, pattern, f'{lxx}_{vxxx}.{ext}'))):
+        return path
+    for path in sorted(glob.glob(os.path.join(root, pattern, f'{vxxx}.{ext}'))):
+        if os.path.basename(os.path.dirname(path)).startswith(lxx):
+            return path
+    return None
+
+
+def select_rows(rows, n_files: int, kept, what: str):
+    """Hàng theo từng file keyframe -> chỉ giữ keyframe được gán id (nằm trong một shot)."""
+    if len(rows) == n_files:
+        return [rows[i] for i in kept] if not isinstance(rows, np.ndarray) else rows[kept]
+    if len(rows) == len(kept):
+        return rows
+    raise ValueError(f"[append] {what}: {len(rows)} dòng, cần {n_files} (số keyframe) hoặc {len(kept)} (số keyframe có id)")
+
+
+# ----------------- Metadata (giống data_preparation.ipynb) -----------------
+def build_video_entries(root: str, args, lxx: str, vxxx: str, start_id: int, fps_dict: dict):
+    """Trả (scene_entry, id2img_rows, map_keyframes_entry, n_files, kept_positions) cho một video."""
+    video = f'{lxx}_{vxxx}'
+    scene_json = read_json(os.path.join(root, args.scene_root, lxx, f'{vxxx}.json'))
+    if not scene_json:
+        raise ValueError(f"[append] Không có SceneJSON cho {video}")
+    video_fps = float(fps_dict.get(video, 30.0))
+    scene_ranges = [list(map(int, r)) for r in scene_json]
+    scene_entry = {
+        'video_metadata': read_json(os.path.join(root, args.metadata_root, f'{video}.json'), {}),
+        'lst_shot': {
+            str(i): {
+                'shot_range': [s, e],
+                'shot_time': [s / video_fps, e / video_fps],
+                'lst_keyframe_paths': [],
+                'lst_keyframe_idxs': [],
+            }
+            for i, (s, e) in enumerate(scene_ranges)
+        },
+    }
+
+    mapper = None
+    mapper_path = os.path.join(root, args.map_keyframes_root, f'{video}.csv')
+    if os.path.exists(mapper_path):
+        mapper = pd.read_csv(mapper_path, index_col='n')
+    map_entry = {int(n): int(mapper.loc[n]['frame_idx']) for n in mapper.index.values} if mapper is not None else {}
+
+    video_dir = os.path.join(root, args.keyframes_root, video)
+    file_names = [name for name in os.listdir(video_dir) if os.path.splitext(name)[0].isdigit()]
+    file_names.sort(key=lambda name: int(os.path.splitext(name)[0]))
+
+    rows, kept, scene_track = [], [], 0
+    public_root = os.path.abspath(os.path.join(root, args.public_root))
+    for pos, file_name in enumerate(file_names):
+        n = int(os.path.splitext(file_name)[0])
+        if mapper is not None and n in mapper.index:
+            frame_idx = int(mapper.loc[n]['frame_idx'])
+            if 'pts_time' in mapper.columns:
+                sec = float(mapper.loc[n]['pts_time'])
+            else:
+                sec = frame_idx / float(mapper.loc[n].get('fps', video_fps))
+        else:
+            frame_idx = n
+            sec = frame_idx / video_fps
+
+        while scene_track < len(scene_ranges) and frame_idx > scene_ranges[scene_track][1]:
+            scene_track += 1
+        if scene_track >= len(scene_ranges):
+            continue
+
+        rel_path = os.path.abspath(os.path.join(video_dir, file_name)).replace(public_root, '').replace('\\', '/')
+        shot = scene_entry['lst_shot'][str(scene_track)]
+        shot['lst_keyframe_paths'].append(rel_path)
+        shot['lst_keyframe_idxs'].append(start_id + len(rows))
+        rows.append({
+            'image_path': rel_path,
+            'scene_idx': f'{lxx}/{vxxx}/lst_shot/{scene_track}',
+            'frame_idx': frame_idx,
+            'sec': sec,
+        })
+        kept.append(pos)
+    return scene_entry, rows, map_entry, len(file_names), kept
+
+
+def audio_to_keyframes(audio_shots, scene_info):
+    """audio segment -> list keyframe id của các shot giao với nó (như data_preparation.ipynb)."""
+    result_all, i = [], 0
+    for start, end in audio_shots:
+        result = []
+        while i < len(scene_info):
+            shot_interval = scene_info[str(i)]['shot_time']
+            if end <= shot_interval[0]:
+                break
+            if start >= shot_interval[1]:
+                i += 1
+                continue
+            result.extend(scene_info[str(i)]['lst_keyframe_idxs'])
+            if end > shot_interval[1]:
+                i += 1
+                start = shot_interval[1]
+            else:
+                break
+        result_all.append(result)
+    return result_all
+
+
+def keyframes_to_audio(audio_shots, scene_info, audio_offset: int):
+    """keyframe id -> 2 audio segment gần tâm shot nhất (id toàn cục)."""
+    pivots = np.array([(start + end) / 2 for start, end in audio_shots], dtype=np.float64)
+    result = {}
+    for shot in scene_info.values():
+        center = (shot['shot_time'][0] + shot['shot_time'][1]) / 2
+        nearest = sorted(np.abs(pivots - center).argsort()[:2].tolist())
+        for idx in shot['lst_keyframe_idxs']:
+            result[str(idx)] = [audio_offset + j for j in nearest]
+    return result
+
+
+# ----------------- Sparse / FAISS -----------------
+def read_context(path: str, input_datatype: str, speech: bool = False):
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if input_datatype == 'txt':
+            return [line.strip() for line in f.readlines()]
+        payload = json.load(f)
+    if speech:
+        return ["nan" if (x == '' or x == []) else x for x in payload]
+    return [load_file.preprocess_text(' '.join(line)) for line in payload]
+
+
+def transform_rows(pkl_path: str, texts):
+    with open(pkl_path, 'rb') as f:
+        vec = pickle.load(f)
+    if vec is None:
+        return sp.csr_matrix((len(texts), 0), dtype=np.float64)
+    return vec.transform(texts).tocsr()
+
+
+def load_video_features(features_dir: str, video: str, normalize: bool) -> np.ndarray:
+    paths = glob.glob(os.path.join(features_dir, '*', f'{video}.npy')) + glob.glob(os.path.join(features_dir, f'{video}.npy'))
+    if not paths:
+        raise ValueError(f"[append] Không tìm thấy feature {video}.npy trong {features_dir}")
+    feats = np.load(paths[0]).astype(np.float32)
+    feats = np.ascontiguousarray(feats.reshape(len(feats), -1))
+    if normalize:
+        faiss.normalize_L2(feats)
+    return feats
+
+
+def append_rerank_rows(path: str, feats: np.ndarray):
+    """Nối hàng vào .npy float32 (re-rank) qua file tạm rồi replace."""
+    old = np.load(path, mmap_mode='r')
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(len(old) + len(feats), old.shape[1]))
+    out[:len(old)] = old
+    out[len(old):] = feats
+    out.flush()
+    del out, old
+    os.replace(tmp_path, path)
+
+
+def append_to_index(index_path: str, feats: np.ndarray, collection: str, expected_ntotal: int):
+    """
+    Flat bin: add rồi ghi lại; manifest shard: thêm vào shard cuối nếu cùng collection, không thì tạo shard mới
+    (offset = expected_ntotal, id phải nối tiếp shard cuối).
+    """
+    if index_path.endswith('.json'):
+        manifest = load_shard_manifest(index_path)
+        last = manifest['shards'][-1]
+        if last['offset'] + last['ntotal'] != expected_ntotal:
+            raise ValueError(f"[append] {index_path}: ntotal {last['offset'] + last['ntotal']} != {expected_ntotal}")
+        if last['name'] == collection:
+            path = shard_path(index_path, last['path'])
+            index = faiss.read_index(path)
+            index.add(feats)
+            write_index(index, path)
+            last['ntotal'] = int(index.ntotal)
+        else:
+            spec = manifest['spec']
+            index = build_index(feats, shard_spec(spec, len(feats)))
+            # collection đã có shard (không phải shard cuối) -> file mới tên khác, không ghi đè shard cũ
+            shard_dir = os.path.dirname(last['path'])
+            used = {os.path.normpath(shard['path']) for shard in manifest['shards']}
+            rel_path = os.path.join(shard_dir, f'{collection}.bin')
+            if os.path.normpath(rel_path) in used or os.path.exists(shard_path(index_path, rel_path)):
+                rel_path = os.path.join(shard_dir, f'{collection}.{len(manifest["shards"])}.bin')
+            write_index(index, shard_path(index_path, rel_path))
+            manifest['shards'].append({'name': collection, 'path': rel_path, 'offset': expected_ntotal,
+                                       'ntotal': int(index.ntotal)})
+        save_shard_manifest(index_path, manifest)
+        spec = manifest['spec']
+    else:
+        index = faiss.read_index(index_path)
+        if index.ntotal != expected_ntotal:
+            raise ValueError(f"[append] {index_path}: ntotal {index.ntotal} != {expected_ntotal}")
+        index.add(feats)
+        write_index(index, index_path)
+        spec = load_index_spec(index_path, index)
+
+    if spec.get('rerank_path'):
+        rerank_path = spec['rerank_path']
+        if not os.path.isabs(rerank_path):
+            rerank_path = os.path.join(os.path.dirname(os.path.abspath(index_path)), rerank_path)
+        append_rerank_rows(rerank_path, feats)
+
+
+# ----------------- Main -----------------
+def list_videos(root: str, args):
+    if args.videos:
+        return sorted(args.videos)
+    keyframes_root = os.path.join(root, args.keyframes_root)
+    return sorted(name for name in os.listdir(keyframes_root)
+                  if re.match(rf'^{re.escape(args.collection)}_V\d+$', name, flags=re.IGNORECASE))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Thêm video mới vào index + metadata + sparse matrix đã build.')
+    videos = parser.add_mutually_exclusive_group(required=True)
+    videos.add_argument('--videos', nargs='+', help='vd: L25_V001 L25_V002')
+    videos.add_argument('--collection', help='thêm mọi video Lxx_* trong thư mục keyframes')
+    parser.add_argument('--root', default='.')
+    parser.add_argument('--manifest', default=MANIFEST_PATH)
+    parser.add_argument('--clip-index', default='dict/faiss_clip_cosine.bin')
+    parser.add_argument('--clipv2-index', default='dict/faiss_clipv2_cosine.bin')
+    parser.add_argument('--clip-features', default=None, help='thư mục .npy feature CLIP (Lxx/Lxx_Vxxx.npy)')
+    parser.add_argument('--clipv2-features', default=None)
+    parser.add_argument('--normalize', action='store_true', help='L2-normalize feature trước khi add (như lúc build)')
+    parser.add_argument('--public-root', default='frontend/ai/public')
+    parser.add_argument('--keyframes-root', default='frontend/ai/public/data/Keyframes')
+    parser.add_argument('--scene-root', default='dict/SceneJSON')
+    parser.add_argument('--metadata-root', default='dict/metadata')
+    parser.add_argument('--map-keyframes-root', default='dict/map_keyframes')
+    parser.add_argument('--fps-json', default='dict/fps.json')
+    parser.add_argument('--audio-detection-root', default='dict/audio_detection')
+    parser.add_argument('--force', action='store_true', help='bỏ qua lỗi kiểm tra manifest trước khi append')
+    parser.add_argument('--dry-run', action='store_true', help='chỉ kiểm tra + in thống kê, không ghi gì')
+    args = parser.parse_args()
+    root = args.root
+
+    def p(rel_path):
+        return os.path.join(root, rel_path)
+
+    previous = load_manifest(p(args.manifest))
+    if previous is not None:
+        problems = check_manifest(previous, root=root)
+        if problems and not args.force:
+            raise SystemExit("[append] Dữ liệu hiện tại không khớp manifest, sửa trước (hoặc --force):\n  " + "\n  ".join(problems))
+
+    id2img_fps = read_json(p('dict/id2img_fps.json'), {})
+    scene_id2info = read_json(p('dict/scene_id2info.json'), {})
+    video_id2img_id = read_json(p('dict/video_id2img_id.json'), {})
+    map_keyframes = read_json(p('dict/map_keyframes.json'), {})
+    audio_id2img_id = read_json(p('dict/audio_id2img_id.json'), {})
+    img_id2audio_id = read_json(p('dict/img_id2audio_id.json'), {})
+    fps_dict = read_json(p(args.fps_json), {})
+
+    # --- 1. Metadata cho từng video (kiểm tra hết trước khi ghi) ---
+    # id mới bắt đầu sau id lớn nhất (id cũ có thể không liên tục)
+    n_old = max((int(i) for i in id2img_fps), default=-1) + 1
+    audio_old = max((int(i) for i in audio_id2img_id), default=-1) + 1
+    per_video = []
+    next_id = n_old
+    for video in list_videos(root, args):
+        lxx, vxxx = video.split('_', 1)
+        if video in video_id2img_id:
+            raise SystemExit(f"[append] {video} đã có trong video_id2img_id.json")
+        scene_entry, rows, map_entry, n_files, kept = build_video_entries(root, args, lxx, vxxx, next_id, fps_dict)
+        per_video.append((video, lxx, vxxx, scene_entry, rows, map_entry, n_files, kept))
+        next_id += len(rows)
+    if not per_video:
+        raise SystemExit("[append] Không có video nào để thêm")
+    n_new = next_id - n_old
+    collections = sorted({lxx for _, lxx, *_ in per_video})
+    print(f"[append] {len(per_video)} videos ({', '.join(collections)}): +{n_new} keyframes (id {n_old}..{next_id - 1})")
+
+    # --- 2. Sparse rows ---
+    sparse_updates = {}
+    for data_type, (pattern, input_datatype, bin_dir) in SPARSE_SOURCES.items():
+        npz_path = p(os.path.join(bin_dir, f'sparse_context_matrix_{data_type}.npz'))
+        if not os.path.exists(npz_path):
+            continue
+        texts = []
+        for video, lxx, vxxx, _, rows, _, n_files, kept in per_video:
+            path = find_video_file(root, pattern, lxx, vxxx, input_datatype)
+            if path is None:
+                print(f"[append] {data_type}: không có context cho {video}, thêm {len(rows)} hàng rỗng")
+                texts += [''] * len(rows)
+            else:
+                texts += select_rows(read_context(path, input_datatype), n_files, kept, f'{data_type} {video}')
+        sparse_updates[npz_path] = transform_rows(p(os.path.join(bin_dir, f'tfidf_transform_{data_type}.pkl')), texts)
+
+    # --- 3. Audio ---
+    speech_texts, new_audio = [], 0
+    for video, lxx, vxxx, scene_entry, *_ in per_video:
+        audio_shots = read_json(p(os.path.join(args.audio_detection_root, lxx, f'{vxxx}.json')))
+        if not audio_shots:
+            continue
+        for j, img_ids in enumerate(audio_to_keyframes(audio_shots, scene_entry['lst_shot'])):
+            audio_id2img_id[str(audio_old + new_audio + j)] = img_ids
+        img_id2audio_id.update(keyframes_to_audio(audio_shots, scene_entry['lst_shot'], audio_old + new_audio))
+        path = find_video_file(root, SPEECH_SOURCE[0], lxx, vxxx, 'json')
+        texts = read_context(path, 'json', speech=True) if path else []
+        if len(texts) != len(audio_shots):
+            raise SystemExit(f"[append] audio {video}: {len(texts)} đoạn text, {len(audio_shots)} đoạn audio_detection")
+        speech_texts += texts
+        new_audio += len(audio_shots)
+    speech_npz = p(os.path.join(SPEECH_SOURCE[1], 'sparse_context_matrix_speech.npz'))
+    if new_audio and os.path.exists(speech_npz):
+        sparse_updates[speech_npz] = transform_rows(p(os.path.join(SPEECH_SOURCE[1], 'tfidf_transform_speech.pkl')),
+                                                    speech_texts)
+
+    # --- 4. Features ---
+    feature_updates = {}
+    for index_path, features_dir in ((args.clip_index, args.clip_features), (args.clipv2_index, args.clipv2_features)):
+        if not os.path.exists(p(index_path)):
+            continue
+        if not features_dir:
+            raise SystemExit(f"[append] Thiếu thư mục feature cho {index_path}")
+        feats = [select_rows(load_video_features(features_dir, video, args.normalize), n_files, kept, f'feature {video}')
+                 for video, _, _, _, _, _, n_files, kept in per_video]
+        feature_updates[index_path] = np.ascontiguousarray(np.concatenate(feats, axis=0))
+
+    if args.dry_run:
+        print(f"[append] dry-run: {len(sparse_updates)} sparse matrices, {len(feature_updates)} indexes, +{new_audio} audio segments")
+        return
+
+    # --- 5. Ghi (manifest ghi sau cùng) ---
+    for index_path, feats in feature_updates.items():
+        # video thuộc nhiều collection -> mỗi collection một lần add để shard khớp Lxx
+        offset = 0
+        for collection in collections:
+            n = sum(len(rows) for _, lxx, _, _, rows, *_ in per_video if lxx == collection)
+            append_to_index(p(index_path), feats[offset:offset + n], collection, n_old + offset)
+            offset += n
+    for npz_path, rows in sparse_updates.items():
+        old = sp.load_npz(npz_path).tocsr()
+        write_npz(npz_path, sp.vstack([old, rows.astype(old.dtype)], format='csr'))
+
+    next_id = n_old
+    for video, lxx, vxxx, scene_entry, rows, map_entry, _, _ in per_video:
+        scene_id2info.setdefault(lxx, {})[vxxx] = scene_entry
+        video_id2img_id[video] = [int(i) for shot in scene_entry['lst_shot'].values() for i in shot['lst_keyframe_idxs']]
+        map_keyframes[video] = {str(n): frame_idx for n, frame_idx in map_entry.items()}
+        for row in rows:
+            id2img_fps[str(next_id)] = row
+            next_id += 1
+    write_json(p('dict/id2img_fps.json'), id2img_fps)
+    write_json(p('dict/scene_id2info.json'), scene_id2info)
+    write_json(p('dict/video_id2img_id.json'), video_id2img_id)
+    write_json(p('dict/map_keyframes.json'), map_keyframes)
+    write_json(p('dict/audio_id2img_id.json'), audio_id2img_id)
+    write_json(p('dict/img_id2audio_id.json'), img_id2audio_id)
+
+    artifacts = None if previous is not None else default_artifacts(args.clip_index, args.clipv2_index)
+    manifest = build_manifest(artifacts, previous=previous, root=root, note={
+        'action': 'append', 'videos': [video for video, *_ in per_video], 'keyframes': n_new, 'audio_segments': new_audio,
+    })
+    save_manifest(manifest, p(args.manifest))
+    problems = check_manifest(manifest, root=root)
+    for problem in problems:
+        print(f"[append] {problem}")
+    print(f"[append] manifest v{manifest['version']}: counts={manifest['counts']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+Build FAISS index cho CLIP features (thay cho data_extraction/create_bin.ipynb).
+
+Ví dụ:
+    python -m utils.build_index --features-dir ./CLIP_features --output dict/faiss_clip_cosine.bin --type ivf_pq --nlist 4096 --pq-m 64 --nprobe 32
+    python -m utils.build_index --features-dir ./clip-features-32 --output dict/faiss_clipv2_cosine.bin --type hnsw --hnsw-m 32 --ef-search 128
+    # SQ8 (1 byte/chiều) + re-rank float32 đọc từ .npy mmap, chuyển từ index Flat có sẵn
+    python -m utils.build_index --from-index dict/faiss_clip_cosine.bin --output dict/faiss_clip_sq8.bin --type sq8 --rerank-npy dict/clip_float32.npy
+    # mỗi collection (Lxx) một shard + manifest .json (MyFaiss nhận thẳng file manifest thay cho file bin)
+    python -m utils.build_index --features-dir ./CLIP_features --output dict/faiss_clip_cosine.shards.json --shard-by-collection
+    python -m utils.build_index --from-index dict/faiss_clip_cosine.bin --id2img-json dict/id2img_fps.json --output dict/faiss_clip_cosine.shards.json --shard-by-collection
+
+Thứ tự đọc .npy giống notebook cũ (sorted Lxx/ rồi sorted *.npy) để id trong index
+khớp với id2img_fps.json. Ghi thêm <output>.spec.json chứa loại index và nprobe/efSearch mặc định.
+"""
+import os
+import glob
+import json
+import time
+import argparse
+from collections import OrderedDict
+import faiss
+import numpy as np
+from utils.index_spec import DEFAULT_SPEC, INDEX_TYPES, factory_string, metric_of, prepare_index, save_index_spec
+from utils.sharded_index import save_manifest
+
+
+def list_feature_files(features_dir: str):
+    """Hỗ trợ 2 layout: features_dir/Lxx/*.npy hoặc features_dir/*.npy."""
+    files = []
+    for l_folder in sorted(os.listdir(features_dir)):
+        l_path = os.path.join(features_dir, l_folder)
+        if os.path.isdir(l_path):
+            files.extend(sorted(glob.glob(os.path.join(l_path, '*.npy'))))
+    files.extend(sorted(glob.glob(os.path.join(features_dir, '*.npy'))))
+    return files
+
+
+def group_feature_files(features_dir: str):
+    """OrderedDict collection -> files, cùng thứ tự với list_feature_files (file nằm ngay features_dir thuộc '_root')."""
+    groups = OrderedDict()
+    for feature_path in list_feature_files(features_dir):
+        parent = os.path.dirname(feature_path)
+        name = '_root' if os.path.samefile(parent, features_dir) else os.path.basename(parent)
+        groups.setdefault(name, []).append(feature_path)
+    return groups
+
+
+def collection_ranges(id2img_json: str):
+    """[(collection, start, stop)] từ id2img_fps.json (scene_idx 'Lxx/Vxxx/...'); id mỗi collection phải liên tục."""
+    with open(id2img_json, 'r', encoding='utf-8') as f:
+        id2img = {int(k): v for k, v in json.load(f).items()}
+    ranges = []
+    for idx in sorted(id2img):
+        name = id2img[idx]['scene_idx'].split('/')[0]
+        if ranges and ranges[-1][0] == name and ranges[-1][2] == idx:
+            ranges[-1][2] = idx + 1
+        elif any(r[0] == name for r in ranges):
+            raise ValueError(f"[build_index] id của collection {name} không liên tục (id {idx})")
+        else:
+            ranges.append([name, idx, idx + 1])
+    return [tuple(r) for r in ranges]
+
+
+def load_features(features_dir: str, normalize: bool = False, files=None) -> np.ndarray:
+    feats_list = []
+    for feature_path in files if files is not None else list_feature_files(features_dir):
+        feats = np.load(feature_path)
+        if feats.size == 0:
+            print(f"File rỗng: {feature_path}")
+            continue
+        feats_list.append(feats.astype(np.float32).reshape(len(feats), -1))
+    if not feats_list:
+        raise ValueError(f"Không tìm thấy feature .npy nào trong {features_dir}")
+    feats = np.ascontiguousarray(np.concatenate(feats_list, axis=0))
+    if normalize:
+        faiss.normalize_L2(feats)
+    return feats
+
+
+def load_features_from_index(bin_file: str) -> np.ndarray:
+    """Lấy lại toàn bộ vectors từ một index có sẵn (Flat -> chính xác)."""
+    index = faiss.read_index(bin_file)
+    return np.ascontiguousarray(index.reconstruct_n(0, index.ntotal), dtype=np.float32)
+
+
+def build_index(feats: np.ndarray, spec: dict, train_size: int = 200000, seed: int = 0, batch_size: int = 100000):
+    """Train (nếu cần) trên một mẫu ngẫu nhiên rồi add toàn bộ vectors theo batch."""
+    d = feats.shape[1]
+    index = faiss.index_factory(d, factory_string(spec), metric_of(spec))
+    if spec['type'] == 'hnsw':
+        index.hnsw.efConstruction = int(spec['ef_construction'])
+
+    if not index.is_trained:
+        n_train = min(len(feats), max(int(train_size), 39 * int(spec.get('nlist', 1))))
+        rng = np.random.default_rng(seed)
+        sample = feats[np.sort(rng.choice(len(feats), n_train, replace=False))]
+        t0 = time.time()
+        index.train(sample)
+        print(f"[build_index] trained on {n_train} vectors in {time.time() - t0:.1f}s")
+
+    t0 = time.time()
+    for start in range(0, len(feats), batch_size):
+        index.add(feats[start:start + batch_size])
+    print(f"[build_index] added {index.ntotal} vectors in {time.time() - t0:.1f}s")
+    return prepare_index(index)
+
+
+def shard_spec(spec: dict, n: int) -> dict:
+    """
+    Shard nhỏ không đủ điểm train nlist cụm -> giảm nlist (~39 điểm / cụm).
+    IVF-PQ cần ít nhất 2**pq_nbits điểm để train codebook -> shard nhỏ hơn dùng IVF-Flat (ít vector, không tốn RAM bao nhiêu).
+    """
+    spec = dict(spec)
+    if spec['type'] == 'ivf_pq' and n < 2 ** int(spec['pq_nbits']):
+        spec['type'] = 'ivf_flat'
+    if spec['type'] in ('ivf_flat', 'ivf_pq'):
+        spec['nlist'] = max(1, min(int(spec['nlist']), n // 39))
+    return spec
+
+
+def build_shards(shard_iter, spec: dict, output: str, train_size: int = 200000, seed: int = 0, rerank_npy: str = None,
+                 ntotal: int = None):
+    """
+    shard_iter: [(collection, feats)] theo đúng thứ tự id. Mỗi shard ghi ra <output_stem>/<collection>.bin,
+    manifest (output .json) giữ offset / ntotal từng shard. rerank_npy: ghi tuần tự vào một .npy chung (cần ntotal).
+    """
+    out_dir = os.path.dirname(os.path.abspath(output))
+    stem = os.path.basename(output).split('.')[0]
+    os.makedirs(os.path.join(out_dir, stem), exist_ok=True)
+    rerank = None
+    shards, offset = [], 0
+    for name, feats in shard_iter:
+        sub_spec = shard_spec(spec, len(feats))
+        index = build_index(feats, sub_spec, train_size=train_size, seed=seed)
+        rel_path = os.path.join(stem, f"{name}.bin")
+        faiss.write_index(index, os.path.join(out_dir, rel_path))
+        if rerank_npy:
+            if rerank is None:
+                rerank = np.lib.format.open_memmap(rerank_npy, mode='w+', dtype=np.float32, shape=(ntotal, feats.shape[1]))
+            rerank[offset:offset + len(feats)] = feats
+        shards.append({'name': name, 'path': rel_path, 'offset': offset, 'ntotal': int(index.ntotal),
+                       'factory': factory_string(sub_spec)})
+        print(f"[build_index] shard {name}: ids [{offset}, {offset + index.ntotal})")
+        offset += int(index.ntotal)
+    if rerank is not None:
+        rerank.flush()
+    save_manifest(output, {'spec': spec, 'shards': shards})
+    return shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build FAISS index (Flat / IVF-Flat / IVF-PQ / HNSW) từ CLIP features.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--features-dir')
+    source.add_argument('--from-index', help='lấy vectors từ index Flat có sẵn thay vì thư mục .npy')
+    parser.add_argument('--output', required=True, help='vd: dict/faiss_clip_cosine.bin')
+    parser.add_argument('--type', choices=INDEX_TYPES, default=DEFAULT_SPEC['type'])
+    parser.add_argument('--metric', choices=('ip', 'l2'), default=DEFAULT_SPEC['metric'])
+    parser.add_argument('--nlist', type=int, default=DEFAULT_SPEC['nlist'])
+    parser.add_argument('--pq-m', type=int, default=DEFAULT_SPEC['pq_m'])
+    parser.add_argument('--pq-nbits', type=int, default=DEFAULT_SPEC['pq_nbits'])
+    parser.add_argument('--hnsw-m', type=int, default=DEFAULT_SPEC['hnsw_m'])
+    parser.add_argument('--ef-construction', type=int, default=DEFAULT_SPEC['ef_construction'])
+    parser.add_argument('--nprobe', type=int, default=DEFAULT_SPEC['nprobe'], help='nprobe mặc định lúc search')
+    parser.add_argument('--ef-search', type=int, default=DEFAULT_SPEC['ef_search'], help='efSearch mặc định lúc search')
+    parser.add_argument('--rerank-npy', default=None, help='ghi vectors float32 ra .npy (mmap) để re-rank chính xác lúc search')
+    parser.add_argument('--rerank-factor', type=int, default=DEFAULT_SPEC['rerank_factor'])
+    parser.add_argument('--train-size', type=int, default=200000)
+    parser.add_argument('--normalize', action='store_true', help='L2-normalize features trước khi add (cosine)')
+    parser.add_argument('--shard-by-collection', action='store_true', help='mỗi Lxx một index, --output là manifest .json')
+    parser.add_argument('--id2img-json', default=None, help='dùng với --from-index --shard-by-collection để chia dải id theo Lxx')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    spec = dict(DEFAULT_SPEC)
+    spec.update({
+        'type': args.type,
+        'metric': args.metric,
+        'nlist': args.nlist,
+        'pq_m': args.pq_m,
+        'pq_nbits': args.pq_nbits,
+        'hnsw_m': args.hnsw_m,
+        'ef_construction': args.ef_construction,
+        'nprobe': args.nprobe,
+        'ef_search': args.ef_search,
+        'rerank_factor': args.rerank_factor,
+    })
+
+    if args.shard_by_collection:
+        if args.rerank_npy:
+            os.makedirs(os.path.dirname(os.path.abspath(args.rerank_npy)), exist_ok=True)
+            spec['rerank_path'] = os.path.relpath(os.path.abspath(args.rerank_npy),
+                                                  os.path.dirname(os.path.abspath(args.output)))
+        spec['factory'] = factory_string(spec)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        if args.from_index:
+            if not args.id2img_json:
+                parser.error('--from-index --shard-by-collection cần --id2img-json')
+            feats = load_features_from_index(args.from_index)
+            if args.normalize:
+                faiss.normalize_L2(feats)
+            ranges = collection_ranges(args.id2img_json)
+            if ranges and ranges[-1][2] != len(feats):
+                raise ValueError(f"[build_index] id2img có {ranges[-1][2]} id, index có {len(feats)} vectors")
+            shard_iter = ((name, feats[start:stop]) for name, start, stop in ranges)
+            ntotal = len(feats)
+        else:
+            groups = group_feature_files(args.features_dir)
+            shard_iter = ((name, load_features(args.features_dir, args.normalize, files)) for name, files in groups.items())
+            ntotal = sum(len(np.load(path, mmap_mode='r')) for files in groups.values() for path in files)
+        shards = build_shards(shard_iter, spec, args.output, train_size=args.train_size, seed=args.seed,
+                              rerank_npy=args.rerank_npy, ntotal=ntotal)
+        print(f"[build_index] saved {args.output} ({len(shards)} shards, {spec['factory']})")
+        return
+
+    if args.from_index:
+        feats = load_features_from_index(args.from_index)
+        if args.normalize:
+            faiss.normalize_L2(feats)
+    else:
+        feats = load_features(args.features_dir, normalize=args.normalize)
+    print(f"[build_index] {args.from_index or args.features_dir}: shape={feats.shape}")
+    index = build_index(feats, spec, train_size=args.train_size, seed=args.seed)
+
+    if args.rerank_npy:
+        os.makedirs(os.path.dirname(os.path.abspath(args.rerank_npy)), exist_ok=True)
+        np.save(args.rerank_npy, feats)
+        # lưu đường dẫn tương đối với file bin để cả thư mục dict/ có thể di chuyển
+        spec['rerank_path'] = os.path.relpath(os.path.abspath(args.rerank_npy),
+                                              os.path.dirname(os.path.abspath(args.output)))
+
+    spec['factory'] = factory_string(spec)
+    spec['dim'] = int(index.d)
+    spec['ntotal'] = int(index.ntotal)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    faiss.write_index(index, args.output)
+    save_index_spec(args.output, spec)
+    print(f"[build_index] saved {args.output} ({spec['factory']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Manifest phiên bản cho toàn bộ dữ liệu đã build (index FAISS, mapping json, sparse matrix TF-IDF).
+
+Ví dụ:
+    python -m utils.data_manifest --write              # ghi dict/manifest.json cho dữ liệu hiện có
+    python -m utils.data_manifest --check --checksums  # kiểm tra kích thước, số dòng (+ sha256)
+
+Mỗi artifact ghi size, sha256 và số dòng; số dòng phải khớp counts['keyframes'] (hoặc counts['audio_segments']).
+app.py kiểm tra manifest lúc khởi động; utils.append_videos tăng version sau mỗi lần thêm video.
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+import faiss
+import numpy as np
+from utils.sharded_index import load_manifest as load_shard_manifest, shard_path
+
+MANIFEST_PATH = 'dict/manifest.json'
+
+# artifact -> đơn vị của số dòng (None: không đếm dòng)
+DEFAULT_ARTIFACTS = {
+    'dict/faiss_clip_cosine.bin': 'keyframes',
+    'dict/faiss_clipv2_cosine.bin': 'keyframes',
+    'dict/id2img_fps.json': 'keyframes',
+    'dict/scene_id2info.json': None,
+    'dict/video_id2img_id.json': None,
+    'dict/map_keyframes.json': None,
+    'dict/audio_id2img_id.json': 'audio_segments',
+    'dict/img_id2audio_id.json': None,
+    'dict/bin/contexts_bin/sparse_context_matrix_bbox.npz': 'keyframes',
+    'dict/bin/contexts_bin/sparse_context_matrix_class.npz': 'keyframes',
+    'dict/bin/contexts_bin/sparse_context_matrix_color.npz': 'keyframes',
+    'dict/bin/contexts_bin/sparse_context_matrix_tag.npz': 'keyframes',
+    'dict/bin/contexts_bin/sparse_context_matrix_number.npz': 'keyframes',
+    'dict/bin/ocr_bin/sparse_context_matrix_ocr.npz': 'keyframes',
+    'dict/bin/audio_bin/sparse_context_matrix_speech.npz': 'audio_segments',
+}
+
+
+def default_artifacts(clip_index: str = None, clipv2_index: str = None) -> dict:
+    """DEFAULT_ARTIFACTS với đường dẫn index thay thế (vd. manifest shard .shards.json)."""
+    artifacts = dict(DEFAULT_ARTIFACTS)
+    for default, path in (('dict/faiss_clip_cosine.bin', clip_index), ('dict/faiss_clipv2_cosine.bin', clipv2_index)):
+        if path and path != default:
+            artifacts = {(path if key == default else key): unit for key, unit in artifacts.items()}
+    return artifacts
+
+
+# ----------------- Đo artifact -----------------
+def file_sha256(path: str, chunk_size: int = 1 << 22) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def artifact_files(path: str):
+    """Manifest shard -> chính nó + các file shard; còn lại -> [path]."""
+    if path.endswith('.shards.json'):
+        return [path] + [shard_path(path, item['path']) for item in load_shard_manifest(path)['shards']]
+    return [path]
+
+
+def artifact_rows(path: str):
+    """Số dòng của artifact: ntotal (FAISS), số hàng (sparse .npz), số key (json dict / list)."""
+    if path.endswith('.shards.json'):
+        return sum(int(item['ntotal']) for item in load_shard_manifest(path)['shards'])
+    if path.endswith('.bin'):
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        return int(faiss.read_index(path, flags).ntotal)
+    if path.endswith('.npz'):
+        # chỉ đọc mảng 'shape' trong zip, không load cả ma trận
+        with np.load(path) as npz:
+            return int(npz['shape'][0])
+    if path.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            return len(json.load(f))
+    return None
+
+
+def describe_artifact(path: str, checksum: bool = True) -> dict:
+    files = artifact_files(path)
+    info = {'size': sum(os.path.getsize(p) for p in files)}
+    if checksum:
+        h = hashlib.sha256()
+        for p in files:
+            h.update(file_sha256(p).encode())
+        info['sha256'] = h.hexdigest()
+    return info
+
+
+# ----------------- Đọc / ghi -----------------
+def load_manifest(path: str = MANIFEST_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def build_manifest(artifacts: dict = None, previous: dict = None, note: dict = None, root: str = '.') -> dict:
+    """
+    Đo lại toàn bộ artifact (đường dẫn tương đối root) và tạo manifest version mới.
+    artifacts: {path: 'keyframes' | 'audio_segments' | None}; artifact không tồn tại thì bỏ qua.
+    """
+    artifacts = artifacts or (previous or {}).get('expect') or DEFAULT_ARTIFACTS
+    entries, expect, counts = {}, {}, {}
+    for rel_path, unit in artifacts.items():
+        path = os.path.join(root, rel_path)
+        if not os.path.exists(path):
+            continue
+        entry = describe_artifact(path)
+        if unit:
+            entry['rows'] = artifact_rows(path)
+            counts.setdefault(unit, entry['rows'])
+        entries[rel_path] = entry
+        expect[rel_path] = unit
+
+    version = int((previous or {}).get('version', 0)) + 1
+    history = list((previous or {}).get('history', []))
+    history.append(dict({'version': version, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}, **(note or {})))
+    return {'version': version, 'counts': counts, 'artifacts': entries, 'expect': expect, 'history': history}
+
+
+def check_manifest(manifest: dict, root: str = '.', checksums: bool = False, live_counts: dict = None):
+    """
+    Trả list lỗi (rỗng = nhất quán): file thiếu / đổi size / sai sha256, số dòng lệch counts,
+    live_counts: {tên: (unit, giá trị)} đo từ dữ liệu đang load (vd. {'id2img_fps': ('keyframes', N)}).
+    """
+    problems = []
+    counts = manifest.get('counts', {})
+    for rel_path, entry in manifest.get('artifacts', {}).items():
+        path = os.path.join(root, rel_path)
+        if not os.path.exists(path):
+            problems.append(f"{rel_path}: không tồn tại")
+            continue
+        current = describe_artifact(path, checksum=checksums)
+        if current['size'] != entry['size']:
+            problems.append(f"{rel_path}: size {current['size']} != {entry['size']} (file bị sửa sau khi ghi manifest)")
+        elif checksums and current['sha256'] != entry.get('sha256'):
+            problems.append(f"{rel_path}: sha256 không khớp")
+        unit = manifest.get('expect', {}).get(rel_path)
+        if unit and entry.get('rows') != counts.get(unit):
+            problems.append(f"{rel_path}: {entry.get('rows')} dòng, {unit}={counts.get(unit)}")
+    for name, (unit, value) in (live_counts or {}).items():
+        if unit in counts and int(value) != int(counts[unit]):
+            problems.append(f"{name}: {value} {unit} đang load != manifest {counts[unit]}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ghi / kiểm tra manifest dữ liệu (counts + checksums).')
+    parser.add_argument('--manifest', default=MANIFEST_PATH)
+    parser.add_argument('--root', default='.')
+    parser.add_argument('--clip-index', default=None, help='index clip nếu khác mặc định (vd. .shards.json)')
+    parser.add_argument('--clipv2-index', default=None)
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--write', action='store_true', help='đo lại artifact và ghi version mới')
+    action.add_argument('--check', action='store_true')
+    parser.add_argument('--checksums', action='store_true', help='--check: so cả sha256 (chậm với file lớn)')
+    args = parser.parse_args()
+
+    previous = load_manifest(args.manifest)
+    if args.write:
+        artifacts = None
+        if args.clip_index or args.clipv2_index or previous is None:
+            artifacts = default_artifacts(args.clip_index, args.clipv2_index)
+        manifest = build_manifest(artifacts, previous=previous, note={'action': 'write'}, root=args.root)
+        save_manifest(manifest, args.manifest)
+        print(f"[manifest] v{manifest['version']} counts={manifest['counts']} ({len(manifest['artifacts'])} artifacts)")
+        for problem in check_manifest(manifest, root=args.root):
+            print(f"[manifest] {problem}")
+        return
+
+    if previous is None:
+        raise SystemExit(f"[manifest] Không có {args.manifest}")
+    problems = check_manifest(previous, root=args.root, checksums=args.checksums)
+    for problem in problems:
+        print(f"[manifest] {problem}")
+    print(f"[manifest] v{previous['version']}: {'OK' if not problems else f'{len(problems)} lỗi'}")
+    raise SystemExit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
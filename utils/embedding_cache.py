@@ -0,0 +1,142 @@
+import os
+import re
+import atexit
+import pickle
+import threading
+import contextlib
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:          # Windows: không khoá file (chạy một process, không có pre-fork)
+    fcntl = None
+
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hoá key: lower + gộp khoảng trắng (query sửa lặt vặt vẫn trúng cache)."""
+    return _SPACE_RE.sub(' ', str(text)).strip().lower()
+
+
+@contextlib.contextmanager
+def _file_lock(path: str):
+    """Khoá độc quyền giữa các process (flock trên file .lock cạnh file cache)."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """
+    LRU cache cho text embedding, key = (model_type, text đã dịch + chuẩn hoá).
+    - max_size: số entry tối đa, vượt thì bỏ entry ít dùng nhất.
+    - path: nếu có thì load lúc khởi tạo và ghi lại (atomic) mỗi save_every entry mới + lúc tắt process.
+      Nhiều worker (gunicorn pre-fork) mỗi worker một bản trong RAM nhưng dùng chung file: save() khoá file,
+      gộp entry worker khác đã ghi rồi mới thay file (tmp + os.replace), không worker nào ghi đè mất entry của worker khác.
+    """
+
+    def __init__(self, max_size: int = 4096, path: str = None, save_every: int = 64):
+        self.max_size = int(max_size)
+        self.path = path
+        self.save_every = int(save_every)
+        self.hits = 0
+        self.misses = 0
+        self._dirty = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+        if self.path:
+            self.load()
+            atexit.register(self.save)
+
+    def get(self, model_type: str, text: str):
+        key = (model_type, normalize_text(text))
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, model_type: str, text: str, vec: np.ndarray):
+        if self.max_size <= 0:
+            return
+        key = (model_type, normalize_text(text))
+        vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+        vec.setflags(write=False)
+        with self._lock:
+            self._data[key] = vec
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+            self._dirty += 1
+            need_save = self.path and self._dirty >= self.save_every
+        if need_save:
+            self.save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'path': self.path,
+            }
+
+    # ----------------- Persist -----------------
+    def _read_items(self):
+        """List (key, vec) trong file theo thứ tự LRU -> MRU; file lỗi / không có -> []."""
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"[EmbeddingCache] Không đọc được {self.path}: {e}")
+            return []
+
+    def load(self):
+        items = self._read_items()
+        if not items:
+            return
+        with self._lock:
+            # items lưu theo thứ tự LRU -> MRU, chỉ giữ max_size entry mới nhất
+            for key, vec in items[-self.max_size:] if self.max_size > 0 else []:
+                vec = np.asarray(vec, dtype=np.float32)
+                vec.setflags(write=False)
+                self._data[tuple(key)] = vec
+        print(f"[EmbeddingCache] loaded {len(self._data)} entries from {self.path}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty and os.path.exists(self.path):
+                    return              # không có gì mới (vd. process master lúc tắt)
+                items = list(self._data.items())
+                self._dirty = 0
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with _file_lock(f"{self.path}.lock"):
+                # entry worker khác đã ghi (không có trong RAM của process này) giữ lại, xếp trước entry của mình
+                mine = {key for key, _ in items}
+                merged = [(tuple(key), vec) for key, vec in self._read_items() if tuple(key) not in mine] + items
+                merged = merged[-self.max_size:] if self.max_size > 0 else []
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(merged, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.path)
@@ -0,0 +1,132 @@
+"""
+Export text encoder của CLIP / open_clip sang ONNX hoặc TorchScript (tuỳ chọn quantize dynamic int8) cho node CPU.
+
+Ví dụ:
+    python -m utils.export_text_encoder --model clip --format onnx --int8 --output dict/text_encoders/clip_text.int8.onnx
+    python -m utils.export_text_encoder --model clipv2 --format torchscript --output dict/text_encoders/clipv2_text.pt
+    # chỉ kiểm tra lại file đã có
+    python -m utils.export_text_encoder --model clip --output dict/text_encoders/clip_text.int8.onnx --no-export
+
+Sau khi export sẽ so embedding với model eager (cosine min / mean trên tập câu mẫu)
+và đo latency (ms/query) ở batch 1 và batch --batch-size.
+"""
+import os
+import time
+import argparse
+import numpy as np
+import torch
+from utils.text_encoder import TextTower, load_eager_model, get_tokenizer, load_text_encoder
+
+SAMPLE_TEXTS = [
+    'a man riding a motorbike on a crowded street',
+    'a woman in a red dress speaking at a press conference',
+    'close-up of a paper mask being painted by an artisan',
+    'firefighters spraying water on a burning house at night',
+    'a group of students in white shirts waving flags',
+    'an aerial view of rice fields next to a river',
+    'a news anchor sitting in front of a blue background',
+    'a football player celebrating after scoring a goal',
+    'traffic jam on a highway in the rain',
+    'a chef cooking noodles in a large pot',
+    'people wearing face masks queueing outside a hospital',
+    'a boat carrying goods on the Mekong river',
+    'the Vietnamese flag on top of a building',
+    'a child reading a book under a tree',
+    'a police officer directing traffic at an intersection',
+    'fireworks over a city skyline',
+]
+
+
+def export_onnx(tower, tokens, output: str, int8: bool, opset: int = 17):
+    fp32_path = output.replace('.int8', '') if int8 else output
+    if int8 and fp32_path == output:
+        fp32_path = output + '.fp32.onnx'
+    torch.onnx.export(
+        tower, (tokens,), fp32_path,
+        input_names=['tokens'], output_names=['embeddings'],
+        dynamic_axes={'tokens': {0: 'batch'}, 'embeddings': {0: 'batch'}},
+        opset_version=opset, do_constant_folding=True,
+    )
+    if int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, output, weight_type=QuantType.QInt8)
+    print(f"[export] ONNX{' int8' if int8 else ''}: {output}")
+
+
+def export_torchscript(tower, tokens, output: str, int8: bool):
+    if int8:
+        # chỉ Linear (MLP + projection) được lượng tử hoá; attention giữ fp32
+        tower = torch.ao.quantization.quantize_dynamic(tower, {torch.nn.Linear}, dtype=torch.qint8)
+    with torch.no_grad():
+        traced = torch.jit.trace(tower, (tokens,), check_trace=False)
+    traced = torch.jit.freeze(traced.eval())
+    traced.save(output)
+    print(f"[export] TorchScript{' int8' if int8 else ''}: {output}")
+
+
+def benchmark(fn, tokens, repeat: int) -> float:
+    """ms / query (trung bình, sau 1 lần warmup)."""
+    fn(tokens)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(tokens)
+    return 1000 * (time.perf_counter() - t0) / (repeat * len(tokens))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export text encoder CLIP / open_clip cho inference CPU.')
+    parser.add_argument('--model', choices=('clip', 'clipv2'), required=True)
+    parser.add_argument('--format', choices=('onnx', 'torchscript'), default='onnx')
+    parser.add_argument('--int8', action='store_true', help='quantize dynamic int8 (weights)')
+    parser.add_argument('--output', required=True, help='vd: dict/text_encoders/clip_text.int8.onnx')
+    parser.add_argument('--no-export', action='store_true', help='chỉ chạy parity + benchmark cho file đã có')
+    parser.add_argument('--texts-file', default=None, help='mỗi dòng một câu (mặc định: SAMPLE_TEXTS)')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=0)
+    parser.add_argument('--min-cosine', type=float, default=0.99, help='ngưỡng parity, thấp hơn -> exit code 1')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    tokenize = get_tokenizer(args.model)
+    if args.texts_file:
+        with open(args.texts_file, 'r', encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = SAMPLE_TEXTS
+    tokens = tokenize(texts)
+
+    tower = TextTower(load_eager_model(args.model, device='cpu').float().eval())
+    if not args.no_export:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        if args.format == 'onnx':
+            export_onnx(tower, tokens[:2], args.output, args.int8)
+        else:
+            export_torchscript(tower, tokens[:2], args.output, args.int8)
+
+    # --- Parity: cosine giữa embedding export và eager (cả 2 đã L2-normalize) ---
+    def eager(toks):
+        with torch.no_grad():
+            return tower(toks).numpy()
+
+    exported = load_text_encoder(args.output, num_threads=args.threads)
+    ref = eager(tokens)
+    out = exported(tokens)
+    cos = np.sum(ref * out, axis=1) / np.linalg.norm(out, axis=1)
+    print(f"file: {args.output} ({os.path.getsize(args.output) / 2**20:.1f}MB)")
+    print(f"parity ({len(texts)} câu): cosine min={cos.min():.5f} mean={cos.mean():.5f}")
+
+    # --- Latency ---
+    batch = tokens[:args.batch_size]
+    print(f"{'backend':<12}{'batch=1':>12}{f'batch={len(batch)}':>12}   (ms/query)")
+    for name, fn in (('eager', eager), ('exported', exported)):
+        print(f"{name:<12}{benchmark(fn, tokens[:1], args.repeat):>12.2f}{benchmark(fn, batch, args.repeat):>12.2f}")
+
+    if cos.min() < args.min_cosine:
+        print(f"[export] cosine min {cos.min():.5f} < {args.min_cosine}: không nên dùng file này")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import clip
 import open_clip
 import torch
@@ -6,39 +9,160 @@ import faiss
 import numpy as np
 from utils.nlp_processing import Translation
 from utils.combine_utils import merge_searching_results_by_addition
+from utils.index_spec import load_index_spec, make_search_params, prepare_index, read_flags, load_rerank_vectors, exact_rerank, \
+    exact_subset_search, range_search_topk, threshold_results
+from utils.id_bitmap import IdBitmap
+from utils.sharded_index import ShardedIndex, ShardedRows, is_shard_manifest
+from utils.embedding_cache import EmbeddingCache
+from utils.keyframe_store import KeyframeStore
+from utils.model_registry import ModelRegistry
+from utils.text_encoder import TEXT_ENCODER_BACKENDS, CLIPV2_MODEL_NAME, load_eager_model, load_text_encoder
 from utils.ocr_retrieval_engine.ocr_retrieval import ocr_retrieval
 from utils.semantic_embed.speech_retrieval import speech_retrieval
 from utils.object_retrieval_engine.object_retrieval import object_retrieval
 
 
+def _rss_bytes():
+    """RSS hiện tại của process (Linux /proc); None nếu không đọc được."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        return None
+
+
 class MyFaiss:
-    def __init__(self, bin_clip_file: str, bin_clipv2_file: str, json_path: str, audio_json_path: str, img2audio_json_path: str):
-        # FAISS indices
-        self.index_clip = self.load_bin_file(bin_clip_file)
-        self.index_clipv2 = self.load_bin_file(bin_clipv2_file)
+    MODEL_TYPES = ('clip', 'clipv2')
+    ENGINES = ('object', 'ocr', 'asr')
+
+    def __init__(self, bin_clip_file: str, bin_clipv2_file: str, json_path: str, audio_json_path: str, img2audio_json_path: str,
+                 mmap: bool = False, embed_cache_size: int = 4096, embed_cache_path: str = None,
+                 search_workers: int = 4, exact_search_dtype: str = 'float32', exact_search_threshold: int = 20000,
+                 models=MODEL_TYPES, engines=ENGINES, preload: str = 'eager',
+                 text_encoder_backend: str = 'torch', text_encoder_paths: dict = None, text_encoder_threads: int = 0):
+        """
+        models / engines: chỉ bật những model CLIP / engine (object, ocr, asr) mà node này phục vụ;
+            model bị tắt thì không load cả index của nó (vd. node chỉ chạy clipv2).
+        preload: 'eager' (nạp hết trong __init__), 'background' (nạp trong luồng nền), 'lazy' (nạp khi dùng lần đầu).
+        text_encoder_backend: 'torch' (model eager đầy đủ) | 'onnx' | 'torchscript' (text encoder đã export bằng
+            utils.export_text_encoder, đường dẫn theo text_encoder_paths[model_type]).
+        """
+        self.enabled_models = tuple(m for m in self.MODEL_TYPES if m in models)
+        if not self.enabled_models:
+            raise ValueError(f"[MyFaiss] Cần bật ít nhất một model trong {self.MODEL_TYPES}")
+        bin_files = {'clip': bin_clip_file, 'clipv2': bin_clipv2_file}
+
+        # FAISS indices (mmap=True: đọc read-only qua mmap, chia sẻ page cache giữa các worker).
+        # File .json = manifest shard theo collection (Lxx), search fan-out song song trên các shard
+        self.mmap = mmap
+        self.search_workers = int(search_workers)
+        self.index_load_stats = {}
+        indexes = {m: self.load_bin_file(bin_files[m], name=m) for m in self.enabled_models}
+        self.index_clip = indexes.get('clip')
+        self.index_clipv2 = indexes.get('clipv2')
+
+        # Spec (loại index + nprobe/efSearch mặc định) đọc từ <bin>.spec.json nếu có
+        self.index_specs = {
+            m: indexes[m].spec if isinstance(indexes[m], ShardedIndex) else load_index_spec(bin_files[m], indexes[m])
+            for m in self.enabled_models
+        }
 
         # Lưu luôn kích thước d cho tiện kiểm tra
-        self.dim_clip = int(self.index_clip.d)
-        self.dim_clipv2 = int(self.index_clipv2.d)
-
-        # Retrieval engines
-        self.object_retrieval = object_retrieval()
-        self.ocr_retrieval = ocr_retrieval()
-        self.asr_retrieval = speech_retrieval()
+        self.dim_clip = int(self.index_clip.d) if self.index_clip is not None else None
+        self.dim_clipv2 = int(self.index_clipv2.d) if self.index_clipv2 is not None else None
+
+        # Index nén (SQ8 / fp16 ...) có spec['rerank_path']: vector float32 gốc mở bằng mmap (không chiếm RAM riêng),
+        # dùng để re-rank chính xác top k * rerank_factor ứng viên
+        self.rerank_vectors = {m: load_rerank_vectors(bin_files[m], self.index_specs[m]) for m in self.enabled_models}
+
+        # Ma trận embedding liền mạch (float32 / float16) cho tập con nhỏ: tính tích vô hướng trực tiếp
+        # thay vì để FAISS quét toàn index rồi test membership. exact_search_dtype=None -> tắt.
+        self.exact_search_threshold = int(exact_search_threshold)
+        self.embed_matrix = {
+            m: self._build_embed_matrix(indexes[m], self.index_specs[m], exact_search_dtype, self.rerank_vectors[m])
+            for m in self.enabled_models
+        }
 
         # Mappings
-        self.id2img_fps = self.load_json_file(json_path)                 # {int id_img: {"image_path": ..., ...}}
+        # metadata keyframe dạng cột (file .kfstore cạnh json, mmap), vẫn tra được như dict {int id_img: {...}}
+        self.id2img_fps = KeyframeStore.open(json_path)
         self.audio_id2img_id = self.load_json_file(audio_json_path)      # {int id_audio: [int id_img, ...]}
         self.img_id2audio_id = self.load_json_file(img2audio_json_path)  # {int id_img: [int id_audio, ...]}
 
-        # Text pre/post
-        self.translater = Translation()
+        # Cache text embedding theo (model_type, text đã dịch); path != None -> lưu xuống disk
+        self.embed_cache = EmbeddingCache(max_size=embed_cache_size, path=embed_cache_path)
+
+        # Pool dùng chung (giới hạn số luồng) để chạy song song nhánh clip / clipv2 ở mode 'both';
+        # torch encode và faiss search đều nhả GIL nên 2 nhánh chạy thật sự song song
+        self._search_pool = ThreadPoolExecutor(max_workers=max(2, int(search_workers)), thread_name_prefix='faiss-search')
+
+        # Text encoder: eager PyTorch hoặc bản export (ONNX / TorchScript, có thể int8) cho node CPU
+        if text_encoder_backend not in TEXT_ENCODER_BACKENDS:
+            raise ValueError(f"[MyFaiss] text_encoder_backend phải thuộc {TEXT_ENCODER_BACKENDS}")
+        self.text_encoder_backend = text_encoder_backend
+        text_encoder_paths = text_encoder_paths or {}
+        if text_encoder_backend != 'torch':
+            for m in self.enabled_models:
+                if not os.path.exists(text_encoder_paths.get(m) or ''):
+                    raise FileNotFoundError(f"[MyFaiss] Thiếu text encoder '{m}' ({text_encoder_paths.get(m)}) "
+                                            f"cho backend {text_encoder_backend}")
+        # embedding của bản export lệch chút so với eager -> tách namespace trong cache
+        self._cache_keys = {
+            m: m if text_encoder_backend == 'torch' else f"{m}:{os.path.basename(text_encoder_paths[m])}"
+            for m in self.enabled_models
+        }
 
-        # Models
+        # Models / engines / translator: đăng ký vào registry, nạp theo chế độ preload
         self.__device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.clip_model, _ = clip.load("ViT-L/14@336px", device=self.__device)
-        self.clipv2_model, _, _ = open_clip.create_model_and_transforms('ViT-L-14', device=self.__device, pretrained='datacomp_xl_s13b_b90k')
-        self.clipv2_tokenizer = open_clip.get_tokenizer('ViT-L-14')
+        self.models = ModelRegistry()
+        self.models.register('translate', Translation)
+        for m in self.enabled_models:
+            if text_encoder_backend == 'torch':
+                self.models.register(m, lambda m=m: load_eager_model(m, device=self.__device))
+            else:
+                self.models.register(m, lambda m=m: load_text_encoder(text_encoder_paths[m], num_threads=text_encoder_threads),
+                                     fork_safe=text_encoder_backend != 'onnx')
+        if 'clipv2' in self.enabled_models:
+            self.models.register('clipv2_tokenizer', lambda: open_clip.get_tokenizer(CLIPV2_MODEL_NAME))
+        engine_factories = {'object': object_retrieval, 'ocr': ocr_retrieval, 'asr': speech_retrieval}
+        for name in self.ENGINES:
+            if name in engines:
+                self.models.register(name, engine_factories[name])
+
+        if preload == 'eager':
+            self.models.preload()
+        elif preload == 'background':
+            self.models.preload(background=True)
+
+    def after_fork(self, omp_threads: int = 0):
+        """
+        Gọi trong mỗi worker ngay sau fork (server pre-fork, xem gunicorn.conf.py): index / ma trận / model đã nạp
+        ở process cha được dùng chung copy-on-write, chỉ tạo lại những gì gắn với luồng (thread pool, session ONNX).
+        omp_threads > 0: số luồng OpenMP (faiss) / torch của worker này.
+        """
+        self._search_pool = ThreadPoolExecutor(max_workers=max(2, int(self.search_workers)), thread_name_prefix='faiss-search')
+        for index in (self.index_clip, self.index_clipv2):
+            if isinstance(index, ShardedIndex):
+                index.after_fork()
+        self.models.after_fork()
+        if omp_threads:
+            faiss.omp_set_num_threads(int(omp_threads))
+            torch.set_num_threads(int(omp_threads))
+
+    # ----------------- Lazy models / engines -----------------
+    translater = property(lambda self: self.models.get('translate'))
+    clip_model = property(lambda self: self.models.get('clip'))
+    clipv2_model = property(lambda self: self.models.get('clipv2'))
+    clipv2_tokenizer = property(lambda self: self.models.get('clipv2_tokenizer'))
+    object_retrieval = property(lambda self: self.models.get('object'))
+    ocr_retrieval = property(lambda self: self.models.get('ocr'))
+    asr_retrieval = property(lambda self: self.models.get('asr'))
+
+    def resolve_model_type(self, model_type: str) -> str:
+        """Đưa model_type về model đang bật ('both' chỉ giữ khi cả hai cùng bật)."""
+        if model_type == 'both':
+            return 'both' if len(self.enabled_models) == 2 else self.enabled_models[0]
+        return model_type if model_type in self.enabled_models else self.enabled_models[0]
 
     # ----------------- Utils -----------------
     def load_json_file(self, json_path: str):
@@ -47,8 +171,64 @@ class MyFaiss:
         # Chuẩn hoá key về int để tra cứu nhất quán
         return {int(k): v for k, v in js.items()}
 
-    def load_bin_file(self, bin_file: str):
-        return faiss.read_index(bin_file)
+    def load_bin_file(self, bin_file: str, name: str = None):
+        t0 = time.perf_counter()
+        rss0 = _rss_bytes()
+        if is_shard_manifest(bin_file):
+            index = ShardedIndex.load(bin_file, read_flags(self.mmap), workers=self.search_workers)
+        else:
+            index = prepare_index(faiss.read_index(bin_file, read_flags(self.mmap)))
+        rss1 = _rss_bytes()
+
+        stats = {
+            'path': bin_file,
+            'mmap': bool(self.mmap),
+            'ntotal': int(index.ntotal),
+            'file_bytes': index.file_bytes if isinstance(index, ShardedIndex) else os.path.getsize(bin_file),
+            'shards': len(index.shards) if isinstance(index, ShardedIndex) else 1,
+            'load_sec': round(time.perf_counter() - t0, 3),
+            'resident_bytes': None if rss0 is None or rss1 is None else max(0, rss1 - rss0),
+        }
+        self.index_load_stats[name or bin_file] = stats
+        resident = 'n/a' if stats['resident_bytes'] is None else f"{stats['resident_bytes'] / 2**20:.1f}MB"
+        print(f"[FAISS] {name or bin_file}: ntotal={stats['ntotal']} shards={stats['shards']} mmap={stats['mmap']} "
+              f"load={stats['load_sec']}s resident={resident} file={stats['file_bytes'] / 2**20:.1f}MB")
+        return index
+
+    def _build_embed_matrix(self, index, spec, dtype, rerank_vectors=None):
+        """
+        (ntotal, d) embedding chưa nén của index, chỉ khi đã có sẵn: file re-rank float32 (memmap) hoặc
+        IndexFlat (view thẳng vào bộ nhớ của index, dùng chung page khi mmap). float16: copy ép kiểu (phải tự bật).
+        Index nén / ANN (IVF, PQ, HNSW, SQ) không có bản gốc -> None, tập con đi đường selector của index:
+        reconstruct_n cả corpus sẽ là một bản float32 riêng trong mỗi worker (mất cái lợi của mmap / nén)
+        và với PQ / SQ8 còn chấm điểm trên vector đã bị nén mất mát.
+        """
+        if dtype is None or spec.get('metric', 'ip') != 'ip' or index.ntotal == 0:
+            return None
+        dtype = np.dtype(dtype)
+        if rerank_vectors is not None:
+            return rerank_vectors if dtype == np.float32 else np.ascontiguousarray(rerank_vectors, dtype=dtype)
+        if isinstance(index, ShardedIndex):
+            # mỗi shard một ma trận (Flat float32 vẫn là view), tra theo id toàn cục qua ShardedRows
+            parts = [self._build_embed_matrix(shard.index, spec, dtype) for shard in index.shards]
+            if any(part is None for part in parts):
+                return None
+            return ShardedRows(parts, [shard.offset for shard in index.shards])
+        if isinstance(index, faiss.IndexFlat):
+            view = faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+            return view if dtype == np.float32 else np.ascontiguousarray(view, dtype=dtype)
+        return None
+
+    def _get_vectors(self, model_type, ids):
+        """Vector float32 của các id: ưu tiên bản gốc (re-rank memmap / ma trận), cuối cùng mới reconstruct từ index."""
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        source = self.rerank_vectors.get(model_type)
+        if source is None:
+            source = self.embed_matrix.get(model_type)
+        if source is not None:
+            return np.asarray(source[ids], dtype=np.float32)
+        index_choosed, _ = self._get_index(model_type)
+        return index_choosed.reconstruct_batch(ids)
 
     def _lookup_info(self, sid):
         """Trả về info trong id2img_fps theo sid (thử ép về int)."""
@@ -63,114 +243,243 @@ class MyFaiss:
         Lọc bỏ các id không có trong mapping; giữ đồng bộ ids/scores/image_paths/infos.
         Trả về: (np_scores, np_ids, infos_list, image_paths_list)
         """
-        kept_infos, kept_ids, kept_scores = [], [], []
-        for i, sid in enumerate(ids):
-            info = self._lookup_info(sid)
-            if info is not None and 'image_path' in info:
-                kept_infos.append(info)
-                kept_ids.append(int(sid))
-                if scores is not None:
-                    kept_scores.append(float(scores[i]))
-            # else: skip id bị thiếu
-
-        if not kept_infos:
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        keep = self.id2img_fps.contains(ids)        # một phép mask thay cho tra dict từng id
+        if not keep.any():
             return np.array([], dtype=np.float32), np.array([], dtype=np.int64), [], []
 
-        np_ids = np.array(kept_ids, dtype=np.int64)
-        np_scores = np.array(kept_scores, dtype=np.float32) if scores is not None else np.array([], dtype=np.float32)
-        image_paths = [inf['image_path'] for inf in kept_infos]
-        return np_scores, np_ids, kept_infos, image_paths
+        np_ids = ids[keep]
+        np_scores = np.asarray(scores, dtype=np.float32).ravel()[keep] if scores is not None else np.array([], dtype=np.float32)
+        # infos: dict từng keyframe chỉ tạo khi được truy cập
+        return np_scores, np_ids, self.id2img_fps.records(np_ids), self.id2img_fps.paths(np_ids)
 
     def _ensure_id_selector(self, index_array):
-        """Tạo IDSelectorArray an toàn từ list/np.array; trả None nếu mảng rỗng."""
+        """
+        Tạo IDSelectorArray an toàn từ list/np.array; trả None nếu mảng rỗng.
+        IdBitmap: dùng luôn IDSelectorBitmap đã cache; bitmap phủ toàn bộ -> None (không cần lọc).
+        """
         if index_array is None:
             return None
+        if isinstance(index_array, IdBitmap):
+            return None if index_array.is_full() else index_array.selector()
         idx = np.asarray(index_array, dtype=np.int64)
         if idx.size == 0:
             return None
         return faiss.IDSelectorArray(idx)
 
     # ---- Encode helpers (để kiểm soát kích thước) ----
-    def _encode_text(self, text: str, model_type: str) -> np.ndarray:
-        """Mã hoá text theo model_type ('clip' | 'clipv2'), trả np.float32 shape (1, d)."""
+    def _encode_texts(self, texts, model_type: str) -> np.ndarray:
+        """
+        Mã hoá một batch text theo model_type ('clip' | 'clipv2'), trả np.float32 shape (N, d).
+        Text đã có trong embed_cache thì lấy lại; các text còn lại encode trong MỘT lần forward.
+        """
+        texts = list(texts)
+        cache_key = self._cache_keys.get(model_type, model_type)
+        cached = [self.embed_cache.get(cache_key, text) for text in texts]
+        miss_texts = [text for text, vec in zip(texts, cached) if vec is None]
+        if miss_texts:
+            miss_feats = self._encode_texts_model(miss_texts, model_type)
+            it = iter(miss_feats)
+            for i, (text, vec) in enumerate(zip(texts, cached)):
+                if vec is None:
+                    cached[i] = next(it)
+                    self.embed_cache.put(cache_key, text, cached[i])
+        return np.stack(cached).astype(np.float32)
+
+    def _encode_texts_model(self, texts, model_type: str) -> np.ndarray:
+        """Chạy model thật (không qua cache), MỘT lần forward cho cả batch."""
         if model_type == 'clip':
-            toks = clip.tokenize([text]).to(self.__device)
-            feats = self.clip_model.encode_text(toks)
+            toks = clip.tokenize(list(texts), truncate=True)
         else:
-            toks = self.clipv2_tokenizer([text]).to(self.__device)
-            feats = self.clipv2_model.encode_text(toks)
-        feats = feats / feats.norm(dim=-1, keepdim=True)
+            toks = self.clipv2_tokenizer(list(texts))
+        if self.text_encoder_backend != 'torch':
+            # bản export trả sẵn embedding đã L2-normalize
+            return self.models.get(model_type)(toks)
+
+        with torch.no_grad():
+            feats = self.models.get(model_type).encode_text(toks.to(self.__device))
+            feats = feats / feats.norm(dim=-1, keepdim=True)
         return feats.detach().cpu().numpy().astype(np.float32)
 
-    # ----------------- Searches -----------------
-    def image_search(self, id_query, k):
-        # reconstruct feature từ id_query
-        query_feats = self.index_clip.reconstruct(int(id_query)).reshape(1, -1)
-
-        scores, idx_image = self.index_clip.search(query_feats, k=k)
-        scores = scores.flatten()
-        idx_image = idx_image.flatten()
-
-        # Lọc & gom thông tin (chống NoneType)
-        scores, idx_image, infos_query, image_paths = self._gather_infos(idx_image, scores)
-        return scores, idx_image, infos_query, image_paths
+    def _encode_text(self, text: str, model_type: str) -> np.ndarray:
+        """Mã hoá text theo model_type ('clip' | 'clipv2'), trả np.float32 shape (1, d)."""
+        return self._encode_texts([text], model_type)
 
-    def text_search(self, text, index, k, model_type):
-        text = self.translater(text)
+    def _get_index(self, model_type: str):
+        if model_type == 'clip':
+            return self.index_clip, self.dim_clip
+        return self.index_clipv2, self.dim_clipv2
 
-        # --- Encode theo model yêu cầu ---
-        feats = self._encode_text(text, model_type)
+    def _encode_for_index(self, texts, model_type: str):
+        """Encode batch texts; nếu dimension KHÔNG khớp index thì thử model/index còn lại. Trả (feats, model_type)."""
+        feats = self._encode_texts(texts, model_type)
         d_feat = feats.shape[1]
+        _, d_index = self._get_index(model_type)
+        if d_feat == d_index:
+            return feats, model_type
+
+        alt_model = 'clipv2' if model_type == 'clip' else 'clip'
+        if alt_model not in self.enabled_models:
+            raise ValueError(
+                f"[FAISS] Dim mismatch: text_feat={d_feat} vs index({model_type})={d_index}; "
+                f"model '{alt_model}' không được bật để thử thay thế."
+            )
+        feats_alt = self._encode_texts(texts, alt_model)
+        d_feat_alt = feats_alt.shape[1]
+        _, d_idx_alt = self._get_index(alt_model)
+        if d_feat_alt == d_idx_alt:
+            # dùng phương án thay thế
+            return feats_alt, alt_model
+        raise ValueError(
+            f"[FAISS] Dim mismatch: text_feat={d_feat} vs index({model_type})={d_index}; "
+            f"alt_feat={d_feat_alt} vs alt_index={d_idx_alt}. "
+            f"Kiểm tra lại cặp model-Index hoặc rebuild index cho khớp."
+        )
 
-        # Chọn index theo model yêu cầu
-        if model_type == 'clip':
-            index_choosed = self.index_clip
-            d_index = self.dim_clip
-        else:
-            index_choosed = self.index_clipv2
-            d_index = self.dim_clipv2
-
-        # --- Nếu dimension KHÔNG khớp, thử model/index còn lại ---
-        if d_feat != d_index:
-            alt_model = 'clipv2' if model_type == 'clip' else 'clip'
-            feats_alt = self._encode_text(text, alt_model)
-            d_feat_alt = feats_alt.shape[1]
-            idx_alt = self.index_clipv2 if model_type == 'clip' else self.index_clip
-            d_idx_alt = self.dim_clipv2 if model_type == 'clip' else self.dim_clip
-
-            if d_feat_alt == d_idx_alt:
-                # dùng phương án thay thế
-                model_type = alt_model
-                feats = feats_alt
-                index_choosed = idx_alt
-                d_index = d_idx_alt
-            else:
-                raise ValueError(
-                    f"[FAISS] Dim mismatch: text_feat={d_feat} vs index({model_type})={d_index}; "
-                    f"alt_feat={d_feat_alt} vs alt_index={d_idx_alt}. "
-                    f"Kiểm tra lại cặp model-Index hoặc rebuild index cho khớp."
-                )
+    def _index_search(self, index_choosed, spec, feats, k, subset=None, nprobe=None, ef_search=None, min_score=None):
+        """
+        index.search với SearchParameters theo spec; ShardedIndex tự tách subset theo shard và fan-out.
+        min_score != None: range_search theo ngưỡng (range_search_topk), k là số kết quả tối đa mỗi query.
+        """
+        if isinstance(index_choosed, ShardedIndex):
+            if min_score is not None:
+                return index_choosed.range_search(feats, min_score, k, spec, subset=subset, nprobe=nprobe, ef_search=ef_search)
+            return index_choosed.search(feats, k, spec, subset=subset, nprobe=nprobe, ef_search=ef_search)
+        params = make_search_params(spec, sel=self._ensure_id_selector(subset), nprobe=nprobe, ef_search=ef_search)
+        if min_score is not None:
+            return range_search_topk(index_choosed, feats, min_score, k, params=params)
+        return index_choosed.search(feats, k=k, params=params)
+
+    def _search_feats(self, feats, index, k, model_type, nprobe=None, ef_search=None, min_score=None):
+        """
+        Một lần index.search cho ma trận query (N, d).
+        min_score != None: trả mọi keyframe có score >= min_score (tối đa k, range_search_topk).
+        Trả list N phần tử (scores, ids, infos, image_paths), mỗi phần tử cho một query.
+        """
+        index_choosed, _ = self._get_index(model_type)
+        spec = self.index_specs[model_type]
+        # Index nén có file re-rank: lấy dư ứng viên rồi re-rank lại bằng float32
+        rerank_vectors = self.rerank_vectors.get(model_type)
+        k_search = k * int(spec.get('rerank_factor', 1)) if rerank_vectors is not None else k
 
         # --- ID selector (nếu có) ---
         id_sel = self._ensure_id_selector(index)
         if id_sel is None:
-            scores, idx_image = index_choosed.search(feats, k=k)
+            scores, idx_image = self._index_search(index_choosed, spec, feats, min(k_search, index_choosed.ntotal),
+                                                   nprobe=nprobe, ef_search=ef_search, min_score=min_score)
+            if rerank_vectors is not None:
+                scores, idx_image = exact_rerank(feats, idx_image, k, rerank_vectors)
         else:
-            idx_arr = np.asarray(index, dtype=np.int64)
-            if idx_arr.size == 0:
-                return np.array([], dtype=np.float32), np.array([], dtype=np.int64), [], []
-            scores, idx_image = index_choosed.search(
-                feats,
-                k=min(k, len(idx_arr)),
-                params=faiss.SearchParametersIVF(sel=id_sel)
-            )
+            n_sel = len(index)
+            if n_sel == 0:
+                empty = (np.array([], dtype=np.float32), np.array([], dtype=np.int64), [], [])
+                return [empty for _ in range(len(feats))]
+
+            matrix = self.embed_matrix.get(model_type)
+            if matrix is not None and n_sel <= self.exact_search_threshold:
+                # Tập con nhỏ: tính đúng trên ma trận embedding, không cần duyệt toàn index
+                ids = index.to_ids() if isinstance(index, IdBitmap) else np.unique(np.asarray(index, dtype=np.int64))
+                scores, idx_image = exact_subset_search(feats, matrix, ids, k)
+            else:
+                scores, idx_image = self._index_search(index_choosed, spec, feats, min(k_search, n_sel), subset=index,
+                                                       nprobe=nprobe, ef_search=ef_search, min_score=min_score)
+                if rerank_vectors is not None:
+                    scores, idx_image = exact_rerank(feats, idx_image, k, rerank_vectors)
 
-        scores = scores.flatten()
-        idx_image = idx_image.flatten()
+        if min_score is not None:
+            # điểm sau re-rank / exact có thể rơi dưới ngưỡng
+            scores, idx_image = threshold_results(scores, idx_image, min_score)
 
         # --- GET INFOS KEYFRAMES_ID (robust) ---
-        scores, idx_image, infos_query, image_paths = self._gather_infos(idx_image, scores)
-        return scores, idx_image, infos_query, image_paths
+        return [self._gather_infos(row_ids, row_scores) for row_scores, row_ids in zip(scores, idx_image)]
+
+    # ----------------- Searches -----------------
+    def _merge_results(self, results, k=None):
+        """Cộng điểm (đã chuẩn hoá) của nhiều kết quả (scores, ids, ...) rồi lấy infos; bỏ kết quả rỗng."""
+        lists = [(res[0], res[1]) for res in results if res[1].size]
+        if not lists:
+            return np.array([], dtype=np.float32), np.array([], dtype=np.int64), [], []
+        scores, ids = merge_searching_results_by_addition([s for s, _ in lists], [i for _, i in lists])
+        if k is not None:
+            scores, ids = scores[:k], ids[:k]
+        return self._gather_infos(ids, scores)
+
+    def image_search(self, id_query, k, index=None, model_type=None, text=None, mode='centroid', nprobe=None, ef_search=None,
+                     min_score=None):
+        """
+        id_query: một id hoặc list id ảnh mẫu; vector lấy một lần cho cả list (bản float32 gốc nếu có, không thì reconstruct_batch).
+        text: (tuỳ chọn) thêm text query làm một ví dụ nữa.
+        mode: 'centroid' (trung bình các ví dụ -> 1 query) | 'multi' (mỗi ví dụ một query trong cùng batch, cộng điểm).
+        model_type: 'clip' | 'clipv2' | 'both' (cộng điểm 2 model); None -> model mặc định.
+        index: search_space / filter / ignore (IdBitmap hoặc mảng id) như text_search.
+        min_score: chế độ ngưỡng như text_search (k là trần số kết quả).
+        """
+        ids = np.atleast_1d(np.asarray(id_query, dtype=np.int64))
+        model_type = self.resolve_model_type(model_type or self.enabled_models[0])
+        model_types = self.enabled_models if model_type == 'both' else (model_type,)
+        text = self.translater(text) if text else None
+
+        def run(sub_model):
+            feats = self._get_vectors(sub_model, ids).reshape(len(ids), -1)
+            if text:
+                feats = np.concatenate([feats, self._encode_texts([text], sub_model)], axis=0)
+            if mode == 'centroid' and len(feats) > 1:
+                feats = feats.mean(axis=0, keepdims=True)
+                feats /= max(float(np.linalg.norm(feats)), 1e-12)
+            per_query = self._search_feats(feats, index, k, sub_model, nprobe=nprobe, ef_search=ef_search,
+                                           min_score=min_score)
+            return per_query[0] if len(per_query) == 1 else self._merge_results(per_query, k)
+
+        if len(model_types) == 1:
+            return run(model_types[0])
+        futures = [self._search_pool.submit(run, sub_model) for sub_model in model_types]
+        return self._merge_results([future.result() for future in futures], k)
+
+    def _search_both(self, texts, index, k, nprobe=None, ef_search=None, min_score=None):
+        """
+        Mode 'both': nhánh clip và clipv2 (encode + search) chạy song song trong _search_pool,
+        sau đó cộng điểm từng query. texts đã được dịch. Trả list (scores, ids, infos, image_paths).
+        """
+        def run(sub_model):
+            feats, sub_model = self._encode_for_index(texts, sub_model)
+            return self._search_feats(feats, index, k, sub_model, nprobe=nprobe, ef_search=ef_search, min_score=min_score)
+
+        futures = [self._search_pool.submit(run, sub_model) for sub_model in ('clip', 'clipv2')]
+        per_model = [future.result() for future in futures]
+
+        return [self._merge_results(pair) for pair in zip(*per_model)]
+
+    def text_search(self, text, index, k, model_type, nprobe=None, ef_search=None, min_score=None):
+        """
+        model_type: 'clip' | 'clipv2' | 'both' ('both': dịch một lần, 2 nhánh chạy song song rồi cộng điểm).
+        nprobe / ef_search: ghi đè tham số search của index IVF / HNSW cho riêng query này.
+        min_score: trả mọi keyframe có cosine >= min_score thay vì đúng k; k khi đó là trần số kết quả.
+        """
+        text = self.translater(text)
+        model_type = self.resolve_model_type(model_type)
+        if model_type == 'both':
+            return self._search_both([text], index, k, nprobe=nprobe, ef_search=ef_search, min_score=min_score)[0]
+
+        # --- Encode theo model yêu cầu ---
+        feats, model_type = self._encode_for_index([text], model_type)
+        return self._search_feats(feats, index, k, model_type, nprobe=nprobe, ef_search=ef_search, min_score=min_score)[0]
+
+    def text_search_batch(self, texts, index, k, model_type, nprobe=None, ef_search=None, min_score=None):
+        """
+        Tìm nhiều query cùng lúc: encode N query trong một lần forward mỗi model, một index.search với ma trận (N, d).
+        model_type: 'clip' | 'clipv2' | 'both' ('both' cộng điểm 2 model như /textsearch).
+        Trả list N phần tử (scores, ids, infos, image_paths) theo đúng thứ tự texts.
+        """
+        texts = [self.translater(text) for text in texts]
+        if not texts:
+            return []
+
+        model_type = self.resolve_model_type(model_type)
+        if model_type == 'both':
+            return self._search_both(texts, index, k, nprobe=nprobe, ef_search=ef_search, min_score=min_score)
+
+        feats, model_type = self._encode_for_index(texts, model_type)
+        return self._search_feats(feats, index, k, model_type, nprobe=nprobe, ef_search=ef_search, min_score=min_score)
 
     # ----------------- ASR helpers -----------------
     def asr_post_processing(self, tmp_asr_scores, tmp_asr_idx_image, k):
@@ -243,21 +552,21 @@ class MyFaiss:
         scores, idx_image = [], []
 
         # OBJECT
-        if object_input is not None:
+        if object_input is not None and self.models.is_enabled('object'):
             object_scores, object_idx_image = self.object_retrieval(object_input, k=k, index=index)
             if object_scores.size and object_idx_image.size:
                 scores.append(object_scores)
                 idx_image.append(object_idx_image)
 
         # OCR
-        if ocr_input is not None:
+        if ocr_input is not None and self.models.is_enabled('ocr'):
             ocr_scores, ocr_idx_image = self.ocr_retrieval(ocr_input, k=k, index=index)
             if ocr_scores.size and ocr_idx_image.size:
                 scores.append(ocr_scores)
                 idx_image.append(ocr_idx_image)
 
         # ASR
-        if asr_input is not None:
+        if asr_input is not None and self.models.is_enabled('asr'):
             if not useid:
                 asr_scores, asr_idx_image = self.asr_retrieval_helper(asr_input, k, None, semantic, keyword)
             else:
@@ -277,62 +586,55 @@ class MyFaiss:
         return scores, idx_image, infos_query, image_paths
 
     # ----------------- Reranking -----------------
-    def reranking(self, prev_result, lst_pos_vote_idxs, lst_neg_vote_idxs, k):
+    def _feedback_scores(self, model_type, candidate_ids, pos_ids, neg_ids, beta):
+        """Rocchio: q = mean(vote dương) - beta * mean(vote âm); điểm mọi ứng viên = một phép nhân (N, d) @ (d,)."""
+        cand_feats = self._get_vectors(model_type, candidate_ids)
+        query = np.zeros(cand_feats.shape[1], dtype=np.float32)
+        if len(pos_ids):
+            query += self._get_vectors(model_type, pos_ids).mean(axis=0)
+        if len(neg_ids):
+            query -= beta * self._get_vectors(model_type, neg_ids).mean(axis=0)
+        return cand_feats @ query
+
+    def reranking(self, prev_result, lst_pos_vote_idxs, lst_neg_vote_idxs, k, model_type=None, alpha=1.0, beta=0.5):
         """
-        Perform reranking using user feedback
+        Perform reranking using user feedback (Rocchio).
+        Điểm mới = alpha * điểm cũ + <embedding ứng viên, mean(pos) - beta * mean(neg)>, chỉ trên tập ứng viên của prev_result;
+        id bị vote âm bị loại. model_type: 'clip' | 'clipv2' | 'both' (cộng điểm 2 model), None -> model mặc định.
+        Mọi ứng viên đều được chấm điểm nên k không còn giới hạn số láng giềng mỗi vote (giữ tham số cho tương thích).
         """
-        lst_vote_idxs = []
-        lst_vote_idxs.extend(lst_pos_vote_idxs or [])
-        lst_vote_idxs.extend(lst_neg_vote_idxs or [])
-        if not lst_vote_idxs:
+        pos_ids = np.asarray(lst_pos_vote_idxs or [], dtype=np.int64)
+        neg_ids = np.asarray(lst_neg_vote_idxs or [], dtype=np.int64)
+        if not pos_ids.size and not neg_ids.size:
             return [], [], [], []
 
-        lst_vote_idxs = np.asarray(lst_vote_idxs, dtype=np.int64)
-        len_pos = len(lst_pos_vote_idxs or [])
-
-        # Tập ứng viên ban đầu (từ prev_result)
+        # Tập ứng viên ban đầu (từ prev_result); id lặp lại lấy điểm sau cùng như trước
         result = {}
         for item in prev_result:
             for id_, score in zip(item['video_info']['lst_idxs'], item['video_info']['lst_scores']):
                 result[int(id_)] = float(score)
-
-        # Loại bỏ id bị vote âm khỏi tập ứng viên ban đầu
-        for key in (lst_neg_vote_idxs or []):
-            result.pop(int(key), None)
-
-        if not result:
+        candidate_ids = np.fromiter(result.keys(), dtype=np.int64, count=len(result))
+        prev_scores = np.fromiter(result.values(), dtype=np.float32, count=len(result))
+
+        # Loại bỏ id bị vote âm + id ngoài index
+        model_type = self.resolve_model_type(model_type or self.enabled_models[0])
+        model_types = self.enabled_models if model_type == 'both' else (model_type,)
+        ntotal = min(int(self._get_index(m)[0].ntotal) for m in model_types)
+        keep = ~np.isin(candidate_ids, neg_ids) & (candidate_ids >= 0) & (candidate_ids < ntotal)
+        candidate_ids, prev_scores = candidate_ids[keep], prev_scores[keep]
+        if not candidate_ids.size:
             return [], [], [], []
+        pos_ids = pos_ids[(pos_ids >= 0) & (pos_ids < ntotal)]
+        neg_ids = neg_ids[(neg_ids >= 0) & (neg_ids < ntotal)]
 
-        # Giới hạn tìm trong tập ứng viên
-        candidate_ids = np.array(list(result.keys()), dtype=np.int64)
-        id_selector = faiss.IDSelectorArray(candidate_ids)
-
-        # Query features từ các id vote
-        query_feats = self.index_clip.reconstruct_batch(lst_vote_idxs)
-        lst_scores, lst_idx_images = self.index_clip.search(
-            query_feats, k=min(k, len(candidate_ids)), params=faiss.SearchParametersIVF(sel=id_selector)
-        )
+        scores = alpha * prev_scores
+        for m in model_types:
+            scores = scores + self._feedback_scores(m, candidate_ids, pos_ids, neg_ids, beta)
 
-        # Cộng/trừ điểm theo vote dương/âm
-        for i, (scores, idx_images) in enumerate(zip(lst_scores, lst_idx_images)):
-            for score, idx_image in zip(scores, idx_images):
-                idx_image = int(idx_image)
-                if i < len_pos:
-                    result[idx_image] = result.get(idx_image, 0.0) + float(score)
-                else:
-                    result[idx_image] = result.get(idx_image, 0.0) - float(score)
-
-        # Sắp xếp & trả kết quả
-        result_sorted = sorted(result.items(), key=lambda x: x[1], reverse=True)
-        list_ids = [item[0] for item in result_sorted]
-        lst_scores = [item[1] for item in result_sorted]
-        _, list_ids_np, infos_query, list_image_paths = self._gather_infos(list_ids, lst_scores)
-
-        # Đồng bộ lại scores theo list_ids_np đã được lọc
-        list_ids_set = set(list_ids_np.tolist())
-        lst_scores_filtered = [float(s) for (i, s) in result_sorted if i in list_ids_set]
-
-        return lst_scores_filtered, list_ids_np.tolist(), infos_query, list_image_paths
+        # Sắp xếp & trả kết quả (_gather_infos giữ đồng bộ ids / scores khi bỏ id thiếu mapping)
+        order = np.argsort(-scores, kind='stable')
+        lst_scores, list_ids_np, infos_query, list_image_paths = self._gather_infos(candidate_ids[order], scores[order])
+        return lst_scores.tolist(), list_ids_np.tolist(), infos_query, list_image_paths
 
 
 # ================== Demo giữ nguyên (nếu cần) ==================
@@ -0,0 +1,86 @@
+"""
+JSON cho response: ghi thẳng mảng / scalar NumPy (không đổi từng phần tử bằng int() / float()) và nén gzip / brotli.
+Có orjson thì dùng orjson (OPT_SERIALIZE_NUMPY), không thì json chuẩn với default đổi NumPy -> list / số.
+"""
+import json
+import gzip
+import numpy as np
+from collections.abc import Sequence
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _default(obj):
+    """Kiểu orjson / json không tự ghi được: mảng không liên tục, memmap, float16, scalar NumPy, KeyframeRecords..."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (Sequence, set, frozenset)) and not isinstance(obj, (str, bytes)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def choose_encoding(accept_encoding: str):
+    """'br' nếu client nhận và có brotli, không thì 'gzip', không nhận gì -> None."""
+    accepted = {part.split(';')[0].strip().lower() for part in (accept_encoding or '').split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body: bytes, encoding: str, level: int = 5) -> bytes:
+    """level 0..9; brotli quality cùng thang (nhanh, đủ cho response động)."""
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level)
+
+
+def compress_response(resp, accept_encoding: str, min_bytes: int, level: int = 5):
+    """Nén response JSON >= min_bytes theo Accept-Encoding (min_bytes <= 0: tắt); file / ảnh / video (send_file) giữ nguyên."""
+    if (min_bytes <= 0 or resp.mimetype != 'application/json' or resp.direct_passthrough
+            or resp.status_code != 200 or 'Content-Encoding' in resp.headers):
+        return resp
+    resp.vary.add('Accept-Encoding')
+    body = resp.get_data()
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None or len(body) < min_bytes:
+        return resp
+    resp.set_data(compress(body, encoding, level))
+    resp.headers['Content-Encoding'] = encoding
+    return resp
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """app.json = FastJSONProvider(app): jsonify / request.get_json dùng dumps / loads ở trên."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
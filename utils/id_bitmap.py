@@ -0,0 +1,94 @@
+import numpy as np
+import faiss
+
+# popcount cho từng byte (dùng khi numpy chưa có np.bitwise_count)
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class IdBitmap:
+    """
+    Tập id keyframe dạng bitmap (bit i <-> id i, thứ tự bit 'little' giống faiss.IDSelectorBitmap).
+    Kết hợp filter bằng & | ~ thay cho np.intersect1d; selector FAISS được tạo một lần và cache lại.
+    """
+
+    def __init__(self, bits: np.ndarray, n: int):
+        self.n = int(n)
+        self.bits = np.ascontiguousarray(bits, dtype=np.uint8)
+        self._selector = None
+        self._count = None
+
+    # ----------------- Constructors -----------------
+    @classmethod
+    def from_ids(cls, ids, n: int):
+        mask = np.zeros(int(n), dtype=bool)
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        mask[ids[(ids >= 0) & (ids < n)]] = True
+        return cls.from_mask(mask)
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray):
+        mask = np.asarray(mask, dtype=bool)
+        return cls(np.packbits(mask, bitorder='little'), len(mask))
+
+    @classmethod
+    def full(cls, n: int):
+        return cls.from_mask(np.ones(int(n), dtype=bool))
+
+    # ----------------- Set ops -----------------
+    def __and__(self, other):
+        return IdBitmap(self.bits & other.bits, self.n)
+
+    def __or__(self, other):
+        return IdBitmap(self.bits | other.bits, self.n)
+
+    def __invert__(self):
+        # đảo bit rồi xoá các bit thừa ở byte cuối (id >= n)
+        bits = np.bitwise_not(self.bits)
+        if self.n % 8 and bits.size:
+            bits[-1] &= (1 << (self.n % 8)) - 1
+        return IdBitmap(bits, self.n)
+
+    # ----------------- Queries -----------------
+    def count(self) -> int:
+        if self._count is None:
+            if hasattr(np, 'bitwise_count'):
+                self._count = int(np.bitwise_count(self.bits).sum())
+            else:
+                self._count = int(_POPCOUNT[self.bits].sum(dtype=np.int64))
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def is_full(self) -> bool:
+        return self.count() == self.n
+
+    def contains(self, ids) -> np.ndarray:
+        """Mask bool: id nào trong `ids` thuộc bitmap."""
+        ids = np.asarray(ids, dtype=np.int64)
+        valid = (ids >= 0) & (ids < self.n)
+        safe = np.where(valid, ids, 0)
+        return valid & (((self.bits[safe >> 3] >> (safe & 7)) & 1) == 1)
+
+    def slice(self, start: int, stop: int):
+        """Bitmap con cho id trong [start, stop), đánh lại id từ 0 (dùng cho shard có offset)."""
+        start, stop = max(0, int(start)), min(self.n, int(stop))
+        n = max(0, stop - start)
+        if start % 8:
+            return IdBitmap.from_mask(self.to_mask()[start:stop])
+        bits = self.bits[start >> 3:(start + n + 7) >> 3].copy()
+        if n % 8 and bits.size:
+            bits[-1] &= (1 << (n % 8)) - 1
+        return IdBitmap(bits, n)
+
+    def to_mask(self) -> np.ndarray:
+        return np.unpackbits(self.bits, bitorder='little', count=self.n).astype(bool)
+
+    def to_ids(self) -> np.ndarray:
+        return np.flatnonzero(self.to_mask()).astype(np.int64)
+
+    def selector(self):
+        """faiss.IDSelectorBitmap trỏ thẳng vào self.bits (giữ tham chiếu trong object)."""
+        if self._selector is None:
+            self._selector = faiss.IDSelectorBitmap(len(self.bits), faiss.swig_ptr(self.bits))
+        return self._selector
@@ -0,0 +1,230 @@
+import os
+import json
+import faiss
+import numpy as np
+
+# Các loại index hỗ trợ và chuỗi index_factory tương ứng
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw', 'sq8', 'sq_fp16')
+
+DEFAULT_SPEC = {
+    'type': 'flat',
+    'metric': 'ip',
+    'nlist': 4096,        # số cụm IVF
+    'pq_m': 64,           # số sub-quantizer PQ (phải chia hết dim)
+    'pq_nbits': 8,
+    'hnsw_m': 32,
+    'ef_construction': 200,
+    'nprobe': 32,         # mặc định lúc search (IVF)
+    'ef_search': 128,     # mặc định lúc search (HNSW)
+    'rerank_path': None,  # .npy float32 (mmap) để re-rank chính xác top ứng viên; None -> không re-rank
+    'rerank_factor': 4,   # lấy k * rerank_factor ứng viên từ index nén rồi re-rank về k
+}
+
+
+def spec_path_for(bin_file: str) -> str:
+    """faiss_clip_cosine.bin -> faiss_clip_cosine.spec.json (nằm cạnh file bin)."""
+    return os.path.splitext(bin_file)[0] + '.spec.json'
+
+
+def factory_string(spec: dict) -> str:
+    """Chuỗi faiss.index_factory theo spec."""
+    kind = spec['type']
+    if kind == 'flat':
+        return 'Flat'
+    if kind == 'ivf_flat':
+        return f"IVF{int(spec['nlist'])},Flat"
+    if kind == 'ivf_pq':
+        return f"IVF{int(spec['nlist'])},PQ{int(spec['pq_m'])}x{int(spec['pq_nbits'])}"
+    if kind == 'hnsw':
+        return f"HNSW{int(spec['hnsw_m'])},Flat"
+    if kind == 'sq8':
+        return 'SQ8'
+    if kind == 'sq_fp16':
+        return 'SQfp16'
+    raise ValueError(f"[FAISS] Unknown index type '{kind}', expected one of {INDEX_TYPES}")
+
+
+def metric_of(spec: dict):
+    return faiss.METRIC_INNER_PRODUCT if spec.get('metric', 'ip') == 'ip' else faiss.METRIC_L2
+
+
+def infer_spec(index) -> dict:
+    """Đoán spec từ chính index (dùng cho file bin cũ không có spec.json)."""
+    spec = dict(DEFAULT_SPEC)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        spec['type'] = 'ivf_pq' if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else 'ivf_flat'
+        spec['nlist'] = int(ivf.nlist)
+        spec['nprobe'] = int(ivf.nprobe)
+    elif isinstance(index, faiss.IndexHNSW):
+        spec['type'] = 'hnsw'
+        spec['ef_search'] = int(index.hnsw.efSearch)
+    elif isinstance(index, faiss.IndexScalarQuantizer):
+        spec['type'] = 'sq_fp16' if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else 'sq8'
+    else:
+        spec['type'] = 'flat'
+    spec['dim'] = int(index.d)
+    spec['ntotal'] = int(index.ntotal)
+    return spec
+
+
+def load_index_spec(bin_file: str, index=None) -> dict:
+    """Đọc spec.json cạnh file bin; nếu không có thì suy ra từ index."""
+    path = spec_path_for(bin_file)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            spec = dict(DEFAULT_SPEC, **json.load(f))
+        return spec
+    if index is None:
+        return dict(DEFAULT_SPEC)
+    return infer_spec(index)
+
+
+def save_index_spec(bin_file: str, spec: dict):
+    with open(spec_path_for(bin_file), 'w', encoding='utf-8') as f:
+        json.dump(spec, f, ensure_ascii=False, indent=2)
+
+
+def prepare_index(index):
+    """IVF cần direct map để reconstruct() (image_search / reranking)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+    return index
+
+
+def make_search_params(spec: dict, sel=None, nprobe=None, ef_search=None):
+    """
+    Tạo SearchParameters đúng loại cho index (IVF / HNSW / Flat).
+    nprobe / ef_search = None -> dùng mặc định ghi trong spec.
+    Trả None nếu không cần tham số (flat, không có selector).
+    """
+    kind = spec.get('type', 'flat')
+    args = {}
+    if sel is not None:
+        args['sel'] = sel
+    if kind in ('ivf_flat', 'ivf_pq'):
+        args['nprobe'] = int(nprobe if nprobe is not None else spec['nprobe'])
+        return faiss.SearchParametersIVF(**args)
+    if kind == 'hnsw':
+        args['efSearch'] = int(ef_search if ef_search is not None else spec['ef_search'])
+        return faiss.SearchParametersHNSW(**args)
+    if not args:
+        return None
+    return faiss.SearchParameters(**args)
+
+
+def read_flags(mmap: bool = False) -> int:
+    """
+    Cờ cho faiss.read_index. mmap=True: map file read-only thay vì copy vào RAM,
+    nhiều worker cùng host dùng chung page cache (IVF lists + codes của Flat nếu faiss hỗ trợ IFC).
+    """
+    if not mmap:
+        return 0
+    return faiss.IO_FLAG_MMAP | getattr(faiss, 'IO_FLAG_MMAP_IFC', 0) | faiss.IO_FLAG_READ_ONLY
+
+
+# ----------------- Re-rank -----------------
+def load_rerank_vectors(bin_file: str, spec: dict):
+    """Mở file .npy float32 của spec['rerank_path'] ở chế độ mmap (đường dẫn tương đối tính từ thư mục file bin)."""
+    path = spec.get('rerank_path')
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(bin_file)), path)
+    return np.load(path, mmap_mode='r')
+
+
+def exact_rerank(feats, ids, k, vectors):
+    """
+    Re-rank ứng viên từ index nén bằng vector float32 gốc.
+    feats: (N, d) query; ids: (N, k') ứng viên (-1 = trống); vectors: (ntotal, d) float32 (thường là memmap).
+    Trả (scores, ids) shape (N, min(k, k')), id trống vẫn là -1 ở cuối.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    valid = ids >= 0
+    safe = np.where(valid, ids, 0)
+    # đọc từ memmap theo thứ tự tăng dần để truy cập đĩa tuần tự hơn
+    uniq, inverse = np.unique(safe, return_inverse=True)
+    cand = np.asarray(vectors[uniq], dtype=np.float32)[inverse.reshape(safe.shape)]   # (N, k', d)
+    scores = np.einsum('nd,nkd->nk', np.asarray(feats, dtype=np.float32), cand)
+    scores = np.where(valid, scores, -np.inf)
+
+    k = min(int(k), ids.shape[1])
+    order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    top_scores = np.take_along_axis(scores, order, axis=1)
+    top_ids = np.take_along_axis(ids, order, axis=1)
+    top_ids[~np.isfinite(top_scores)] = -1
+    return top_scores.astype(np.float32), top_ids
+
+
+def exact_subset_search(feats, matrix, ids, k):
+    """
+    Chấm điểm đúng tập con ids trên ma trận embedding: gather (m, d) rồi feats @ sub.T, top-k bằng argpartition.
+    id ngoài [0, len(matrix)) bị bỏ; trả (scores, ids) shape (N, min(k, số id hợp lệ)), sắp giảm dần.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    ids = ids[(ids >= 0) & (ids < len(matrix))]
+    if ids.size == 0:
+        return np.empty((len(feats), 0), dtype=np.float32), np.empty((len(feats), 0), dtype=np.int64)
+    sub = np.asarray(matrix[ids]).astype(np.float32, copy=False)
+    sims = np.asarray(feats, dtype=np.float32) @ sub.T            # (N, m)
+    k = min(int(k), ids.size)
+    if k < ids.size:
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(ids.size), (len(sims), ids.size))
+    top = np.take_along_axis(sims, part, axis=1)
+    order = np.argsort(-top, axis=1, kind='stable')
+    part = np.take_along_axis(part, order, axis=1)
+    return np.take_along_axis(top, order, axis=1), ids[part]
+
+
+# ----------------- Range search (ngưỡng điểm) -----------------
+def threshold_results(scores, ids, min_score):
+    """
+    Bỏ kết quả có score < min_score (id -> -1) và cắt cột thừa. Mỗi hàng đã sắp giảm dần nên phần hợp lệ là tiền tố.
+    Trả (scores, ids) shape (N, số kết quả nhiều nhất của một hàng).
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    ids = np.where((np.asarray(ids) >= 0) & (scores >= min_score), ids, -1).astype(np.int64)
+    width = int((ids >= 0).sum(axis=1).max()) if ids.size else 0
+    return scores[:, :width], ids[:, :width]
+
+
+def range_search_topk(index, feats, min_score, cap, params=None, query_batch: int = 16):
+    """
+    Mọi id có score >= min_score, mỗi query tối đa `cap` id điểm cao nhất; trả (scores, ids) shape (N, <= cap),
+    sắp giảm dần, ô trống -1 (như index.search).
+    index.range_search theo từng lô query_batch query (Flat / IVF / SQ): chi phí theo số kết quả thật sự vượt ngưỡng.
+    Query nào có hơn cap hit (ngưỡng quá thấp) và HNSW (range_search không đầy đủ) -> search(k=cap) rồi lọc ngưỡng.
+    """
+    feats = np.ascontiguousarray(feats, dtype=np.float32)
+    cap = max(1, min(int(cap), int(index.ntotal)))
+    if isinstance(index, faiss.IndexHNSW):
+        scores, ids = index.search(feats, cap, params=params)
+        return threshold_results(scores, ids, min_score)
+
+    out_scores = np.full((len(feats), cap), -np.inf, dtype=np.float32)
+    out_ids = np.full((len(feats), cap), -1, dtype=np.int64)
+    over = []
+    for start in range(0, len(feats), max(1, int(query_batch))):
+        batch = feats[start:start + max(1, int(query_batch))]
+        try:
+            lims, D, I = index.range_search(batch, float(min_score), params=params)
+        except RuntimeError:
+            over.extend(range(start, start + len(batch)))
+            continue
+        lims = lims.astype(np.int64)
+        for q, (a, b) in enumerate(zip(lims[:-1].tolist(), lims[1:].tolist())):
+            if b - a > cap:
+                over.append(start + q)
+            elif b > a:
+                order = np.argsort(-D[a:b], kind='stable')
+                out_scores[start + q, :b - a] = D[a:b][order]
+                out_ids[start + q, :b - a] = I[a:b][order]
+        del lims, D, I
+    if over:
+        over = np.asarray(over, dtype=np.int64)
+        out_scores[over], out_ids[over] = index.search(feats[over], cap, params=params)
+    return threshold_results(out_scores, out_ids, min_score)
@@ -0,0 +1,265 @@
+"""
+Metadata keyframe dạng cột (thay dict-of-dicts của id2img_fps.json), lưu thành một file mmap được.
+
+Ví dụ:
+    python -m utils.keyframe_store --json dict/id2img_fps.json        # ghi dict/id2img_fps.kfstore
+
+Cột theo id (0..n-1): sec (float64, NaN = không có), frame_idx (int64), video (int32, mã trong bảng scene prefix
+'L01/V001/lst_shot'), shot (int32), valid (bool), đường dẫn ảnh = path_bytes[path_offsets[i]:path_offsets[i + 1]].
+MyFaiss / app tự dựng lại file khi id2img_fps.json đổi (size / mtime khác header).
+"""
+import os
+import json
+import argparse
+from collections.abc import Sequence
+import numpy as np
+
+STORE_MAGIC = b'KFSTORE1'
+_ALIGN = 64
+
+
+def store_path_for(json_path: str) -> str:
+    """dict/id2img_fps.json -> dict/id2img_fps.kfstore (nằm cạnh file json)."""
+    return os.path.splitext(json_path)[0] + '.kfstore'
+
+
+def _source_stamp(json_path: str) -> dict:
+    st = os.stat(json_path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+class KeyframeRecords(Sequence):
+    """List info (dict như id2img_fps cũ) tạo khi truy cập, cho các chỗ vẫn cần từng dict."""
+
+    def __init__(self, store, ids):
+        self.store = store
+        self.ids = np.asarray(ids, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return KeyframeRecords(self.store, self.ids[i])
+        return self.store[int(self.ids[i])]
+
+
+class KeyframeStore:
+    """
+    Các cột NumPy + bảng đường dẫn nối liền (không có một object Python cho mỗi keyframe).
+    Truy cập vector hoá: gather(ids) lấy mọi cột cho cả mảng id; paths(ids) trả list đường dẫn.
+    Vẫn giữ giao diện dict (store[id], .get, .items, in, len) cho code cũ.
+    """
+
+    COLUMNS = ('sec', 'frame_idx', 'video', 'shot', 'valid', 'path_offsets', 'path_bytes')
+
+    def __init__(self, columns: dict, video_keys):
+        self.sec = columns['sec']
+        self.frame_idx = columns['frame_idx']
+        self.video = columns['video']
+        self.shot = columns['shot']
+        self.valid = columns['valid']
+        self.path_offsets = columns['path_offsets']
+        self.path_bytes = columns['path_bytes']
+        self.video_keys = list(video_keys)
+        self.n = int(len(self.valid))
+        self._count = int(np.count_nonzero(self.valid))
+
+    # ----------------- Build -----------------
+    @classmethod
+    def from_dict(cls, id2img_fps: dict):
+        n = max((int(k) for k in id2img_fps), default=-1) + 1
+        sec = np.full(n, np.nan, dtype=np.float64)
+        frame_idx = np.full(n, -1, dtype=np.int64)
+        video = np.full(n, -1, dtype=np.int32)
+        shot = np.full(n, -1, dtype=np.int32)
+        valid = np.zeros(n, dtype=bool)
+        paths = [b''] * n
+        video_codes = {}
+        for key, info in id2img_fps.items():
+            i = int(key)
+            if not info or 'image_path' not in info:
+                continue
+            valid[i] = True
+            paths[i] = str(info['image_path']).encode('utf-8')
+            if info.get('sec') is not None:
+                sec[i] = float(info['sec'])
+            if info.get('frame_idx') is not None:
+                frame_idx[i] = int(info['frame_idx'])
+            prefix, _, shot_str = str(info.get('scene_idx') or '').rpartition('/')
+            if prefix and shot_str.isdigit():
+                video[i] = video_codes.setdefault(prefix, len(video_codes))
+                shot[i] = int(shot_str)
+        lengths = np.fromiter((len(p) for p in paths), dtype=np.int64, count=n)
+        path_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        path_bytes = np.frombuffer(b''.join(paths), dtype=np.uint8)
+        columns = {'sec': sec, 'frame_idx': frame_idx, 'video': video, 'shot': shot, 'valid': valid,
+                   'path_offsets': path_offsets, 'path_bytes': path_bytes}
+        return cls(columns, sorted(video_codes, key=video_codes.get))
+
+    @classmethod
+    def from_json(cls, json_path: str):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    # ----------------- File (header JSON + các cột căn 64 byte) -----------------
+    def save(self, path: str, source: dict = None):
+        header = {'n': self.n, 'video_keys': self.video_keys, 'source': source or {}, 'columns': {}}
+        offset = 0
+        for name in self.COLUMNS:
+            arr = np.ascontiguousarray(getattr(self, name))
+            header['columns'][name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+            offset += -(-arr.nbytes // _ALIGN) * _ALIGN
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        data_start = -(-(len(STORE_MAGIC) + 8 + len(header_bytes)) // _ALIGN) * _ALIGN
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(STORE_MAGIC)
+            f.write(np.int64(len(header_bytes)).tobytes())
+            f.write(header_bytes)
+            for name in self.COLUMNS:
+                f.seek(data_start + header['columns'][name]['offset'])
+                f.write(np.ascontiguousarray(getattr(self, name)).tobytes())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def read_header(path: str):
+        with open(path, 'rb') as f:
+            if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+                raise ValueError(f"[KeyframeStore] {path} không phải file kfstore")
+            size = int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+            header = json.loads(f.read(size).decode('utf-8'))
+        header['data_start'] = -(-(len(STORE_MAGIC) + 8 + size) // _ALIGN) * _ALIGN
+        return header
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        header = cls.read_header(path)
+        columns = {}
+        for name, meta in header['columns'].items():
+            shape = tuple(meta['shape'])
+            offset = header['data_start'] + meta['offset']
+            if int(np.prod(shape)) == 0:
+                columns[name] = np.zeros(shape, dtype=meta['dtype'])
+            elif mmap:
+                columns[name] = np.memmap(path, dtype=meta['dtype'], mode='r', offset=offset, shape=shape)
+            else:
+                columns[name] = np.fromfile(path, dtype=meta['dtype'], count=int(np.prod(shape)), offset=offset).reshape(shape)
+        return cls(columns, header['video_keys'])
+
+    @classmethod
+    def open(cls, json_path: str, store_path: str = None, mmap: bool = True):
+        """Dùng file .kfstore nếu còn khớp json (size + mtime), không thì dựng từ json rồi ghi lại."""
+        store_path = store_path or store_path_for(json_path)
+        source = _source_stamp(json_path)
+        if os.path.exists(store_path):
+            try:
+                if cls.read_header(store_path).get('source') == source:
+                    return cls.load(store_path, mmap=mmap)
+            except (ValueError, OSError) as e:
+                print(f"[KeyframeStore] {e}")
+        store = cls.from_json(json_path)
+        try:
+            store.save(store_path, source=source)
+        except OSError as e:
+            print(f"[KeyframeStore] Không ghi được {store_path}: {e}")
+            return store
+        return cls.load(store_path, mmap=mmap) if mmap else store
+
+    # ----------------- Vectorized accessors -----------------
+    def contains(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        inside = (ids >= 0) & (ids < self.n)
+        out = np.zeros(ids.shape, dtype=bool)
+        out[inside] = self.valid[ids[inside]]
+        return out
+
+    def gather(self, ids) -> dict:
+        """Mọi cột số cho mảng id (id phải hợp lệ, lọc trước bằng contains)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        return {'ids': ids, 'sec': self.sec[ids], 'frame_idx': self.frame_idx[ids],
+                'video': self.video[ids], 'shot': self.shot[ids]}
+
+    def path(self, i: int) -> str:
+        return bytes(self.path_bytes[self.path_offsets[i]:self.path_offsets[i + 1]]).decode('utf-8')
+
+    def paths(self, ids):
+        starts, stops = self.path_offsets[ids], self.path_offsets[np.asarray(ids, dtype=np.int64) + 1]
+        buf = self.path_bytes
+        return [bytes(buf[a:b]).decode('utf-8') for a, b in zip(starts.tolist(), stops.tolist())]
+
+    def secs(self, ids):
+        """List sec cho JSON (None nếu không có / id không tồn tại)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        values = np.full(ids.shape, np.nan)
+        ok = self.contains(ids)
+        values[ok] = self.sec[ids[ok]]
+        return [None if v != v else v for v in values.tolist()]
+
+    def frame_numbers(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        values = np.full(ids.shape, -1, dtype=np.int64)
+        ok = self.contains(ids)
+        values[ok] = self.frame_idx[ids[ok]]
+        return [None if v < 0 else v for v in values.tolist()]
+
+    def scene_idx(self, i: int):
+        code = int(self.video[i])
+        return f"{self.video_keys[code]}/{int(self.shot[i])}" if code >= 0 else None
+
+    def records(self, ids) -> KeyframeRecords:
+        return KeyframeRecords(self, ids)
+
+    def path_index(self) -> dict:
+        """image_path -> id (dựng một lần cho tra ngược)."""
+        ids = np.flatnonzero(self.valid)
+        return dict(zip(self.paths(ids), ids.tolist()))
+
+    # ----------------- Giao diện dict (tương thích id2img_fps) -----------------
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, i):
+        try:
+            i = int(i)
+        except (TypeError, ValueError):
+            return False
+        return 0 <= i < self.n and bool(self.valid[i])
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not (0 <= i < self.n and self.valid[i]):
+            raise KeyError(i)
+        sec = float(self.sec[i])
+        frame_idx = int(self.frame_idx[i])
+        return {'image_path': self.path(i), 'scene_idx': self.scene_idx(i),
+                'frame_idx': frame_idx if frame_idx >= 0 else None, 'sec': None if sec != sec else sec}
+
+    def get(self, i, default=None):
+        return self[i] if i in self else default
+
+    def keys(self):
+        return (int(i) for i in np.flatnonzero(self.valid))
+
+    __iter__ = keys
+
+    def items(self):
+        return ((i, self[i]) for i in self.keys())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dựng file metadata keyframe dạng cột từ id2img_fps.json.')
+    parser.add_argument('--json', default='dict/id2img_fps.json')
+    parser.add_argument('--output', default=None, help='mặc định: cạnh file json, đuôi .kfstore')
+    args = parser.parse_args()
+
+    output = args.output or store_path_for(args.json)
+    store = KeyframeStore.from_json(args.json)
+    store.save(output, source=_source_stamp(args.json))
+    print(f"[KeyframeStore] {len(store)} keyframes, {len(store.video_keys)} videos -> {output} "
+          f"({os.path.getsize(output) / 2**20:.1f}MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Catalog file media dựng một lần: video_id -> file video (size, fps, duration), thư mục keyframe -> danh sách file.
+Lưu gọn vào một file .json.gz; lần khởi động sau đọc lại thay vì duyệt thư mục (thư mục gốc đổi mtime thì dựng lại).
+Nhiều worker (gunicorn pre-fork) dùng chung file này: worker nào refresh() thì ghi file, các worker khác thấy mtime
+file đổi thì tự đọc lại (sync()).
+
+Ví dụ:
+    python -m utils.media_catalog --video-dir ./AIC_Video --keyframes-dir ./frontend/ai/public/data/Keyframes
+    python -m utils.media_catalog --video-dir ./AIC_Video --keyframes-dir ... --no-probe   # bỏ qua đọc fps / duration
+"""
+import os
+import gzip
+import json
+import time
+import argparse
+import threading
+
+MEDIA_CATALOG_PATH = 'dict/media_catalog.json.gz'
+# thứ tự ưu tiên khi cùng tên có nhiều đuôi (giống find_video_file cũ)
+VIDEO_EXTS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+CATALOG_FORMAT = 1
+
+
+def probe_video(path: str):
+    """(fps, duration giây) qua OpenCV; không có cv2 / file lỗi -> (None, None)."""
+    try:
+        import cv2
+    except ImportError:
+        return None, None
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return None, None
+        fps = float(cap.get(cv2.CAP_PROP_FPS)) or None
+        n_frames = float(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        duration = round(n_frames / fps, 3) if fps and n_frames > 0 else None
+        return fps, duration
+    finally:
+        cap.release()
+
+
+def scan_videos(video_dir: str, probe: bool = True, previous: dict = None):
+    """{stem: {'file', 'size', 'mtime', 'fps', 'duration'}} cho file video nằm trực tiếp trong video_dir."""
+    previous = previous or {}
+    videos = {}
+    if not os.path.isdir(video_dir):
+        return videos
+    entries = sorted((e for e in os.scandir(video_dir) if e.is_file()),
+                     key=lambda e: VIDEO_EXTS.index(os.path.splitext(e.name)[1].lower())
+                     if os.path.splitext(e.name)[1].lower() in VIDEO_EXTS else len(VIDEO_EXTS))
+    for entry in entries:
+        stem, ext = os.path.splitext(entry.name)
+        if ext.lower() not in VIDEO_EXTS or stem in videos:
+            continue
+        st = entry.stat()
+        info = {'file': entry.name, 'size': st.st_size, 'mtime': int(st.st_mtime), 'fps': None, 'duration': None}
+        old = previous.get(stem)
+        if old and old.get('file') == entry.name and old.get('size') == info['size'] and old.get('mtime') == info['mtime']:
+            # file không đổi: giữ fps / duration đã đo
+            info['fps'], info['duration'] = old.get('fps'), old.get('duration')
+        elif probe:
+            info['fps'], info['duration'] = probe_video(entry.path)
+        videos[stem] = info
+    return videos
+
+
+def scan_keyframes(keyframes_dir: str):
+    """{thư mục con tương đối ('L01_V001', ...): [tên file ảnh đã sắp xếp]}."""
+    dirs = {}
+    if not os.path.isdir(keyframes_dir):
+        return dirs
+    for root, _, files in os.walk(keyframes_dir):
+        images = sorted(f for f in files if os.path.splitext(f)[1].lower() in ('.jpg', '.jpeg', '.png', '.webp'))
+        if images:
+            rel = os.path.relpath(root, keyframes_dir).replace('\\', '/')
+            dirs['' if rel == '.' else rel] = images
+    return dirs
+
+
+def _dir_mtime(path: str):
+    return int(os.stat(path).st_mtime) if os.path.isdir(path) else None
+
+
+class MediaCatalog:
+    """
+    video_id -> file video đã resolve (thử 'L01_V001' rồi 'V001' như find_video_file cũ) và keyframe dir -> files.
+    Tra cứu là dict hit, không gọi Path.exists(); refresh() dựng lại và ghi file catalog (thay toàn bộ dict một lần).
+    - sync(): file catalog đổi (worker khác vừa refresh) -> đọc lại, kiểm tra mtime tối đa mỗi check_interval giây.
+    - video() không có trong catalog (video chép thêm sau khi dựng): thử file trên đĩa như find_video_file cũ.
+    """
+
+    def __init__(self, video_dir: str, keyframes_dir: str, path: str = MEDIA_CATALOG_PATH, probe: bool = True,
+                 check_interval: float = 5.0):
+        self.video_dir = str(video_dir)
+        self.keyframes_dir = str(keyframes_dir)
+        self.path = path
+        self.probe = probe
+        self.videos = {}
+        self.keyframes = {}
+        self.built_at = None
+        self.check_interval = float(check_interval)
+        self._stamp = None           # mtime_ns của file catalog đang dùng
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, video_dir: str, keyframes_dir: str, path: str = MEDIA_CATALOG_PATH, probe: bool = True,
+             check_interval: float = 5.0):
+        """Đọc file catalog nếu còn khớp thư mục gốc, không thì duyệt lại và ghi file."""
+        catalog = cls(video_dir, keyframes_dir, path=path, probe=probe, check_interval=check_interval)
+        if not catalog.load():
+            catalog.refresh()
+        return catalog
+
+    # ----------------- Persist -----------------
+    def _roots(self) -> dict:
+        return {
+            'video_dir': os.path.abspath(self.video_dir), 'video_dir_mtime': _dir_mtime(self.video_dir),
+            'keyframes_dir': os.path.abspath(self.keyframes_dir), 'keyframes_dir_mtime': _dir_mtime(self.keyframes_dir),
+        }
+
+    def _file_stamp(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def age(self):
+        """Số giây từ lần ghi file catalog gần nhất (của bất kỳ worker nào); None nếu chưa có file."""
+        stamp = self._file_stamp()
+        return None if stamp is None else max(0.0, time.time() - stamp / 1e9)
+
+    def load(self, check_roots: bool = True) -> bool:
+        """check_roots=False: dùng file dù thư mục gốc đã đổi sau đó (đọc lại bản worker khác vừa ghi)."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        stamp = self._file_stamp()
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[MediaCatalog] Không đọc được {self.path}: {e}")
+            return False
+        if data.get('format') != CATALOG_FORMAT or (check_roots and data.get('roots') != self._roots()):
+            print(f"[MediaCatalog] {self.path} cũ hơn thư mục media, dựng lại")
+            self.videos = data.get('videos', {})     # giữ fps / duration cho file không đổi
+            return False
+        with self._lock:
+            self.videos, self.keyframes, self.built_at = data['videos'], data['keyframes'], data.get('built_at')
+            self._stamp = stamp
+        print(f"[MediaCatalog] loaded {len(self.videos)} videos, {len(self.keyframes)} keyframe dirs from {self.path}")
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock:
+            data = {'format': CATALOG_FORMAT, 'built_at': self.built_at, 'roots': self._roots(),
+                    'videos': self.videos, 'keyframes': self.keyframes}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self._stamp = self._file_stamp()
+
+    def sync(self):
+        """Đọc lại file catalog nếu worker khác đã ghi bản mới (so mtime, tối đa mỗi check_interval giây)."""
+        now = time.monotonic()
+        if not self.path or now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        stamp = self._file_stamp()
+        if stamp is not None and stamp != self._stamp:
+            self.load(check_roots=False)
+
+    def refresh(self, wait: bool = True):
+        """Duyệt lại thư mục rồi ghi file; wait=False và đang có refresh khác chạy -> trả None ngay."""
+        if not self._refresh_lock.acquire(blocking=wait):
+            return None
+        try:
+            return self._refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self):
+        t0 = time.time()
+        videos = scan_videos(self.video_dir, probe=self.probe, previous=self.videos)
+        keyframes = scan_keyframes(self.keyframes_dir)
+        with self._lock:
+            self.videos, self.keyframes = videos, keyframes
+            self.built_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.save()
+        print(f"[MediaCatalog] {len(videos)} videos, {len(keyframes)} keyframe dirs in {time.time() - t0:.1f}s")
+        return self
+
+    # ----------------- Lookup -----------------
+    def video(self, video_id: str):
+        """Info của video theo id ('L01_V001'; không có thì thử phần sau dấu '_' như 'V001'), kèm 'path' tuyệt đối."""
+        self.sync()
+        videos = self.videos
+        info = videos.get(video_id)
+        if info is None:
+            parts = video_id.split('_')
+            info = videos.get(parts[1]) if len(parts) >= 2 else None
+        if info is None:
+            info = self._find_on_disk(video_id)
+        if info is None:
+            return None
+        return dict(info, path=os.path.join(self.video_dir, info['file']))
+
+    def _find_on_disk(self, video_id: str):
+        """Video chưa có trong catalog: thử '<video_id>.<ext>' rồi '<Vxxx>.<ext>' trong video_dir, có thì thêm vào catalog."""
+        parts = video_id.split('_')
+        stems = [video_id] + ([parts[1]] if len(parts) >= 2 else [])
+        for ext in VIDEO_EXTS:
+            for stem in stems:
+                path = os.path.join(self.video_dir, stem + ext)
+                if not os.path.isfile(path):
+                    continue
+                st = os.stat(path)
+                fps, duration = probe_video(path) if self.probe else (None, None)
+                info = {'file': stem + ext, 'size': st.st_size, 'mtime': int(st.st_mtime), 'fps': fps, 'duration': duration}
+                with self._lock:
+                    self.videos[stem] = info
+                return info
+        return None
+
+    def keyframe_files(self, rel_dir: str):
+        self.sync()
+        return self.keyframes.get(rel_dir.strip('/'), [])
+
+    def stats(self) -> dict:
+        return {'videos': len(self.videos), 'keyframe_dirs': len(self.keyframes),
+                'keyframes': sum(len(files) for files in self.keyframes.values()), 'built_at': self.built_at,
+                'path': self.path}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dựng lại catalog media (video + keyframe).')
+    parser.add_argument('--video-dir', required=True)
+    parser.add_argument('--keyframes-dir', required=True)
+    parser.add_argument('--output', default=MEDIA_CATALOG_PATH)
+    parser.add_argument('--no-probe', action='store_true', help='không đọc fps / duration (nhanh hơn)')
+    args = parser.parse_args()
+
+    catalog = MediaCatalog(args.video_dir, args.keyframes_dir, path=args.output, probe=not args.no_probe)
+    catalog.load()
+    catalog.refresh()
+    print(json.dumps(catalog.stats(), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import time
+import threading
+
+
+class ModelRegistry:
+    """
+    Nạp model / engine theo tên, chỉ một lần, khi cần.
+    - register(name, factory): khai báo; model không register = bị tắt trên node này.
+    - get(name): lần đầu gọi factory() (các luồng khác cùng tên chờ trên lock), các lần sau trả lại instance.
+    - preload(background=True): nạp trước trong luồng nền để request đầu không phải chờ lâu.
+    - after_fork(): gọi trong worker sau khi fork (server pre-fork), nạp lại model fork_safe=False.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._locks = {}
+        self._load_sec = {}
+        self._errors = {}
+        self._fork_unsafe = set()
+
+    def register(self, name: str, factory, fork_safe: bool = True):
+        """fork_safe=False: instance giữ thread pool riêng (vd. onnxruntime), không dùng được trong process con."""
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+        if not fork_safe:
+            self._fork_unsafe.add(name)
+
+    def is_enabled(self, name: str) -> bool:
+        return name in self._factories
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def get(self, name: str):
+        if name in self._instances:
+            return self._instances[name]
+        if name not in self._factories:
+            raise KeyError(f"[ModelRegistry] '{name}' không được bật trên node này (enabled: {sorted(self._factories)})")
+        with self._locks[name]:
+            if name not in self._instances:
+                t0 = time.perf_counter()
+                try:
+                    self._instances[name] = self._factories[name]()
+                except Exception as e:
+                    self._errors[name] = repr(e)
+                    raise
+                self._errors.pop(name, None)
+                self._load_sec[name] = round(time.perf_counter() - t0, 2)
+                print(f"[ModelRegistry] loaded '{name}' in {self._load_sec[name]}s")
+        return self._instances[name]
+
+    def preload(self, names=None, background: bool = False):
+        names = [name for name in (names or list(self._factories)) if name in self._factories]
+
+        if not background:
+            for name in names:
+                self.get(name)
+            return None
+
+        def run():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    # lỗi được ghi lại; request sau gọi get() sẽ thử nạp lại và báo lỗi
+                    print(f"[ModelRegistry] preload '{name}' failed: {e!r}")
+
+        thread = threading.Thread(target=run, name='model-preload', daemon=True)
+        thread.start()
+        return thread
+
+    def after_fork(self):
+        # lock có thể đang bị luồng nền của process cha giữ lúc fork -> tạo mới
+        self._locks = {name: threading.Lock() for name in self._factories}
+        reload = [name for name in self._fork_unsafe if self._instances.pop(name, None) is not None]
+        self.preload(reload)
+
+    def status(self) -> dict:
+        return {
+            name: {
+                'loaded': name in self._instances,
+                'load_sec': self._load_sec.get(name),
+                'error': self._errors.get(name),
+            }
+            for name in self._factories
+        }
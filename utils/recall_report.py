@@ -0,0 +1,77 @@
+"""
+So sánh recall@k của một index nén (SQ8 / fp16 / IVF / HNSW ...) với index Flat hiện tại (ground truth).
+
+Ví dụ:
+    python -m utils.recall_report --reference dict/faiss_clip_cosine.bin --candidate dict/faiss_clip_sq8.bin --k 10 100 --rerank-factors 1 2 4 8
+
+Query: mặc định lấy ngẫu nhiên --queries vector từ chính index Flat (hoặc --query-npy: embedding text thật đã lưu).
+Nếu candidate có spec['rerank_path'] thì báo thêm recall sau khi re-rank float32 với từng rerank_factor.
+"""
+import os
+import time
+import argparse
+import faiss
+import numpy as np
+from utils.index_spec import load_index_spec, make_search_params, load_rerank_vectors, exact_rerank
+
+
+def recall_at_k(gt_ids: np.ndarray, ids: np.ndarray, k: int) -> float:
+    """Tỉ lệ trung bình id của top-k ground truth xuất hiện trong top-k kết quả."""
+    hits = 0
+    for gt_row, row in zip(gt_ids[:, :k], ids[:, :k]):
+        hits += len(np.intersect1d(gt_row[gt_row >= 0], row[row >= 0]))
+    return hits / float(gt_ids[:, :k].size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recall@k của index nén so với index Flat.')
+    parser.add_argument('--reference', required=True, help='index Flat hiện tại (ground truth)')
+    parser.add_argument('--candidate', required=True, help='index cần đánh giá (có thể kèm .spec.json)')
+    parser.add_argument('--k', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--query-npy', default=None, help='(n, d) float32 query embeddings')
+    parser.add_argument('--rerank-factors', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    reference = faiss.read_index(args.reference)
+    candidate = faiss.read_index(args.candidate)
+    spec = load_index_spec(args.candidate, candidate)
+    rerank_vectors = load_rerank_vectors(args.candidate, spec)
+
+    if args.query_npy:
+        queries = np.ascontiguousarray(np.load(args.query_npy), dtype=np.float32)
+    else:
+        rng = np.random.default_rng(args.seed)
+        qids = rng.choice(reference.ntotal, min(args.queries, reference.ntotal), replace=False)
+        queries = reference.reconstruct_batch(np.sort(qids).astype(np.int64))
+
+    k_max = max(args.k)
+    gt_scores, gt_ids = reference.search(queries, k_max)
+
+    rows = []
+    t0 = time.perf_counter()
+    _, ids = candidate.search(queries, k_max, params=make_search_params(spec))
+    rows.append(('no re-rank', ids, time.perf_counter() - t0))
+
+    if rerank_vectors is not None:
+        for factor in args.rerank_factors:
+            t0 = time.perf_counter()
+            _, cand_ids = candidate.search(queries, k_max * factor, params=make_search_params(spec))
+            _, ids = exact_rerank(queries, cand_ids, k_max, rerank_vectors)
+            rows.append((f're-rank x{factor}', ids, time.perf_counter() - t0))
+
+    # kích thước file ~ RAM index chiếm khi load (file re-rank đọc qua mmap, không tính)
+    print(f"reference: {args.reference} ({os.path.getsize(args.reference) / 2**20:.1f}MB)")
+    print(f"candidate: {args.candidate} [{spec['type']}] ({os.path.getsize(args.candidate) / 2**20:.1f}MB)")
+    print(f"queries: {len(queries)}")
+    header = f"{'mode':<14}" + ''.join(f"{f'recall@{k}':>12}" for k in args.k) + f"{'ms/query':>12}"
+    print(header)
+    print('-' * len(header))
+    for name, ids, elapsed in rows:
+        line = f"{name:<14}" + ''.join(f"{recall_at_k(gt_ids, ids, k):>12.4f}" for k in args.k)
+        print(line + f"{1000 * elapsed / len(queries):>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+_SPACE_RE = re.compile(r'\s+')
+# field là tập id (thứ tự không ảnh hưởng kết quả) -> sort + unique trước khi hash
+ID_SET_FIELDS = ('id', 'ignore_idxs')
+# field số mà view ép int() / float() -> 100, "100", 100.0 cùng key
+NUMERIC_FIELDS = ('k', 'search_space', 'range_filter', 'filtervideo', 'top', 'nprobe', 'ef_search', 'min_score',
+                  'imgid', 'alpha', 'beta')
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return _SPACE_RE.sub(' ', value).strip()
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _id_set(value):
+    try:
+        return sorted({int(v) for v in (value if isinstance(value, (list, tuple)) else str(value).split(',')) if str(v).strip()})
+    except (TypeError, ValueError):
+        return _normalize(value)
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return value
+    try:
+        number = float(str(value).strip())
+    except (TypeError, ValueError):
+        return _normalize(value)
+    return int(number) if number.is_integer() else number
+
+
+def request_key(endpoint: str, payload: dict, version: str = '', extra=()) -> str:
+    """
+    Hash của request đã chuẩn hoá: gộp khoảng trắng trong chuỗi, sort key, tập id sort + unique, field số đổi về số;
+    'id' chỉ tính khi bật filter / useid, 'ignore_idxs' chỉ khi bật ignore (không bật thì FE vẫn gửi kèm mà không dùng).
+    """
+    payload = dict(payload or {})
+    if not (payload.get('filter') or payload.get('useid')):
+        payload.pop('id', None)
+    if not payload.get('ignore'):
+        payload.pop('ignore_idxs', None)
+    for flag in ('filter', 'useid', 'ignore'):
+        if not payload.get(flag, True):
+            payload.pop(flag)
+    canonical = {k: _id_set(v) if k in ID_SET_FIELDS else _number(v) if k in NUMERIC_FIELDS else _normalize(v)
+                 for k, v in payload.items()}
+    raw = json.dumps([endpoint, version, list(extra), canonical], sort_keys=True, ensure_ascii=False,
+                     separators=(',', ':'), default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    """Một lần tính đang chạy; các request trùng key chờ event rồi lấy chung kết quả / lỗi."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """
+    Cache kết quả theo request (giá trị là bytes response đã serialize), LRU + TTL + giới hạn dung lượng.
+    - get_or_compute(key, compute, cacheable): hit -> trả luôn; đang có request giống hệt chạy -> chờ nó (singleflight);
+      không thì gọi compute() một lần, chỉ lưu nếu cacheable(value). Trả (value, 'hit' | 'wait' | 'miss').
+    - sizeof(value): số byte tính vào max_bytes (mặc định len).
+    - generation_path: file dùng chung giữa các worker (gunicorn pre-fork); clear() ghi lại file, generation()
+      (mtime của file) đưa vào key -> xoá ở một worker thì mọi worker đều bỏ qua entry cũ.
+    - version: phiên bản dữ liệu / index, đưa vào key (request_key) -> index đổi thì entry cũ không bao giờ trúng.
+    max_items = 0: không lưu, chỉ còn gộp các request trùng đang chạy.
+    """
+
+    def __init__(self, max_items: int = 512, ttl: float = 300.0, max_bytes: int = 256 << 20, version: str = '',
+                 sizeof=len, generation_path: str = None):
+        self.max_items = int(max_items)
+        self.ttl = float(ttl)
+        self.max_bytes = int(max_bytes)
+        self.version = version
+        self.sizeof = sizeof
+        self.generation_path = generation_path
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self._data = OrderedDict()      # key -> (thời điểm hết hạn, value, size)
+        self._bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        """Thế hệ cache dùng chung (mtime_ns của generation_path, 0 nếu không có file)."""
+        if not self.generation_path:
+            return 0
+        try:
+            return os.stat(self.generation_path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def clear(self):
+        """Xoá cache của process này và tăng thế hệ dùng chung (các worker khác cũng không trúng entry cũ nữa)."""
+        if self.generation_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.generation_path)), exist_ok=True)
+            old = self.generation()
+            tmp_path = f"{self.generation_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(f"{time.time()}\n")
+            os.replace(tmp_path, self.generation_path)
+            if self.generation() == old:
+                # mtime thô (một số filesystem) -> đẩy lên chắc chắn khác
+                os.utime(self.generation_path, ns=(old + 1, old + 1))
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def get_or_compute(self, key: str, compute, cacheable=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], 'hit'
+                self._drop(key)
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.waits += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, 'wait'
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if flight.error is None and (cacheable is None or cacheable(flight.value)):
+                    self._store(key, flight.value)
+            flight.event.set()
+        return flight.value, 'miss'
+
+    def _drop(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def _store(self, key, value):
+        size = self.sizeof(value)
+        if self.max_items <= 0 or size > self.max_bytes:
+            return
+        if key in self._data:
+            self._drop(key)
+        self._data[key] = (time.monotonic() + self.ttl, value, size)
+        self._bytes += size
+        while len(self._data) > self.max_items or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._data)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses + self.waits
+            return {
+                'size': len(self._data),
+                'max_items': self.max_items,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'hit_rate': round((self.hits + self.waits) / total, 4) if total else 0.0,
+                'inflight': len(self._inflight),
+                'version': self.version,
+                'generation': self.generation(),
+            }
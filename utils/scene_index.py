@@ -0,0 +1,143 @@
+import json
+import numpy as np
+
+
+class SceneIndex:
+    """
+    scene_id2info.json dựng phẳng một lần lúc khởi động (dạng CSR), theo bảng video của KeyframeStore ('L01/V001/lst_shot'):
+    - video v có các shot toàn cục shot_offsets[v] .. shot_offsets[v + 1] - 1 (shot số s của video = shot_offsets[v] + s);
+    - shot g có keyframe kf_ids[kf_offsets[g]:kf_offsets[g + 1]], shot_times[g], shot_ranges[g] ([frame đầu, frame cuối], -1 nếu không có);
+    - missing_paths[g]: đường dẫn keyframe của shot g không có trong id2img_fps (chỉ để hiển thị, thường rỗng).
+    Shot cùng video nằm liên tiếp nên keyframe của một dải shot cũng là một slice liên tục của kf_ids.
+    """
+
+    def __init__(self, store, shot_offsets, kf_offsets, kf_ids, shot_times, watch_urls, shot_ranges=None,
+                 missing_paths=None):
+        self.store = store
+        self.video_keys = list(store.video_keys)
+        parts = [key.split('/') for key in self.video_keys]
+        self.collections = [p[0] for p in parts]
+        self.video_names = [p[1] if len(p) > 1 else '' for p in parts]
+        self.shot_offsets = shot_offsets
+        self.kf_offsets = kf_offsets
+        self.kf_ids = kf_ids
+        self.shot_times = shot_times
+        self.watch_urls = watch_urls
+        self.n_shots = int(shot_offsets[-1])
+        self.shot_ranges = shot_ranges if shot_ranges is not None else np.full((self.n_shots, 2), -1, dtype=np.int64)
+        self.missing_paths = missing_paths or {}
+        self.video_of_shot = np.repeat(np.arange(len(self.video_keys), dtype=np.int32), np.diff(shot_offsets))
+
+    # ----------------- Build -----------------
+    @classmethod
+    def from_dict(cls, scene_info: dict, store):
+        """
+        Chỉ giữ video có trong store; keyframe id không có trong store bị bỏ khỏi kf_ids (không tìm được),
+        đường dẫn của chúng giữ trong missing_paths để /relatedimg vẫn hiển thị như trước.
+        """
+        shot_counts, shot_lists, watch_urls = [], [], []
+        for key in store.video_keys:
+            parts = key.split('/')
+            node = scene_info
+            for part in parts[:2]:
+                node = node.get(part, {}) if isinstance(node, dict) else {}
+            shots = node.get(parts[2], {}) if len(parts) > 2 else {}
+            watch_urls.append((node.get('video_metadata') or {}).get('watch_url'))
+            n = max((int(s) for s in shots), default=-1) + 1
+            shot_counts.append(n)
+            shot_lists.append([shots.get(str(s)) or {} for s in range(n)])
+
+        shot_offsets = np.concatenate([[0], np.cumsum(shot_counts, dtype=np.int64)]).astype(np.int64)
+        shot_times, shot_ranges, kf_lists, path_lists = [], [], [], []
+        for shots in shot_lists:
+            for shot in shots:
+                shot_times.append(shot.get('shot_time'))
+                shot_ranges.append(shot.get('shot_range') or [-1, -1])
+                kf_lists.append(np.asarray(shot.get('lst_keyframe_idxs') or [], dtype=np.int64))
+                path_lists.append(shot.get('lst_keyframe_paths') or [])
+        kf_ids = np.concatenate(kf_lists) if kf_lists else np.empty(0, dtype=np.int64)
+        keep = store.contains(kf_ids)
+        if not keep.all():
+            print(f"[SceneIndex] Bỏ {int((~keep).sum())} keyframe id không có trong id2img_fps")
+        # đếm lại số keyframe còn giữ của từng shot rồi cộng dồn thành offset
+        shot_of_kf = np.repeat(np.arange(len(kf_lists), dtype=np.int64), [len(ids) for ids in kf_lists])
+        kf_counts = np.bincount(shot_of_kf[keep], minlength=len(kf_lists))
+        kf_offsets = np.concatenate([[0], np.cumsum(kf_counts)]).astype(np.int64)
+        kf_ids = kf_ids[keep]
+
+        # lst_keyframe_paths song song với lst_keyframe_idxs -> lấy path ở vị trí bị bỏ;
+        # không song song thì so với path của các id còn giữ
+        missing_paths = {}
+        raw_offsets = np.concatenate([[0], np.cumsum([len(ids) for ids in kf_lists])]).astype(np.int64)
+        for g, paths in enumerate(path_lists):
+            kept = keep[raw_offsets[g]:raw_offsets[g + 1]]
+            if len(paths) == len(kept):
+                lost = [path for path, ok in zip(paths, kept.tolist()) if not ok]
+            else:
+                have = set(store.paths(kf_ids[kf_offsets[g]:kf_offsets[g + 1]]))
+                lost = [path for path in paths if path not in have]
+            if lost:
+                missing_paths[g] = lost
+        shot_ranges = np.asarray(shot_ranges, dtype=np.int64).reshape(-1, 2)
+        return cls(store, shot_offsets, kf_offsets, kf_ids, shot_times, watch_urls, shot_ranges, missing_paths)
+
+    @classmethod
+    def from_json(cls, scene_path: str, store):
+        with open(scene_path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f), store)
+
+    # ----------------- Tra cứu -----------------
+    def shot_of(self, ids):
+        """Shot toàn cục của từng keyframe id (lấy từ cột video / shot của store, -1 nếu không có)."""
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        out = np.full(ids.shape, -1, dtype=np.int64)
+        ok = self.store.contains(ids)
+        video = np.asarray(self.store.video[ids[ok]], dtype=np.int64)
+        shot = np.asarray(self.store.shot[ids[ok]], dtype=np.int64)
+        has = (video >= 0) & (shot >= 0)
+        has[has] = shot[has] < np.diff(self.shot_offsets)[video[has]]
+        out[np.flatnonzero(ok)[has]] = self.shot_offsets[video[has]] + shot[has]
+        return out
+
+    def video_shot_range(self, g: int):
+        """(shot đầu, shot cuối + 1) toàn cục của video chứa shot g."""
+        v = int(self.video_of_shot[g])
+        return int(self.shot_offsets[v]), int(self.shot_offsets[v + 1])
+
+    def shot_keyframes(self, g: int) -> np.ndarray:
+        """Keyframe id của shot g (view, không copy)."""
+        return self.kf_ids[self.kf_offsets[g]:self.kf_offsets[g + 1]]
+
+    def shot_range(self, g: int):
+        """[frame đầu, frame cuối] của shot g như trong scene_id2info (None nếu không có)."""
+        start, end = self.shot_ranges[g].tolist()
+        return None if start < 0 else [start, end]
+
+    def missing_keyframe_paths(self, g: int) -> list:
+        """Đường dẫn keyframe của shot g không có id trong id2img_fps."""
+        return self.missing_paths.get(g, [])
+
+    def same_shot_ids(self, ids) -> np.ndarray:
+        """Mọi keyframe cùng shot với các id (để ignore cả shot)."""
+        return self.neighbour_ids(ids, 0, 0)
+
+    def neighbour_ids(self, ids, lo: int, hi: int) -> np.ndarray:
+        """
+        Keyframe của các shot g + lo .. g + hi (cắt trong cùng video) với g là shot của từng id.
+        Mỗi id ứng với đúng một slice kf_ids; trả mảng id đã unique.
+        """
+        shots = np.unique(self.shot_of(ids))
+        shots = shots[shots >= 0]
+        if shots.size == 0 or hi < lo:
+            return np.empty(0, dtype=np.int64)
+        video = self.video_of_shot[shots]
+        first = np.maximum(shots + lo, self.shot_offsets[video])
+        stop = np.minimum(shots + hi + 1, self.shot_offsets[video + 1])
+        ok = first < stop
+        starts, ends = self.kf_offsets[first[ok]], self.kf_offsets[stop[ok]]
+        if starts.size == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([self.kf_ids[a:b] for a, b in zip(starts.tolist(), ends.tolist())]))
+
+    def stats(self) -> dict:
+        return {'videos': len(self.video_keys), 'shots': self.n_shots, 'keyframes': int(self.kf_ids.size)}
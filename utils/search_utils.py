@@ -1,8 +1,6 @@
 import os
-import copy
 from pathlib import Path
 import numpy as np
-from utils.combine_utils import merge_searching_results_by_addition
 
 # --------- Helpers chuẩn hoá & tách đường dẫn ---------
 def _parse_keyframe_path(image_path: str):
@@ -60,6 +58,9 @@ def _safe_map_frame_id(key: str, frame_id_stem: str, KeyframesMapper):
 
 # ----------------- HÀM ĐÃ SỬA -----------------
 def group_result_by_video(lst_scores, list_ids, list_image_paths, KeyframesMapper):
+    """lst_idxs / lst_scores của mỗi video là mảng NumPy (lấy theo vị trí), JSON encoder ghi thẳng không cần đổi từng phần tử."""
+    list_ids = np.asarray(list_ids, dtype=np.int64)
+    lst_scores = np.asarray(lst_scores, dtype=np.float32)
     result_dict = dict()
 
     for i, image_path in enumerate(list_image_paths):
@@ -78,17 +79,20 @@ def group_result_by_video(lst_scores, list_ids, list_image_paths, KeyframesMappe
         if key not in result_dict:
             result_dict[key] = {
                 "lst_keyframe_paths": [],
-                "lst_idxs": [],
+                "positions": [],
                 "lst_keyframe_idxs": [],
-                "lst_scores": [],
             }
 
         result_dict[key]["lst_keyframe_paths"].append(image_path)
-        result_dict[key]["lst_idxs"].append(int(list_ids[i]))
+        result_dict[key]["positions"].append(i)
         result_dict[key]["lst_keyframe_idxs"].append(frame_id_int)
-        result_dict[key]["lst_scores"].append(float(lst_scores[i]))
 
-    result = [{"video_id": key, "video_info": value} for key, value in result_dict.items()]
+    result = []
+    for key, value in result_dict.items():
+        positions = value.pop("positions")
+        value["lst_idxs"] = list_ids[positions]
+        value["lst_scores"] = lst_scores[positions]
+        result.append({"video_id": key, "video_info": value})
     result = sorted(result, key=lambda x: x["video_info"]["lst_scores"][0], reverse=True)
     return result
 
@@ -102,28 +106,14 @@ def search_by_filter(
     range_filter,
     ignore_index,
     keep_index,
-    Sceneid2info,
-    DictImagePath,
+    Scenes,
     CosineFaiss,
     KeyframesMapper,
 ):
-    # --- gom các index cần ignore theo video ---
-    ignore_videos = None
-    if ignore_index is not None:
-        ignore_videos = dict()
-        for idx in ignore_index:
-            image_path = DictImagePath[idx]["image_path"]
-            data_part, video_id, frame_id = _parse_keyframe_path(image_path)
-            key = f"{data_part}_{video_id}".replace("_extra", "")
-            ignore_videos.setdefault(key, []).append(idx)
-
-    filter_idx = []
     result_dict = dict()
-
+    prev_idxs = []
     for item in prev_result:
         key = item["video_id"]
-        ignore_video = ignore_videos.get(key) if ignore_videos is not None else None
-
         if key not in result_dict:
             result_dict[key] = {
                 "video_info": {
@@ -134,54 +124,34 @@ def search_by_filter(
                 },
                 "video_info_prev": item["video_info"],
             }
+        prev_idxs.extend(item["video_info"]["lst_idxs"])
 
-        lst_idxs = item["video_info"]["lst_idxs"]
-        lst_shots = []
-        for idx in lst_idxs:
-            scene_idx = DictImagePath[idx]["scene_idx"]  # định dạng do dữ liệu quy ước (chuỗi có '/')
-            if scene_idx in lst_shots:
-                continue
-            if ignore_video is not None and idx in ignore_video:
-                continue
-
-            lst_shots.append(scene_idx)
-            scene_parts = scene_idx.split("/")  # scene_idx thường là "vid/xxx/yyy/zzz"
-            video_info = copy.deepcopy(Sceneid2info[scene_parts[0]][scene_parts[1]][scene_parts[2]])
-
-            if mode == 1:
-                start, end = int(scene_parts[3]) + 1, int(scene_parts[3]) + range_filter
-            else:
-                start, end = int(scene_parts[3]) - range_filter, int(scene_parts[3]) - 1
-
-            for i_shot in range(start, end):
-                if 0 <= i_shot < len(video_info):
-                    filter_idx.extend(video_info[str(i_shot)]["lst_keyframe_idxs"])
+    # keyframe bị ignore không dùng làm mốc
+    prev_idxs = np.asarray(prev_idxs, dtype="int64")
+    if ignore_index is not None:
+        prev_idxs = prev_idxs[~np.isin(prev_idxs, np.asarray(ignore_index, dtype="int64"))]
 
-    # unique + kiểu int64
-    filter_idx = np.array(sorted(set(filter_idx)), dtype="int64")
+    # mode 1: range_filter shot sau (s + 1 .. s + range_filter), ngược lại range_filter shot trước (s - range_filter .. s - 1)
+    # -- cùng quy ước gap N = (1, N) của temporal_search.parse_gaps;
+    # mỗi mốc là một slice keyframe liên tục trong SceneIndex (đã cắt trong cùng video)
+    if mode == 1:
+        filter_idx = Scenes.neighbour_ids(prev_idxs, 1, range_filter)
+    else:
+        filter_idx = Scenes.neighbour_ids(prev_idxs, -range_filter, -1)
 
     if keep_index is not None:
-        filter_idx = np.intersect1d(filter_idx, keep_index)
+        # keep_index: IdBitmap các id còn giữ lại (sau khi bỏ ignore)
+        filter_idx = filter_idx[keep_index.contains(filter_idx)]
 
     if filter_idx.size == 0:
         return []  # không có gì để tìm
 
     k = min(k, int(filter_idx.size))
 
-    # --- truy vấn ---
-    if model_type == "both":
-        scores_clip, list_clip_ids, _, _ = CosineFaiss.text_search(text_query, index=filter_idx, k=k, model_type="clip")
-        scores_clipv2, list_clipv2_ids, _, _ = CosineFaiss.text_search(text_query, index=filter_idx, k=k, model_type="clipv2")
-        lst_scores, list_ids = merge_searching_results_by_addition(
-            [scores_clip, scores_clipv2],
-            [list_clip_ids, list_clipv2_ids],
-        )
-        infos_query = list(map(CosineFaiss.id2img_fps.get, list(list_ids)))
-        list_image_paths = [info["image_path"] for info in infos_query]
-    else:
-        lst_scores, list_ids, _, list_image_paths = CosineFaiss.text_search(
-            text_query, index=filter_idx, k=k, model_type=model_type
-        )
+    # --- truy vấn (model_type 'both': 2 nhánh clip / clipv2 chạy song song trong MyFaiss) ---
+    lst_scores, list_ids, _, list_image_paths = CosineFaiss.text_search(
+        text_query, index=filter_idx, k=k, model_type=model_type
+    )
 
     # --- gom theo video ---
     for i, image_path in enumerate(list_image_paths):
@@ -219,3 +189,28 @@ def search_by_filter(
         reverse=True,
     )
     return result
+
+
+def group_sequences(totals, seq_ids, seq_scores, DictImagePath, KeyframesMapper):
+    """
+    Mỗi chuỗi (A, B, ...) của temporal search thành một nhóm cùng định dạng group_result_by_video,
+    keyframe giữ đúng thứ tự các bước; thêm 'score' = tổng điểm các bước.
+    """
+    result = []
+    for total, ids, scores in zip(totals, seq_ids, seq_scores):
+        video_info = {"lst_keyframe_paths": [], "lst_idxs": ids, "lst_keyframe_idxs": [], "lst_scores": scores}
+        key = None
+        for image_path in DictImagePath.paths(ids):
+            data_part, video_id, frame_id = _parse_keyframe_path(image_path)
+            key = f"{data_part}_{video_id}".replace("_extra", "")
+            if "extra" not in data_part:
+                frame_id = _safe_map_frame_id(key, frame_id, KeyframesMapper)
+            try:
+                frame_id = int(frame_id)
+            except Exception:
+                pass
+
+            video_info["lst_keyframe_paths"].append(image_path)
+            video_info["lst_keyframe_idxs"].append(frame_id)
+        result.append({"video_id": key, "score": total, "video_info": video_info})
+    return result
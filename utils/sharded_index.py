@@ -0,0 +1,193 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+from utils.index_spec import DEFAULT_SPEC, infer_spec, make_search_params, prepare_index, range_search_topk, threshold_results
+from utils.id_bitmap import IdBitmap
+
+
+def is_shard_manifest(path: str) -> bool:
+    """File index kết thúc bằng .json = manifest các shard (vd. dict/faiss_clip_cosine.shards.json)."""
+    return str(path).endswith('.json')
+
+
+def load_manifest(manifest_path: str) -> dict:
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest_path: str, manifest: dict):
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def shard_path(manifest_path: str, path: str) -> str:
+    """Đường dẫn shard trong manifest tính tương đối từ thư mục chứa manifest."""
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(manifest_path)), path)
+
+
+class IndexShard:
+    def __init__(self, name: str, index, offset: int, path: str = None):
+        self.name = name
+        self.index = index
+        self.offset = int(offset)
+        self.ntotal = int(index.ntotal)
+        self.path = path
+
+
+class ShardedRows:
+    """Ghép ma trận embedding của từng shard thành một view (ntotal, d) theo id toàn cục, không copy."""
+
+    def __init__(self, parts, offsets):
+        self.parts = parts
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.shape = (int(self.offsets[-1] + len(parts[-1])), parts[0].shape[1])
+        self.dtype = parts[0].dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        which = np.searchsorted(self.offsets, ids, side='right') - 1
+        out = np.empty((len(ids), self.shape[1]), dtype=self.dtype)
+        for s in np.unique(which):
+            mask = which == s
+            out[mask] = self.parts[s][ids[mask] - self.offsets[s]]
+        return out
+
+
+class ShardedIndex:
+    """
+    Một index cho mỗi collection (L01, L02, ...), mỗi shard giữ dải id [offset, offset + ntotal).
+    search(): chạy song song trên các shard có giao với tập id cần tìm, cộng offset rồi gộp top-k.
+    """
+
+    def __init__(self, shards, spec: dict, workers: int = 8):
+        self.shards = sorted(shards, key=lambda sh: sh.offset)
+        if not self.shards:
+            raise ValueError("[ShardedIndex] Manifest không có shard nào")
+        for prev, shard in zip(self.shards, self.shards[1:]):
+            if shard.offset != prev.offset + prev.ntotal:
+                raise ValueError(f"[ShardedIndex] Dải id không liên tục giữa shard {prev.name} và {shard.name}")
+        self.spec = spec
+        self.d = int(self.shards[0].index.d)
+        self.ntotal = int(self.shards[-1].offset + self.shards[-1].ntotal)
+        self.metric_type = self.shards[0].index.metric_type
+        self.file_bytes = sum(os.path.getsize(sh.path) for sh in self.shards if sh.path and os.path.exists(sh.path))
+        # một query Flat chỉ chạy trên 1 luồng trong faiss -> fan-out theo shard mới dùng hết CPU
+        self._workers = max(1, min(int(workers), len(self.shards)))
+        self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='faiss-shard')
+
+    def after_fork(self):
+        """Luồng của pool không đi theo fork: worker (server pre-fork) tạo pool mới."""
+        self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='faiss-shard')
+
+    @classmethod
+    def load(cls, manifest_path: str, flags: int = 0, workers: int = 8):
+        manifest = load_manifest(manifest_path)
+        shards = []
+        for item in manifest['shards']:
+            path = shard_path(manifest_path, item['path'])
+            index = prepare_index(faiss.read_index(path, flags))
+            if 'ntotal' in item and int(item['ntotal']) != index.ntotal:
+                raise ValueError(f"[ShardedIndex] {path}: ntotal={index.ntotal} khác manifest ({item['ntotal']})")
+            shards.append(IndexShard(item['name'], index, item['offset'], path))
+        spec = dict(DEFAULT_SPEC, **manifest['spec']) if manifest.get('spec') else infer_spec(shards[0].index)
+        sharded = cls(shards, spec, workers=workers)
+        sharded.spec['dim'], sharded.spec['ntotal'] = sharded.d, sharded.ntotal
+        return sharded
+
+    # ----------------- Search -----------------
+    def _plan(self, subset):
+        """[(shard, bitmap cục bộ | None)] cho các shard có id cần tìm; shard ngoài search_space bị bỏ qua."""
+        if subset is None:
+            return [(shard, None) for shard in self.shards]
+        if not isinstance(subset, IdBitmap):
+            subset = IdBitmap.from_ids(subset, self.ntotal)
+        jobs = []
+        for shard in self.shards:
+            local = subset.slice(shard.offset, shard.offset + shard.ntotal)
+            if local.count() == 0:
+                continue
+            jobs.append((shard, None if local.is_full() else local))
+        return jobs
+
+    def search(self, feats, k: int, spec: dict = None, subset=None, nprobe=None, ef_search=None):
+        """Trả (scores, ids) shape (N, k), id toàn cục; ô trống là -1."""
+        spec = spec or self.spec
+        feats = np.ascontiguousarray(feats, dtype=np.float32)
+        keep_max = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        empty_score = -np.inf if keep_max else np.inf
+
+        def run(job):
+            shard, local = job
+            kk = min(k, shard.ntotal if local is None else local.count())
+            params = make_search_params(spec, sel=None if local is None else local.selector(),
+                                        nprobe=nprobe, ef_search=ef_search)
+            scores, ids = shard.index.search(feats, kk, params=params)
+            out_scores = np.full((len(feats), k), empty_score, dtype=np.float32)
+            out_ids = np.full((len(feats), k), -1, dtype=np.int64)
+            out_scores[:, :kk] = np.where(ids >= 0, scores, empty_score)
+            out_ids[:, :kk] = np.where(ids >= 0, ids + shard.offset, -1)
+            return out_scores, out_ids
+
+        jobs = self._plan(subset)
+        if not jobs:
+            return np.empty((len(feats), 0), dtype=np.float32), np.empty((len(feats), 0), dtype=np.int64)
+        results = [run(jobs[0])] if len(jobs) == 1 else list(self._pool.map(run, jobs))
+        if len(results) == 1:
+            return results[0]
+        # gộp k-way các danh sách top-k đã sắp xếp của từng shard
+        return faiss.merge_knn_results(np.stack([r[0] for r in results]), np.stack([r[1] for r in results]),
+                                       keep_max=keep_max)
+
+    def range_search(self, feats, min_score: float, cap: int, spec: dict = None, subset=None, nprobe=None, ef_search=None):
+        """Như search() nhưng theo ngưỡng: mọi id có score >= min_score, tối đa cap id / query (gộp top-cap các shard)."""
+        spec = spec or self.spec
+        feats = np.ascontiguousarray(feats, dtype=np.float32)
+
+        def run(job):
+            shard, local = job
+            params = make_search_params(spec, sel=None if local is None else local.selector(),
+                                        nprobe=nprobe, ef_search=ef_search)
+            scores, ids = range_search_topk(shard.index, feats, min_score, cap, params=params)
+            return scores, np.where(ids >= 0, ids + shard.offset, -1)
+
+        jobs = self._plan(subset)
+        if not jobs:
+            return np.empty((len(feats), 0), dtype=np.float32), np.empty((len(feats), 0), dtype=np.int64)
+        results = [run(jobs[0])] if len(jobs) == 1 else list(self._pool.map(run, jobs))
+        if len(results) == 1:
+            return results[0]
+        # merge_knn_results giữ đúng `width` cột -> width = tổng số kết quả các shard (tối đa cap)
+        width = min(int(cap), sum(r[1].shape[1] for r in results))
+        if width == 0:
+            return results[0]
+        pad = lambda a, fill: np.pad(a, ((0, 0), (0, width - a.shape[1])), constant_values=fill)
+        scores, ids = faiss.merge_knn_results(np.stack([pad(r[0], -np.inf) for r in results]),
+                                              np.stack([pad(r[1], -1) for r in results]), keep_max=True)
+        return threshold_results(scores, ids, min_score)
+
+    # ----------------- Vectors -----------------
+    def _locate(self, ids):
+        offsets = np.array([sh.offset for sh in self.shards], dtype=np.int64)
+        return np.searchsorted(offsets, ids, side='right') - 1
+
+    def reconstruct_batch(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        which = self._locate(ids)
+        out = np.empty((len(ids), self.d), dtype=np.float32)
+        for s in np.unique(which):
+            mask = which == s
+            shard = self.shards[s]
+            out[mask] = shard.index.reconstruct_batch(ids[mask] - shard.offset)
+        return out
+
+    def reconstruct_n(self, start: int, n: int) -> np.ndarray:
+        return self.reconstruct_batch(np.arange(start, start + n, dtype=np.int64))
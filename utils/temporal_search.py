@@ -0,0 +1,112 @@
+import numpy as np
+
+
+def parse_gaps(gaps, n_steps: int, default_max_gap: int = 5):
+    """
+    gaps: None | int | list (mỗi phần tử int max_gap hoặc [min_gap, max_gap]) cho n_steps - 1 bước chuyển.
+    Trả list (min_gap, max_gap); gap N nghĩa là sự kiện sau nằm ở shot 1..N sau sự kiện trước
+    (cùng quy ước với range_filter của /searchbyfilter). min_gap >= 1: hai sự kiện không được cùng một shot.
+    """
+    n_links = max(0, n_steps - 1)
+    if gaps is None or isinstance(gaps, (int, float, str)):
+        gaps = [default_max_gap if gaps is None else gaps] * n_links
+    gaps = list(gaps)
+    if len(gaps) != n_links:
+        raise ValueError(f"[Temporal] Cần {n_links} gap cho {n_steps} query, nhận {len(gaps)}")
+    out = []
+    for gap in gaps:
+        min_gap, max_gap = (gap if isinstance(gap, (list, tuple)) else (1, gap))
+        min_gap, max_gap = int(min_gap), int(max_gap)
+        if min_gap < 1 or max_gap < min_gap:
+            raise ValueError(f"[Temporal] Gap không hợp lệ: [{min_gap}, {max_gap}]")
+        out.append((min_gap, max_gap))
+    return out
+
+
+class ShotTimeline:
+    """
+    Thứ tự shot trong từng video, dựng một lần từ cột video / shot của KeyframeStore (scene_idx 'L01/V001/<...>/<shot>').
+    Mỗi (video, shot) là một slot trên một trục chung; slot của cùng video liên tiếp theo số shot,
+    nên "B trong N shot sau A" <=> cùng video và slot_B - slot_A thuộc [min_gap, max_gap].
+    """
+
+    def __init__(self, store):
+        ids = np.flatnonzero(np.asarray(store.valid) & (np.asarray(store.video) >= 0))
+        video_of = np.asarray(store.video[ids], dtype=np.int64)
+        shots = np.asarray(store.shot[ids], dtype=np.int64)
+        self.video_keys = list(store.video_keys)
+        n_shots = np.zeros(len(self.video_keys), dtype=np.int64)
+        np.maximum.at(n_shots, video_of, shots + 1)
+        self.video_base = np.concatenate([[0], np.cumsum(n_shots)[:-1]]).astype(np.int64)
+
+        self.n_slots = int(n_shots.sum())
+        self.slot_of_id = np.full(store.n, -1, dtype=np.int64)
+        self.slot_of_id[ids] = self.video_base[video_of] + shots
+        self.video_of_slot = np.repeat(np.arange(len(self.video_keys), dtype=np.int32), n_shots)
+        self.shot_of_slot = np.arange(self.n_slots, dtype=np.int64) - self.video_base[self.video_of_slot]
+
+    # ----------------- Từng bước -----------------
+    def best_per_slot(self, scores, ids):
+        """Điểm cao nhất của mỗi shot và keyframe đạt điểm đó: (best (S,), best_id (S,)); shot không có ứng viên = -inf / -1."""
+        scores = np.asarray(scores, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        valid = (ids >= 0) & (ids < len(self.slot_of_id))
+        ids, scores = ids[valid], scores[valid]
+        slots = self.slot_of_id[ids]
+        ids, scores, slots = ids[slots >= 0], scores[slots >= 0], slots[slots >= 0]
+
+        best = np.full(self.n_slots, -np.inf, dtype=np.float32)
+        np.maximum.at(best, slots, scores)
+        best_id = np.full(self.n_slots, -1, dtype=np.int64)
+        top = scores == best[slots]
+        best_id[slots[top]] = ids[top]
+        return best, best_id
+
+    def window_max(self, chain, min_gap: int, max_gap: int):
+        """
+        out[s] = max chain[s - d] với d trong [min_gap, max_gap] và cùng video; arg[s] = slot đạt max (-1 nếu không có).
+        Mỗi d là một phép dịch mảng, tổng O(S * (max_gap - min_gap + 1)).
+        """
+        out = np.full(self.n_slots, -np.inf, dtype=np.float32)
+        arg = np.full(self.n_slots, -1, dtype=np.int64)
+        slots = np.arange(self.n_slots, dtype=np.int64)
+        for d in range(min_gap, min(max_gap, self.n_slots - 1) + 1):
+            prev = chain[:self.n_slots - d]
+            same = self.video_of_slot[d:] == self.video_of_slot[:self.n_slots - d]
+            cand = np.where(same, prev, -np.inf)
+            better = cand > out[d:]
+            out[d:][better] = cand[better]
+            arg[d:][better] = slots[:self.n_slots - d][better]
+        return out, arg
+
+    # ----------------- Cả chuỗi -----------------
+    def search(self, step_results, gaps, top: int = 100):
+        """
+        step_results: list (scores, ids) của từng query A, B, ... theo thứ tự thời gian.
+        gaps: list (min_gap, max_gap) giữa 2 bước liên tiếp (xem parse_gaps).
+        Trả (total (T,), ids (T, n_steps), scores (T, n_steps)) sắp giảm dần theo tổng điểm.
+        """
+        n_steps = len(step_results)
+        per_step = [self.best_per_slot(scores, ids) for scores, ids in step_results]
+        chain = per_step[0][0]
+        backs = []
+        for (best, _), (min_gap, max_gap) in zip(per_step[1:], gaps):
+            prev_max, arg = self.window_max(chain, min_gap, max_gap)
+            chain = best + prev_max
+            backs.append(arg)
+
+        ends = np.flatnonzero(np.isfinite(chain))
+        if ends.size == 0:
+            return np.empty(0, dtype=np.float32), np.empty((0, n_steps), dtype=np.int64), np.empty((0, n_steps), dtype=np.float32)
+        if ends.size > top:
+            ends = ends[np.argpartition(-chain[ends], top - 1)[:top]]
+        ends = ends[np.argsort(-chain[ends], kind='stable')]
+
+        # truy vết ngược từ shot cuối về shot đầu
+        slots = np.empty((len(ends), n_steps), dtype=np.int64)
+        slots[:, -1] = ends
+        for j in range(n_steps - 1, 0, -1):
+            slots[:, j - 1] = backs[j - 1][slots[:, j]]
+        ids = np.stack([per_step[j][1][slots[:, j]] for j in range(n_steps)], axis=1)
+        scores = np.stack([per_step[j][0][slots[:, j]] for j in range(n_steps)], axis=1)
+        return chain[ends], ids, scores
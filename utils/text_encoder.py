@@ -0,0 +1,81 @@
+import os
+import numpy as np
+import torch
+import clip
+import open_clip
+
+# Cấu hình model dùng chung cho MyFaiss và bước export
+CLIP_MODEL_NAME = "ViT-L/14@336px"
+CLIPV2_MODEL_NAME = 'ViT-L-14'
+CLIPV2_PRETRAINED = 'datacomp_xl_s13b_b90k'
+TEXT_ENCODER_BACKENDS = ('torch', 'onnx', 'torchscript')
+
+
+def load_eager_model(model_type: str, device: str = 'cpu'):
+    """Model CLIP / open_clip đầy đủ (PyTorch eager), giống lúc MyFaiss khởi tạo."""
+    if model_type == 'clip':
+        return clip.load(CLIP_MODEL_NAME, device=device)[0]
+    return open_clip.create_model_and_transforms(CLIPV2_MODEL_NAME, device=device, pretrained=CLIPV2_PRETRAINED)[0]
+
+
+def get_tokenizer(model_type: str):
+    """Hàm texts -> LongTensor (N, 77) theo đúng tokenizer của từng model."""
+    if model_type == 'clip':
+        return lambda texts: clip.tokenize(list(texts), truncate=True).long()
+    tokenizer = open_clip.get_tokenizer(CLIPV2_MODEL_NAME)
+    return lambda texts: tokenizer(list(texts)).long()
+
+
+class TextTower(torch.nn.Module):
+    """Chỉ phần text của model (encode_text + L2-normalize) để export; bỏ visual tower."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, tokens):
+        feats = self.model.encode_text(tokens)
+        return feats / feats.norm(dim=-1, keepdim=True)
+
+
+class OnnxTextEncoder:
+    """Text encoder đã export sang ONNX (fp32 hoặc int8), chạy bằng onnxruntime trên CPU."""
+
+    def __init__(self, path: str, num_threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, tokens) -> np.ndarray:
+        tokens = np.ascontiguousarray(tokens.cpu().numpy() if torch.is_tensor(tokens) else tokens, dtype=np.int64)
+        return self.session.run(None, {self.input_name: tokens})[0].astype(np.float32)
+
+
+class TorchScriptTextEncoder:
+    """Text encoder đã export sang TorchScript (có thể đã quantize dynamic int8)."""
+
+    def __init__(self, path: str, num_threads: int = 0):
+        if num_threads:
+            torch.set_num_threads(int(num_threads))
+        self.path = path
+        self.module = torch.jit.load(path, map_location='cpu').eval()
+
+    def __call__(self, tokens) -> np.ndarray:
+        tokens = tokens if torch.is_tensor(tokens) else torch.from_numpy(np.asarray(tokens, dtype=np.int64))
+        with torch.no_grad():
+            return self.module(tokens.long().cpu()).numpy().astype(np.float32)
+
+
+def load_text_encoder(path: str, num_threads: int = 0):
+    """Chọn runtime theo đuôi file: .onnx -> onnxruntime, còn lại -> TorchScript."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"[TextEncoder] Không tìm thấy {path}; chạy `python -m utils.export_text_encoder` trước.")
+    if path.endswith('.onnx'):
+        return OnnxTextEncoder(path, num_threads=num_threads)
+    return TorchScriptTextEncoder(path, num_threads=num_threads)
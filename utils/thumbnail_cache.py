@@ -0,0 +1,170 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Các kích thước (cạnh dài, px) được phép; size khác làm tròn lên mức gần nhất để giới hạn số biến thể trong cache
+THUMB_SIZES = (160, 320, 640)
+
+
+def snap_size(size: int) -> int:
+    for allowed in THUMB_SIZES:
+        if int(size) <= allowed:
+            return allowed
+    return THUMB_SIZES[-1]
+
+
+class ThumbnailCache:
+    """
+    Ảnh thu nhỏ (WebP) của keyframe, tạo khi được yêu cầu lần đầu.
+    - Đĩa: cache_dir/<ab>/<etag>.webp, tổng dung lượng <= max_bytes (bỏ file ít dùng nhất).
+    - RAM: memory_items ảnh hay dùng nhất (bytes).
+    etag = hash(đường dẫn gốc, mtime, size file gốc, kích thước, quality) -> ảnh gốc đổi thì tự ra key mới.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2 << 30, memory_items: int = 512, quality: int = 80):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self.memory_items = int(memory_items)
+        self.quality = int(quality)
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()       # tên file -> bytes, thứ tự LRU -> MRU
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._scan_disk()
+
+    def _scan_disk(self):
+        """Nạp lại cache đĩa còn từ lần chạy trước (file truy cập gần nhất xếp sau cùng)."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.webp'):
+                    continue
+                st = os.stat(os.path.join(root, name))
+                entries.append((st.st_atime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_bytes += size
+
+    def _disk_path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name[:2], name)
+
+    def etag(self, src_path: str, size: int) -> str:
+        st = os.stat(src_path)
+        raw = f"{os.path.abspath(src_path)}|{st.st_mtime_ns}|{st.st_size}|{int(size)}|{self.quality}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]
+
+    # ----------------- Tạo ảnh -----------------
+    def render(self, src_path: str, size: int) -> bytes:
+        """Đọc ảnh gốc, thu nhỏ (INTER_AREA, giữ tỉ lệ, không phóng to) rồi encode WebP."""
+        import cv2
+        img = cv2.imread(src_path, cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"[Thumbnail] Không đọc được ảnh {src_path}")
+        h, w = img.shape[:2]
+        scale = int(size) / max(h, w)
+        if scale < 1:
+            img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode('.webp', img, [cv2.IMWRITE_WEBP_QUALITY, self.quality])
+        if not ok:
+            raise ValueError(f"[Thumbnail] Encode WebP lỗi cho {src_path}")
+        return buf.tobytes()
+
+    # ----------------- Cache -----------------
+    def get(self, src_path: str, size: int):
+        """Trả (bytes WebP, etag). Cùng một ảnh chỉ render một lần dù nhiều request đến cùng lúc."""
+        tag = self.etag(src_path, size)
+        data = self._lookup(tag)
+        if data is not None:
+            return data, tag
+
+        # [lock, số luồng đang dùng]: chỉ bỏ khi không còn ai chờ, để request sau không tạo lock mới rồi render lại
+        with self._lock:
+            entry = self._key_locks.setdefault(tag, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                data = self._lookup(tag)
+                if data is None:
+                    with self._lock:
+                        self.misses += 1
+                    data = self.render(src_path, size)
+                    self._store(tag, data)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._key_locks.pop(tag, None)
+        return data, tag
+
+    def _lookup(self, tag: str):
+        name = f"{tag}.webp"
+        with self._lock:
+            data = self._memory.get(tag)
+            if data is not None:
+                self._memory.move_to_end(tag)
+                self.hits['memory'] += 1
+                return data
+            on_disk = name in self._disk
+        # worker khác (cùng cache_dir) có thể đã ghi file này
+        try:
+            with open(self._disk_path(name), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if not on_disk and name not in self._disk:
+                self._disk_bytes += len(data)
+            self._disk[name] = len(data)
+            self._disk.move_to_end(name)
+            self.hits['disk'] += 1
+            self._remember(tag, data)
+        return data
+
+    def _remember(self, tag: str, data: bytes):
+        if self.memory_items <= 0:
+            return
+        self._memory[tag] = data
+        self._memory.move_to_end(tag)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _store(self, tag: str, data: bytes):
+        name = f"{tag}.webp"
+        path = self._disk_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        evict = []
+        with self._lock:
+            self._remember(tag, data)
+            self._disk_bytes += len(data) - self._disk.get(name, 0)
+            self._disk[name] = len(data)
+            self._disk.move_to_end(name)
+            while self._disk_bytes > self.max_bytes and len(self._disk) > 1:
+                old_name, old_size = self._disk.popitem(last=False)
+                self._disk_bytes -= old_size
+                evict.append(old_name)
+        for old_name in evict:
+            try:
+                os.remove(self._disk_path(old_name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'memory_items': len(self._memory),
+                'disk_items': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': dict(self.hits),
+                'misses': self.misses,
+            }